@@ -0,0 +1,215 @@
+"""
+Two-level cache of tutor knowledge retrieval results
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from django.conf import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+_NON_WORD = re.compile(r'[^\w]+', re.UNICODE)
+
+
+def normalize_query(text: str) -> str:
+    """Lowercase, punctuation-free, single-spaced query text"""
+    return ' '.join(_NON_WORD.sub(' ', (text or '').lower()).split())
+
+
+class _Entry:
+    __slots__ = ('key', 'group', 'version', 'results', 'embedding', 'expires_at', 'slot')
+
+    def __init__(self, key, group, version, results, embedding, expires_at):
+        self.key = key
+        self.group = group
+        self.version = version
+        self.results = results
+        self.embedding = embedding
+        self.expires_at = expires_at
+        self.slot = None
+
+
+class RetrievalCache:
+    """
+    Cache in front of tutor knowledge retrieval.
+
+    Level 1 maps the normalized query text (and filters) to the results and
+    query embedding, so a repeated question costs neither an embedding call nor
+    a search. Level 2 keeps the embeddings of recent queries in a small matrix
+    and reuses the results of a previous query with the same filters whose
+    embedding is within ``similarity_threshold`` cosine similarity, which
+    catches paraphrases at the cost of the embedding call only.
+
+    Entries expire after ``ttl`` seconds, the least recently used are evicted
+    past ``max_entries``, and an entry is dropped once the index version it
+    was computed against changes.
+    """
+
+    def __init__(self, max_entries: int = None, ttl: float = None, similarity_threshold: float = None):
+        config = getattr(settings, 'VECTOR_DB_CONFIG', {})
+        self.max_entries = max_entries or config.get('QUERY_CACHE_SIZE', 2048)
+        self.ttl = ttl or config.get('QUERY_CACHE_TTL', 600)
+        self.similarity_threshold = similarity_threshold or config.get('QUERY_CACHE_SIMILARITY', 0.95)
+
+        self._entries: 'OrderedDict[Tuple[str, str], _Entry]' = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Level 2: one matrix row per cached embedding
+        self._matrix = None
+        self._slot_entries: List[Optional[_Entry]] = []
+        self._slot_groups = None
+        self._free_slots: List[int] = []
+        self._groups: Dict[str, int] = {}
+
+        self.stats = {
+            'exact_hits': 0, 'semantic_hits': 0, 'misses': 0,
+            'evictions': 0, 'expirations': 0, 'invalidations': 0,
+        }
+
+    @staticmethod
+    def _group_key(filters: Optional[Dict], scope: str) -> str:
+        return scope + repr(sorted((key, str(value).lower()) for key, value in (filters or {}).items() if value))
+
+    def get_or_search(self, query: str, filters: Optional[Dict], version: Any,
+                      embed: Callable[[], Optional[List[float]]],
+                      search: Callable[[Optional[List[float]]], List[Dict[str, Any]]],
+                      scope: str = '') -> List[Dict[str, Any]]:
+        """
+        Cached results for the query, or ``search(embed())``. ``version`` is the
+        index version the results depend on (VectorDBManager.index_version);
+        ``scope`` separates callers searching different collections.
+        """
+        group = self._group_key(filters, scope)
+        key = (normalize_query(query), group)
+
+        results = self._get_exact(key, version)
+        if results is not None:
+            return results
+
+        embedding = embed()
+        vector = self._normalize(embedding)
+        if vector is not None:
+            results = self._get_similar(vector, group, version)
+            if results is not None:
+                return results
+
+        with self._lock:
+            self.stats['misses'] += 1
+        results = search(embedding)
+        self._put(key, group, version, results, vector)
+        return results
+
+    def _get_exact(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not self._is_fresh(entry, version):
+                return None
+            self._entries.move_to_end(key)
+            self.stats['exact_hits'] += 1
+            return entry.results
+
+    def _get_similar(self, vector: np.ndarray, group: str, version):
+        with self._lock:
+            group_id = self._groups.get(group)
+            if self._matrix is None or group_id is None or len(vector) != self._matrix.shape[1]:
+                return None
+
+            similarities = self._matrix @ vector
+            similarities[self._slot_groups != group_id] = -1.0
+            for slot in np.argsort(-similarities)[:8]:
+                if similarities[slot] < self.similarity_threshold:
+                    break
+                entry = self._slot_entries[slot]
+                if entry is not None and self._is_fresh(entry, version):
+                    self._entries.move_to_end(entry.key)
+                    self.stats['semantic_hits'] += 1
+                    return entry.results
+            return None
+
+    def _is_fresh(self, entry: _Entry, version) -> bool:
+        """Whether an entry may be served; stale ones are dropped (caller holds the lock)"""
+        if entry.version != version:
+            self.stats['invalidations'] += 1
+        elif entry.expires_at <= time.monotonic():
+            self.stats['expirations'] += 1
+        else:
+            return True
+        self._remove(entry)
+        return False
+
+    def _put(self, key, group, version, results, vector: Optional[np.ndarray]):
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous is not None:
+                self._remove(previous)
+
+            entry = _Entry(key, group, version, results, vector, time.monotonic() + self.ttl)
+            self._entries[key] = entry
+            if vector is not None:
+                self._assign_slot(entry)
+
+            while len(self._entries) > self.max_entries:
+                _, oldest = self._entries.popitem(last=False)
+                self._remove(oldest)
+                self.stats['evictions'] += 1
+
+    def _assign_slot(self, entry: _Entry):
+        if self._matrix is None or len(entry.embedding) != self._matrix.shape[1]:
+            # First embedding (or a different embedding model): start a fresh matrix
+            self._matrix = np.zeros((self.max_entries, len(entry.embedding)), dtype='float32')
+            self._slot_groups = np.full(self.max_entries, -1, dtype='int32')
+            self._slot_entries = [None] * self.max_entries
+            self._free_slots = list(range(self.max_entries - 1, -1, -1))
+            for other in self._entries.values():
+                other.slot = None
+
+        if not self._free_slots:
+            return
+        slot = self._free_slots.pop()
+        self._matrix[slot] = entry.embedding
+        self._slot_groups[slot] = self._groups.setdefault(entry.group, len(self._groups))
+        self._slot_entries[slot] = entry
+        entry.slot = slot
+
+    def _remove(self, entry: _Entry):
+        """Drop an entry from both levels (caller holds the lock)"""
+        if self._entries.get(entry.key) is entry:
+            del self._entries[entry.key]
+        if entry.slot is not None:
+            self._slot_groups[entry.slot] = -1
+            self._slot_entries[entry.slot] = None
+            self._free_slots.append(entry.slot)
+            entry.slot = None
+
+    @staticmethod
+    def _normalize(embedding) -> Optional[np.ndarray]:
+        if embedding is None:
+            return None
+        vector = np.asarray(embedding, dtype='float32').ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self._slot_entries = []
+            self._slot_groups = None
+            self._free_slots = []
+            self._groups = {}
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['exact_hits'] + stats['semantic_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['exact_hits'] + stats['semantic_hits']) / lookups if lookups else 0.0
+        return stats
+
+
+retrieval_cache = RetrievalCache()
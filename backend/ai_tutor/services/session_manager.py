@@ -153,6 +153,11 @@ class TutorSessionManager:
                 # Remove from active sessions
                 session_data = self.active_sessions.pop(session_id)
                 
+                # Release the engine's reference to the shared vector index
+                tutor_engine = session_data.get('tutor_engine')
+                if tutor_engine is not None:
+                    tutor_engine.vector_db.close()
+                
                 # Remove from cache
                 cache_key = f"tutor_session_{session_data['user_id']}"
                 cache.delete(cache_key)
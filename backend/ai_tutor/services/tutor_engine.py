@@ -10,8 +10,6 @@ from django.conf import settings
 from django.utils import timezone
 from django.db import transaction
 
-import openai
-
 # Try different import paths for LangChain compatibility
 try:
     # Newer versions of LangChain
@@ -52,7 +50,11 @@ except ImportError:
         ChatPromptTemplate = MessagesPlaceholder = type('obj', (object,), {})
 
 from courses.vector_db.manager import VectorDBManager
+from courses.vector_db.query_embedding import embed_query
+from courses.processors.tokenization import get_token_counter
+from ai_tutor.services.retrieval_cache import retrieval_cache
 from courses.models import AIKnowledgeChunk
+from users.models import School
 from ai_tutor.models import TutorPersonality, TeachingStrategy, TutorInteractionLog, KnowledgeRetrievalLog
 
 class UpperclassTutorEngine:
@@ -61,7 +63,8 @@ class UpperclassTutorEngine:
     def __init__(self, session_id: str = None, user_id: str = None):
         self.session_id = session_id
         self.user_id = user_id
-        self.vector_db = VectorDBManager()
+        # Searches the shared knowledge plus the user's school collection, if any
+        self.vector_db = VectorDBManager(school=School.with_custom_content_for(user_id))
         
         # Initialize LLMs with different temperature settings
         self.explanation_llm = ChatOpenAI(
@@ -86,6 +89,7 @@ class UpperclassTutorEngine:
         # Initialize state
         self.conversation_history = []
         self.current_concept = None
+        self.subject = None
         self.user_understanding = {}
         self.teaching_strategy = None
         self.personality = None
@@ -94,6 +98,8 @@ class UpperclassTutorEngine:
                      proficiency: str = 'beginner') -> Dict[str, Any]:
         """Start a new tutoring session"""
         
+        self.subject = subject
+        
         # Select appropriate personality and strategy
         self.personality = self._select_personality(proficiency, subject)
         self.teaching_strategy = self._select_teaching_strategy(proficiency, subject)
@@ -248,6 +254,11 @@ class UpperclassTutorEngine:
         
         # Prepare filters based on context
         filters = {}
+        if self.subject and self.vector_db.has_value('subject', self.subject):
+            # Also routes the search to the subject's shard when the index is sharded.
+            # Session subjects are free text ('general' by default), so ones no chunk
+            # is stored under search everything instead of matching nothing.
+            filters['subject'] = self.subject
         if self.current_concept:
             filters['topic'] = self.current_concept
         
@@ -255,14 +266,21 @@ class UpperclassTutorEngine:
         if hasattr(self, 'user_proficiency'):
             filters['difficulty_level'] = self.user_proficiency
         
-        # Generate embedding for query
-        query_embedding = self._generate_query_embedding(query, context)
-        
-        # Search vector database
-        results = self.vector_db.search_similar(
-            query_embedding=query_embedding,
+        # Search vector database and keyword index together, so exact terms
+        # (formula names, definitions) are found as well as related concepts.
+        # Repeated and near-identical questions are answered from the cache.
+        results = retrieval_cache.get_or_search(
+            query=f"{query} {context}",
             filters=filters,
-            limit=15
+            version=self.vector_db.index_version(filters),
+            embed=lambda: self._generate_query_embedding(query, context),
+            search=lambda query_embedding: self.vector_db.hybrid_search(
+                query=query,
+                query_embedding=query_embedding,
+                filters=filters,
+                limit=15
+            ),
+            scope=self.vector_db.school_index_path or ''
         )
         
         retrieval_time = time.time() - start_time
@@ -380,17 +398,25 @@ class UpperclassTutorEngine:
         
         context_parts = []
         
+        # Top chunks in order, until the prompt's token budget is spent
+        tokens = get_token_counter()
+        budget = settings.VECTOR_DB_CONFIG.get('PROMPT_CONTEXT_TOKENS', 1200)
+        
         for i, chunk in enumerate(knowledge_chunks[:5]):  # Use top 5 chunks
             metadata = chunk['metadata']
-            content = chunk['content'][:500]  # First 500 chars
-            
-            context_parts.append(
+            header = (
                 f"Knowledge Source {i+1}:\n"
                 f"Title: {metadata.get('title', 'Untitled')}\n"
                 f"Type: {metadata.get('content_type', 'concept')}\n"
                 f"Difficulty: {metadata.get('difficulty_level', 'intermediate')}\n"
-                f"Content: {content}\n"
+                f"Content: "
             )
+            content = tokens.truncate(chunk['content'], budget - tokens.count(header))
+            if not content:
+                break
+            
+            context_parts.append(f"{header}{content}\n")
+            budget -= tokens.count(context_parts[-1])
         
         return "\n".join(context_parts)
     
@@ -446,19 +472,14 @@ class UpperclassTutorEngine:
             'user': user_prompt
         }
     
-    def _generate_query_embedding(self, query: str, context: str = '') -> List[float]:
+    def _generate_query_embedding(self, query: str, context: str = '') -> Optional[List[float]]:
         """Generate embedding for a query"""
         
         # Combine query and context
         full_query = f"{query} {context}".strip()
         
-        # Use OpenAI embeddings
-        response = openai.Embedding.create(
-            model="text-embedding-ada-002",
-            input=full_query
-        )
-        
-        return response['data'][0]['embedding']
+        # Embed with the model of the index being searched
+        return embed_query(full_query, model=self.vector_db.embedding_model)
     
     def _select_personality(self, proficiency: str, subject: str) -> Optional[TutorPersonality]:
         """Select appropriate personality based on user and subject"""
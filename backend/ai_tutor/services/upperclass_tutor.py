@@ -18,7 +18,6 @@ class UpperclassAITutor:
         self.user_level = user_level
         self.user_id = user_id
         self.knowledge_trainer = AIModelTrainer()
-        self.knowledge_trainer.load_knowledge_base()
         
         # Initialize conversation memory
         self.memory = ConversationSummaryBufferMemory(
@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_init
 from django.conf import settings
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
@@ -23,8 +24,19 @@ app.conf.beat_schedule = {
         'task': 'courses.tasks.cleanup_old_import_jobs',
         'schedule': 43200.0,  # 12 hours
     },
+    'remove-retired-index-generations': {
+        'task': 'courses.tasks.remove_retired_index_generations',
+        'schedule': 43200.0,  # 12 hours
+    },
 }
 
+@worker_process_init.connect
+def warm_local_embedding_model(**kwargs):
+    # Load the local embedding model before the first import task needs it
+    if settings.VECTOR_DB_CONFIG.get('LOCAL_EMBEDDING_PRELOAD'):
+        from courses.processors.local_embedding import get_local_embedding_service
+        get_local_embedding_service().warm_up()
+
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
\ No newline at end of file
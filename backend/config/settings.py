@@ -240,6 +240,80 @@ COURSE_IMPORT_CONFIG = {
     'VECTOR_DB_PATH': os.path.join(BASE_DIR, 'chroma_db'),
 }
 
+# Vector index (courses/vector_db/faiss_manager.py)
+VECTOR_DB_CONFIG = {
+    'INDEX_TYPE': os.getenv('VECTOR_INDEX_TYPE', 'flat'),  # flat, hnsw, ivf_flat, ivf_pq
+    'NLIST': None,  # IVF lists; derived from the training set size when None
+    'NPROBE': int(os.getenv('VECTOR_INDEX_NPROBE', 16)),
+    'PQ_M': 64,  # IVF-PQ sub-quantizers
+    'HNSW_M': 32,
+    'EF_CONSTRUCTION': 200,
+    'EF_SEARCH': int(os.getenv('VECTOR_INDEX_EF_SEARCH', 128)),
+    'MIN_TRAIN_SIZE': 10000,  # vectors needed before an IVF index is trained
+    'EXACT_SEARCH_THRESHOLD': 2048,  # filtered searches with fewer candidates are scanned exactly
+    'RESIDUAL_FILTER_OVERSAMPLE': 10,  # over-fetch factor for filters without a posting list
+    'TOMBSTONE_COMPACTION_RATIO': 0.2,  # compact once this fraction of stored vectors is deleted
+    'REFRESH_INTERVAL': 1.0,  # seconds between checks for writes by other processes
+    'IDLE_UNLOAD_SECONDS': 900,  # unload shared indexes nobody has referenced for this long
+    'MAX_LOADED_INDEXES': 32,  # unload least recently used indexes beyond this many
+    'MAX_LOADED_VECTORS': None,  # ...or once the loaded indexes hold more vectors than this
+    'SHARD_BY': os.getenv('VECTOR_SHARD_BY', ''),  # '', 'subject' or 'source_id': one index per value
+    'SHARD_SEARCH_WORKERS': 8,  # threads searching shards in parallel
+    'QUERY_CACHE_SIZE': 2048,  # tutor retrieval results cached per process
+    'QUERY_CACHE_TTL': 600,  # seconds a cached retrieval result is served
+    'QUERY_CACHE_SIMILARITY': 0.95,  # cosine similarity for reusing a similar query's results
+    'HYBRID_CANDIDATES': 50,  # hits taken from each of BM25 and FAISS before rank fusion
+    'RRF_K': 60,  # reciprocal rank fusion constant
+    'BM25_WEIGHTS': (3.0, 2.0, 1.0),  # keyword index column weights: title, subtopics, content
+    'EMBEDDING_MODEL': os.getenv('EMBEDDING_MODEL', 'text-embedding-ada-002'),  # live model until a re-embedding switches it
+    'RETIRED_GENERATION_GRACE': 300,  # seconds an index generation is kept after a switch replaces it
+    'EMBEDDING_MODELS': {  # model name -> vector dimension and provider (openai or local)
+        'text-embedding-ada-002': {'dimension': 1536, 'provider': 'openai'},
+        'text-embedding-3-small': {'dimension': 1536, 'provider': 'openai'},
+        'all-MiniLM-L6-v2': {'dimension': 384, 'provider': 'local'},
+    },
+    'EMBEDDING_CACHE_BACKEND': os.getenv('EMBEDDING_CACHE_BACKEND', 'redis'),  # redis (shared) or sqlite (data/embedding_cache.sqlite3)
+    'EMBEDDING_CACHE_URL': os.getenv('EMBEDDING_CACHE_URL'),  # defaults to REDIS_URL
+    'EMBEDDING_CACHE_TTL': None,  # seconds before a Redis entry expires; None keeps entries
+    'EMBEDDING_CACHE_DTYPE': 'float16',  # storage dtype of cached embeddings
+    'EMBEDDING_BATCH_TOKENS': 100000,  # tokens per embedding request
+    'EMBEDDING_MAX_INPUT_TOKENS': 8191,  # longer embedding inputs are truncated
+    'EMBEDDING_BATCH_SIZE': 512,  # texts per embedding request
+    'EMBEDDING_CONCURRENCY': 4,  # embedding requests in flight per import
+    'EMBEDDING_MAX_RETRIES': 5,  # retries per batch on rate limits and transient errors
+    'CHUNK_TOKENS': 200,  # knowledge chunk size, in tokens of the embedding model
+    'CHUNK_OVERLAP_TOKENS': 25,  # tokens repeated between consecutive chunks
+    'PROMPT_MODEL': 'gpt-3.5-turbo',  # tokenizer for prompt budgets
+    'PROMPT_CONTEXT_TOKENS': 1200,  # retrieved knowledge included in a tutor prompt
+    'ENRICHMENT_CONTENT_TOKENS': 250,  # chunk content included in an enrichment prompt
+    'ENRICHMENT_MODEL': 'gpt-3.5-turbo',  # chat model that enriches chunks with teaching metadata
+    'ENRICHMENT_BATCH_SIZE': 8,  # chunks analyzed per enrichment prompt
+    'ENRICHMENT_CONCURRENCY': 8,  # enrichment prompts in flight per import
+    'ENRICHMENT_MAX_RETRIES': 4,  # retries per prompt on rate limits and transient errors
+    'ENRICHMENT_RESPONSE_TOKENS': 200,  # response tokens allowed per chunk in a prompt
+    'ENRICHMENT_CACHE_TTL': None,  # seconds before a cached LLM enrichment expires in Redis; None keeps entries
+    'DEDUP_NUM_PERM': 128,  # MinHash permutations per chunk signature
+    'DEDUP_BANDS': 16,  # LSH bands (DEDUP_NUM_PERM / DEDUP_BANDS rows each)
+    'DEDUP_SHINGLE_SIZE': 5,  # words per MinHash shingle
+    'DEDUP_JACCARD': 0.8,  # estimated Jaccard similarity making a chunk a text near-duplicate
+    'DEDUP_SIMILARITY': 0.97,  # embedding cosine similarity making a chunk a semantic duplicate
+    'DEDUP_NEIGHBOURS': 3,  # stored chunks compared per imported chunk embedding
+    'LOCAL_EMBEDDING_MODEL': 'all-MiniLM-L6-v2',  # sentence-transformers model used without an OpenAI key
+    'LOCAL_EMBEDDING_BACKEND': os.getenv('LOCAL_EMBEDDING_BACKEND', 'torch'),  # torch or onnx (ONNX Runtime)
+    'LOCAL_EMBEDDING_ONNX_FILE': 'onnx/model_quint8_avx2.onnx',  # int8 export loaded by the onnx backend
+    'LOCAL_EMBEDDING_BATCH_SIZE': 64,  # texts per local forward pass
+    'LOCAL_EMBEDDING_MAX_WAIT': 0.005,  # seconds a micro-batch waits for more requests
+    'LOCAL_EMBEDDING_TIMEOUT': 60,  # seconds a caller waits for its embeddings (None waits forever)
+    'LOCAL_EMBEDDING_PRELOAD': False,  # load the local model when a Celery worker process starts
+    # Vectors a school's private collection may hold, by subscription tier
+    # (schools without enable_custom_courses get none)
+    'SCHOOL_VECTOR_QUOTAS': {'free': 5000, 'basic': 50000, 'pro': 250000, 'enterprise': 1000000},
+    'CONTENT_CACHE_SIZE': 10000,  # chunk contents cached per process for search hits
+    'CONTENT_CACHE_TTL': 300,  # seconds before a cached chunk content is re-read
+    'INDEX_STORAGE': os.getenv('VECTOR_INDEX_STORAGE', 'float32'),  # float32, float16, int8
+    'EMBEDDING_STORAGE_DTYPE': 'float16',  # AIKnowledgeChunk.embedding encoding: float32, float16, int8
+}
+
 # YouTube API Key (if available)
 YOUTUBE_API_KEY = os.getenv('YOUTUBE_API_KEY', '')
 
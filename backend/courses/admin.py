@@ -8,7 +8,7 @@ from django.utils import timezone
 import json
 
 from .models import (
-    CourseCategory, CourseSource, CourseImportJob, Course, 
+    CourseCategory, CourseSource, CourseImportJob, ContentFingerprint, Course, 
     Module, Lesson, AIKnowledgeChunk, AIKnowledgeGraph, UserCourseProgress
 )
 
@@ -29,17 +29,25 @@ class CourseCategoryAdmin(admin.ModelAdmin):
     color_display.short_description = 'Color'
 
 # =============== CourseSource Admin ===============
+class ContentFingerprintInline(admin.TabularInline):
+    model = ContentFingerprint
+    extra = 0
+    can_delete = False
+    fields = ('unit_title', 'unit_key', 'fingerprint', 'chunk_count', 'removed_at', 'updated_at')
+    readonly_fields = fields
+    ordering = ('removed_at', 'unit_title')
+
 @admin.register(CourseSource)
 class CourseSourceAdmin(admin.ModelAdmin):
-    list_display = ('name', 'source_type', 'is_active', 'last_sync', 'last_sync_status')
-    list_filter = ('source_type', 'is_active', 'last_sync_status')
+    list_display = ('name', 'source_type', 'school', 'is_active', 'last_sync', 'last_sync_status')
+    list_filter = ('source_type', 'is_active', 'last_sync_status', 'school')
     search_fields = ('name', 'base_url')
     list_editable = ('is_active',)
     readonly_fields = ('last_sync', 'last_sync_status', 'last_sync_error', 'created_at', 'updated_at')
     
     fieldsets = (
         ('Basic Information', {
-            'fields': ('name', 'source_type', 'base_url')
+            'fields': ('name', 'source_type', 'base_url', 'school')
         }),
         ('API Configuration', {
             'fields': ('api_key', 'api_secret'),
@@ -58,6 +66,7 @@ class CourseSourceAdmin(admin.ModelAdmin):
         }),
     )
     
+    inlines = [ContentFingerprintInline]
     actions = ['sync_selected_sources', 'activate_sources', 'deactivate_sources']
     
     def sync_selected_sources(self, request, queryset):
@@ -82,12 +91,16 @@ class CourseSourceAdmin(admin.ModelAdmin):
 # =============== CourseImportJob Admin ===============
 @admin.register(CourseImportJob)
 class CourseImportJobAdmin(admin.ModelAdmin):
-    list_display = ('job_id', 'source', 'status', 'total_chunks_extracted', 
+    list_display = ('job_id', 'source', 'status', 'stage', 'total_chunks_extracted', 
                    'processing_time_display', 'created_at', 'completed_at')
     list_filter = ('status', 'source', 'created_at')
     search_fields = ('job_id', 'source_url', 'error_message')
     readonly_fields = ('job_id', 'status', 'total_chunks_extracted', 'chunks_with_embeddings',
-                      'failed_extractions', 'error_chunks', 'started_at', 'completed_at',
+                      'embedding_cache_hits', 'embedding_cache_misses', 'enrichment_cache_hits',
+                      'enrichment_cache_misses', 'near_duplicates_skipped', 'semantic_duplicates_skipped',
+                      'units_unchanged', 'units_changed', 'units_removed',
+                      'failed_extractions', 'error_chunks', 'stage', 'artifacts', 'stage_times',
+                      'started_at', 'completed_at',
                       'processing_time', 'embedding_time', 'ai_analysis_time',
                       'error_message', 'error_traceback', 'created_at', 'updated_at')
     
@@ -100,7 +113,14 @@ class CourseImportJobAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
         ('Results', {
-            'fields': ('total_chunks_extracted', 'chunks_with_embeddings', 'failed_extractions', 'error_chunks')
+            'fields': ('total_chunks_extracted', 'chunks_with_embeddings', 'embedding_cache_hits',
+                      'embedding_cache_misses', 'enrichment_cache_hits', 'enrichment_cache_misses',
+                      'near_duplicates_skipped', 'semantic_duplicates_skipped', 'units_unchanged',
+                      'units_changed', 'units_removed', 'failed_extractions', 'error_chunks')
+        }),
+        ('Checkpoints', {
+            'fields': ('stage', 'stage_times', 'artifacts'),
+            'classes': ('collapse',)
         }),
         ('Timing', {
             'fields': ('started_at', 'completed_at', 'processing_time', 'embedding_time', 'ai_analysis_time'),
@@ -333,7 +353,8 @@ class AIKnowledgeChunkAdmin(admin.ModelAdmin):
     list_filter = ('content_type', 'difficulty_level', 'subject', 'source', 'ai_analyzed')
     search_fields = ('title', 'content', 'topic', 'subject', 'subtopics')
     readonly_fields = ('times_used', 'success_rate', 'user_ratings', 'user_feedback',
-                      'last_used', 'created_at', 'updated_at', 'embedding_generated_at')
+                      'last_used', 'created_at', 'updated_at', 'embedding_generated_at', 'token_count',
+                      'content_unit')
     
     fieldsets = (
         ('Content', {
@@ -351,11 +372,12 @@ class AIKnowledgeChunkAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
         ('Source Information', {
-            'fields': ('source', 'source_url', 'source_metadata'),
+            'fields': ('source', 'source_url', 'source_metadata', 'content_unit'),
             'classes': ('collapse',)
         }),
         ('AI Embeddings', {
-            'fields': ('embedding_model', 'embedding_dimensions', 'embedding_generated_at'),
+            'fields': ('embedding_model', 'embedding_dimensions', 'embedding_dtype', 'token_count',
+                      'embedding_generated_at'),
             'classes': ('collapse',)
         }),
         ('Quality Metrics', {
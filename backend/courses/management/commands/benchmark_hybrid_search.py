@@ -0,0 +1,46 @@
+import os
+import tempfile
+from django.core.management.base import BaseCommand
+
+from courses.vector_db.keyword_index import KeywordIndex
+from courses.vector_db.benchmarks import (
+    synthetic_corpus, term_queries, build_benchmark_db, benchmark_retrievers, format_table
+)
+
+class Command(BaseCommand):
+    help = 'Compare BM25, vector and hybrid (RRF) retrieval: hit rate@k, MRR and latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=20000,
+                          help='Number of synthetic chunks to index')
+        parser.add_argument('--dimension', type=int, default=1536,
+                          help='Embedding dimension')
+        parser.add_argument('--queries', type=int, default=200, help='Number of queries')
+        parser.add_argument('-k', type=int, default=10, help='Results per query')
+        parser.add_argument('--depth', type=int, default=50,
+                          help='Hits taken from each retriever before fusion')
+        parser.add_argument('--noise', type=float, default=0.2,
+                          help='Query embedding noise; higher means vector search alone finds the chunk less often')
+        parser.add_argument('--term-fraction', type=float, default=0.5,
+                          help='Fraction of queries naming the chunk\'s rare term')
+
+    def handle(self, *args, **options):
+        k = options['k']
+        documents, embeddings, _ = synthetic_corpus(options['documents'], options['dimension'])
+        texts, queries, targets = term_queries(
+            documents, embeddings, options['queries'],
+            noise=options['noise'], term_fraction=options['term_fraction']
+        )
+
+        self.stdout.write(f"Benchmarking {len(documents)} chunks x {embeddings.shape[1]}d, "
+                          f"{len(texts)} queries, k={k}")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db = build_benchmark_db(tmp_dir, embeddings, 'flat')
+            keyword_index = KeywordIndex(path=os.path.join(tmp_dir, 'bm25.sqlite3'))
+            keyword_index.add_chunks(documents)
+
+            rows = benchmark_retrievers(db, keyword_index, texts, queries, targets, k, depth=options['depth'])
+
+        columns = ['retriever', 'hit_rate_at_k', 'mrr', 'p50_ms', 'p99_ms']
+        self.stdout.write(format_table(rows, columns))
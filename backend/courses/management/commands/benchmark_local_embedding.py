@@ -0,0 +1,49 @@
+import time
+from django.core.management.base import BaseCommand
+
+from courses.processors.local_embedding import LocalEmbeddingService, LOCAL_EMBEDDING_BACKENDS
+from courses.vector_db.benchmarks import synthetic_sentences, benchmark_local_embedding, format_table
+
+class Command(BaseCommand):
+    help = 'Compare local embedding throughput (texts/sec): per-text encoding vs the micro-batching service'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default='all-MiniLM-L6-v2', help='sentence-transformers model')
+        parser.add_argument('--texts', type=int, default=2000, help='Number of texts to embed')
+        parser.add_argument('--callers', type=int, default=16,
+                          help='Concurrent callers sending one text each to the service')
+        parser.add_argument('--backends', default='torch',
+                          help=f'Comma-separated service backends ({", ".join(LOCAL_EMBEDDING_BACKENDS)})')
+        parser.add_argument('--onnx-file', default=None,
+                          help='ONNX export to load, e.g. onnx/model_quint8_avx2.onnx (default: setting)')
+
+    def handle(self, *args, **options):
+        from sentence_transformers import SentenceTransformer
+
+        texts = synthetic_sentences(options['texts'])
+        self.stdout.write(f"Embedding {len(texts)} texts with {options['model']}")
+
+        rows = []
+
+        # The path import tasks used before: a model per generator, one text per call
+        start = time.perf_counter()
+        model = SentenceTransformer(options['model'])
+        load_s = time.perf_counter() - start
+        row = {'path': 'per-text (previous)', 'callers': 1, 'load_s': load_s}
+        row.update(benchmark_local_embedding(model.encode, texts))
+        rows.append(row)
+        del model
+
+        for backend in options['backends'].split(','):
+            service = LocalEmbeddingService(options['model'], backend=backend.strip(), onnx_file=options['onnx_file'])
+            start = time.perf_counter()
+            service.warm_up()
+            load_s = time.perf_counter() - start
+
+            row = {'path': f"service/{service.backend}", 'callers': options['callers'], 'load_s': load_s}
+            row.update(benchmark_local_embedding(service.encode, texts, callers=options['callers']))
+            row['avg_batch'] = service.stats['texts'] / float(max(service.stats['batches'], 1))
+            rows.append(row)
+
+        columns = ['path', 'callers', 'load_s', 'texts_per_sec', 'p50_ms', 'p99_ms', 'avg_batch']
+        self.stdout.write(format_table(rows, columns))
@@ -0,0 +1,46 @@
+import tempfile
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.vector_db.faiss_manager import INDEX_TYPES
+from courses.vector_db.benchmarks import (
+    synthetic_embeddings, perturbed_queries, build_benchmark_db, benchmark_batch_search, format_table
+)
+
+class Command(BaseCommand):
+    help = 'Compare search throughput of one search() call per query against search_batch()'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vectors', type=int, default=50000,
+                          help='Number of synthetic vectors to index')
+        parser.add_argument('--dimension', type=int, default=1536,
+                          help='Embedding dimension for synthetic vectors')
+        parser.add_argument('--queries', type=int, default=1000, help='Number of queries')
+        parser.add_argument('-k', type=int, default=10, help='Neighbors per query')
+        parser.add_argument('--index-type', type=str, default='flat', help='Index type to benchmark')
+        parser.add_argument('--batch-sizes', type=str, default='16,64,256',
+                          help='Comma-separated search_batch sizes')
+
+    def handle(self, *args, **options):
+        index_type = options['index_type']
+        if index_type not in INDEX_TYPES:
+            raise CommandError(f"Unknown index type: {index_type}")
+
+        k = options['k']
+        vectors = synthetic_embeddings(options['vectors'], options['dimension'])
+        queries = perturbed_queries(vectors, options['queries'])
+        subjects = ['math', 'science', 'history', 'language', 'art']
+        metadatas = [{'subject': subjects[i % len(subjects)]} for i in range(len(vectors))]
+
+        self.stdout.write(f"Benchmarking {len(vectors)} vectors x {vectors.shape[1]}d ({index_type}), "
+                          f"{len(queries)} queries, k={k}")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db = build_benchmark_db(tmp_dir, vectors, index_type, metadatas=metadatas)
+
+            rows = []
+            for batch_size in options['batch_sizes'].split(','):
+                for filters in (None, {'subject': 'math'}):
+                    rows.append(benchmark_batch_search(db, queries, k, int(batch_size), filters))
+
+        columns = ['batch_size', 'filters', 'loop_qps', 'batch_qps', 'speedup', 'agreement']
+        self.stdout.write(format_table(rows, columns))
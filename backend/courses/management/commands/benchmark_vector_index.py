@@ -0,0 +1,93 @@
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.models import AIKnowledgeChunk
+from courses.vector_db.embedding_codec import STORAGE_DTYPES, decode_chunk_embedding
+from courses.vector_db.faiss_manager import INDEX_TYPES, INDEX_STORAGES
+from courses.vector_db.benchmarks import (
+    synthetic_embeddings, perturbed_queries, exact_neighbors, benchmark_index,
+    benchmark_embedding_codec, format_table
+)
+
+class Command(BaseCommand):
+    help = 'Compare FAISS index types: recall@k against the flat index and p50/p99 search latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vectors', type=int, default=50000,
+                          help='Number of synthetic vectors to index')
+        parser.add_argument('--dimension', type=int, default=1536,
+                          help='Embedding dimension for synthetic vectors')
+        parser.add_argument('--queries', type=int, default=200, help='Number of queries')
+        parser.add_argument('-k', type=int, default=10, help='Neighbors per query')
+        parser.add_argument('--index-types', type=str, default=','.join(INDEX_TYPES),
+                          help='Comma-separated index types to compare')
+        parser.add_argument('--nprobe', type=str, default='8,16,32',
+                          help='Comma-separated nprobe values for IVF indexes')
+        parser.add_argument('--ef-search', type=str, default='64,128,256',
+                          help='Comma-separated efSearch values for HNSW')
+        parser.add_argument('--storage', type=str, default='float32',
+                          help='Comma-separated in-index vector storages (float32, float16, int8)')
+        parser.add_argument('--from-db', action='store_true',
+                          help='Use stored AIKnowledgeChunk embeddings instead of synthetic vectors')
+
+    def handle(self, *args, **options):
+        k = options['k']
+
+        if options['from_db']:
+            vectors = self._load_db_embeddings(options['vectors'])
+        else:
+            vectors = synthetic_embeddings(options['vectors'], options['dimension'])
+
+        queries = perturbed_queries(vectors, options['queries'])
+        truth = exact_neighbors(vectors, queries, k)
+
+        self.stdout.write(f"Benchmarking {len(vectors)} vectors x {vectors.shape[1]}d, "
+                          f"{len(queries)} queries, k={k}")
+
+        storages = [storage.strip() for storage in options['storage'].split(',')]
+        for storage in storages:
+            if storage not in INDEX_STORAGES:
+                raise CommandError(f"Unknown storage: {storage}")
+
+        rows = []
+        for index_type in options['index_types'].split(','):
+            index_type = index_type.strip()
+            if index_type not in INDEX_TYPES:
+                raise CommandError(f"Unknown index type: {index_type}")
+
+            if index_type in ('ivf_flat', 'ivf_pq'):
+                sweeps = [{'nprobe': int(v)} for v in options['nprobe'].split(',')]
+            elif index_type == 'hnsw':
+                sweeps = [{'ef_search': int(v)} for v in options['ef_search'].split(',')]
+            else:
+                sweeps = [{}]
+
+            for storage in storages:
+                if index_type == 'ivf_pq' and storage != storages[0]:
+                    # PQ codes ignore the storage setting
+                    continue
+                for params in sweeps:
+                    self.stdout.write(f"  {index_type} {storage} {params or ''}")
+                    rows.append(benchmark_index(vectors, queries, truth, k, index_type,
+                                                storage=storage, **params))
+
+        columns = ['index_type', 'storage', 'nprobe', 'ef_search', 'recall_at_k',
+                   'p50_ms', 'p99_ms', 'build_seconds', 'bytes_per_vector', 'actual_index']
+        self.stdout.write(format_table(rows, columns))
+
+        # Encodings for AIKnowledgeChunk.embedding, scored exactly after decoding
+        codec_rows = [benchmark_embedding_codec(vectors, queries, truth, k, dtype) for dtype in STORAGE_DTYPES]
+        self.stdout.write(format_table(codec_rows, ['dtype', 'bytes_per_vector', 'recall_at_k']))
+
+    def _load_db_embeddings(self, limit: int) -> np.ndarray:
+        chunks = AIKnowledgeChunk.objects.exclude(embedding=None).only(
+            'embedding', 'embedding_dtype', 'embedding_dimensions'
+        )[:limit]
+
+        vectors = [decode_chunk_embedding(chunk) for chunk in chunks]
+        if not vectors:
+            raise CommandError("No stored embeddings found")
+
+        vectors = np.array(vectors).astype('float32')
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors
@@ -11,11 +11,14 @@ class Command(BaseCommand):
                           help='Source type (khan_academy, youtube, etc.)')
         parser.add_argument('--async', action='store_true', 
                           help='Run import asynchronously using Celery')
+        parser.add_argument('--school', type=int, default=None,
+                          help="School ID; imports into the school's private collection")
     
     def handle(self, *args, **options):
         url = options['url']
         source_type = options['type']
         async_mode = options['async']
+        school_id = options['school']
         
         self.stdout.write(f"Starting import from: {url}")
         self.stdout.write(f"Source type: {source_type}")
@@ -23,7 +26,7 @@ class Command(BaseCommand):
         
         if async_mode:
             # Start async task
-            task = import_course_from_url.delay(url, source_type)
+            task = import_course_from_url.delay(url, source_type, school_id=school_id)
             self.stdout.write(
                 self.style.SUCCESS(f"Import task queued. Task ID: {task.id}")
             )
@@ -32,7 +35,7 @@ class Command(BaseCommand):
             # Run synchronously (for debugging)
             self.stdout.write("Running import synchronously...")
             try:
-                result = import_course_from_url.apply(args=[url, source_type])
+                result = import_course_from_url.apply(args=[url, source_type], kwargs={'school_id': school_id})
                 self.stdout.write(
                     self.style.SUCCESS(f"Import completed: {result.get()}")
                 )
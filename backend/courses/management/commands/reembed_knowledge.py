@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.tasks import reembed_knowledge_base, rebuild_vector_db_index
+from courses.vector_db.embedding_models import embedding_models, DEFAULT_COLLECTION
+
+class Command(BaseCommand):
+    help = 'Build a new vector index generation (re-embedding with another model) and switch over when complete'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--model', type=str, default=None,
+                          help='Embedding model to re-embed with (default: rebuild with the live model)')
+        parser.add_argument('--async', action='store_true',
+                          help='Run asynchronously using Celery')
+    
+    def handle(self, *args, **options):
+        model = options['model']
+        if model and model not in embedding_models:
+            raise CommandError(f"Unknown embedding model '{model}', expected one of {list(embedding_models.models)}")
+        
+        live_model, live_generation = embedding_models.live(DEFAULT_COLLECTION)
+        self.stdout.write(f"Live index: {live_model} generation {live_generation}")
+        
+        task = reembed_knowledge_base if model else rebuild_vector_db_index
+        args = [model] if model else []
+        if options['async']:
+            result = task.delay(*args)
+            self.stdout.write(self.style.SUCCESS(f"Task queued. Task ID: {result.id}"))
+        else:
+            result = task.apply(args=args).get()
+            self.stdout.write(self.style.SUCCESS(f"Completed: {result}"))
@@ -76,6 +76,9 @@ class CourseSource(models.Model):
     requests_per_minute = models.IntegerField(default=60)
     daily_request_limit = models.IntegerField(default=1000)
     
+    # School association (private content goes to the school's vector collection)
+    school = models.ForeignKey(School, on_delete=models.CASCADE, null=True, blank=True, related_name='course_sources')
+    
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -101,6 +104,16 @@ class CourseImportJob(models.Model):
         ('cancelled', 'Cancelled'),
     )
     
+    # Pipeline stages, in order; each one's output is checkpointed so a retry resumes after it
+    STAGE_CHOICES = (
+        ('extract', 'Extract'),
+        ('chunk', 'Chunk'),
+        ('enrich', 'Enrich'),
+        ('embed', 'Embed'),
+        ('save', 'Save'),
+        ('index', 'Index'),
+    )
+    
     source = models.ForeignKey(CourseSource, on_delete=models.CASCADE, related_name='import_jobs')
     source_url = models.URLField()
     job_id = models.CharField(max_length=100, unique=True, db_index=True)
@@ -117,9 +130,23 @@ class CourseImportJob(models.Model):
     # Results
     total_chunks_extracted = models.IntegerField(default=0)
     chunks_with_embeddings = models.IntegerField(default=0)
+    embedding_cache_hits = models.IntegerField(default=0, help_text="Chunk embeddings served from the embedding cache")
+    embedding_cache_misses = models.IntegerField(default=0, help_text="Chunk embeddings generated by the model")
+    enrichment_cache_hits = models.IntegerField(default=0, help_text="Chunk analyses served from the enrichment cache")
+    enrichment_cache_misses = models.IntegerField(default=0, help_text="Chunk analyses requested from the LLM")
+    near_duplicates_skipped = models.IntegerField(default=0, help_text="Chunks dropped as MinHash near-duplicates")
+    semantic_duplicates_skipped = models.IntegerField(default=0, help_text="Chunks dropped as embedding near-duplicates")
+    units_unchanged = models.IntegerField(default=0, help_text="Lessons/segments skipped as unchanged since the last import")
+    units_changed = models.IntegerField(default=0, help_text="New or changed lessons/segments re-processed")
+    units_removed = models.IntegerField(default=0, help_text="Lessons/segments gone from the source, tombstoned")
     failed_extractions = models.IntegerField(default=0)
     error_chunks = JSONField(default=list, blank=True, help_text="Chunks that failed processing")
     
+    # Checkpoints
+    stage = models.CharField(max_length=20, choices=STAGE_CHOICES, blank=True, help_text="Last completed stage")
+    artifacts = JSONField(default=dict, blank=True, help_text="Stored output of each completed stage, by stage")
+    stage_times = JSONField(default=dict, blank=True, help_text="Seconds spent in each stage, by stage")
+    
     # Processing metadata
     started_at = models.DateTimeField(null=True, blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
@@ -180,6 +207,11 @@ class CourseImportJob(models.Model):
     def is_running(self):
         return self.status in ['processing', 'extracting', 'embedding']
     
+    def has_completed_stage(self, stage):
+        """Whether the pipeline got past ``stage`` (so its checkpoint can be reused)"""
+        stages = [choice[0] for choice in self.STAGE_CHOICES]
+        return bool(self.stage) and stages.index(self.stage) >= stages.index(stage)
+    
     def mark_as_failed(self, error_message, traceback=None):
         """Mark the job as failed with error message"""
         self.status = 'failed'
@@ -188,6 +220,33 @@ class CourseImportJob(models.Model):
             self.error_traceback = str(traceback)[:2000]
         self.save()
 
+# =============== ContentFingerprint Model ===============
+class ContentFingerprint(models.Model):
+    """Fingerprint of a lesson/segment of a CourseSource, so re-imports only process what changed"""
+    
+    source = models.ForeignKey(CourseSource, on_delete=models.CASCADE, related_name='content_fingerprints')
+    unit_key = models.CharField(max_length=64, help_text="Stable key of the lesson/segment within the source")
+    unit_title = models.CharField(max_length=200, blank=True)
+    fingerprint = models.CharField(max_length=32, blank=True, help_text="xxhash of the normalized content; blank to re-process")
+    chunk_count = models.IntegerField(default=0)
+    removed_at = models.DateTimeField(null=True, blank=True, help_text="Tombstone: missing from the source since")
+    
+    # Metadata
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['source', 'unit_key']
+        verbose_name = 'Content Fingerprint'
+        verbose_name_plural = 'Content Fingerprints'
+    
+    def __str__(self):
+        return f"{self.unit_title or self.unit_key} ({self.source.name})"
+    
+    @property
+    def is_removed(self):
+        return self.removed_at is not None
+
 # =============== Course Model ===============
 class Course(models.Model):
     """Main course model"""
@@ -535,12 +594,24 @@ class AIKnowledgeChunk(models.Model):
     embedding = models.BinaryField(null=True, blank=True, help_text="Vector embedding for semantic search")
     embedding_model = models.CharField(max_length=100, blank=True, help_text="Which model generated the embedding")
     embedding_dimensions = models.IntegerField(default=1536, help_text="Dimensions of the embedding vector")
+    embedding_dtype = models.CharField(
+        max_length=10,
+        blank=True,
+        help_text="Storage encoding of the embedding bytes (float32, float16, int8); blank for legacy float64"
+    )
     embedding_generated_at = models.DateTimeField(null=True, blank=True)
+    token_count = models.IntegerField(default=0, help_text="Content length in tokens of the embedding model")
     
     # Source tracking
     source = models.ForeignKey(CourseSource, on_delete=models.SET_NULL, null=True, blank=True)
     source_url = models.URLField(blank=True)
     source_metadata = JSONField(default=dict, blank=True)
+    content_unit = models.CharField(
+        max_length=64,
+        blank=True,
+        db_index=True,
+        help_text="Key of the source lesson/segment the chunk was cut from (see ContentFingerprint)"
+    )
     
     # Quality metrics (AI-assessed)
     clarity_score = models.FloatField(
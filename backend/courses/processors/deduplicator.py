@@ -0,0 +1,163 @@
+"""
+Ingestion-time detection of near-duplicate knowledge chunks
+"""
+
+from typing import Any, Collection, Dict, List, Optional, Tuple
+import numpy as np
+from django.conf import settings
+import logging
+
+from ..vector_db.minhash_index import minhash_index, estimated_jaccard
+
+logger = logging.getLogger(__name__)
+
+# List fields a kept chunk absorbs from the duplicates dropped in its favour
+MERGED_FIELDS = ('subtopics', 'learning_objectives', 'common_misconceptions', 'suggested_analogies')
+
+
+class ChunkDeduplicator:
+    """
+    Drops near-duplicate chunks from an import, in two passes:
+
+    - ``drop_text_duplicates`` (before embedding): MinHash signatures looked
+      up in the LSH index of stored chunks and among the import's own chunks
+    - ``drop_semantic_duplicates`` (after embedding): cosine similarity to the
+      vector index and to the import's own chunks
+
+    A duplicate of a chunk earlier in the same import is merged into it (its
+    list metadata is added to the kept chunk); a duplicate of a stored chunk
+    is skipped. Stored chunks the import replaces are ignored: the ids in
+    ``replacing``, or every chunk of the source when it's not given.
+    """
+
+    def __init__(self, source: Any = None, replacing: Optional[Collection[str]] = None):
+        config = getattr(settings, 'VECTOR_DB_CONFIG', {})
+        self.jaccard_threshold = config.get('DEDUP_JACCARD', 0.8)
+        self.similarity_threshold = config.get('DEDUP_SIMILARITY', 0.97)
+        self.neighbours = config.get('DEDUP_NEIGHBOURS', 3)
+        self.index = minhash_index
+        self.source_id = source.pk if source is not None else None
+        self.school_id = getattr(source, 'school_id', None)
+        self.replacing = {str(chunk_id) for chunk_id in replacing} if replacing is not None else None
+
+        self.near_duplicates = 0
+        self.semantic_duplicates = 0
+
+    # =============== Text ===============
+
+    def drop_text_duplicates(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """The chunks without MinHash near-duplicates of stored or earlier chunks"""
+        kept = []
+        signatures: Dict[int, np.ndarray] = {}
+        buckets: Dict[Tuple[int, int], List[int]] = {}
+
+        for chunk in chunks:
+            signature = self.index.hasher.signature(chunk.get('content', ''))
+            if signature is None:
+                kept.append(chunk)
+                continue
+
+            original = self._earlier_text_duplicate(signature, signatures, buckets)
+            if original is not None:
+                self._merge(kept[original], chunk)
+                self.near_duplicates += 1
+                continue
+
+            if self._stored_text_duplicate(signature, chunk):
+                self.near_duplicates += 1
+                continue
+
+            for key in self.index.band_keys(signature):
+                buckets.setdefault(key, []).append(len(kept))
+            signatures[len(kept)] = signature
+            kept.append(chunk)
+
+        if self.near_duplicates:
+            logger.info(f"Dropped {self.near_duplicates} near-duplicate chunks of {len(chunks)}")
+        return kept
+
+    def _earlier_text_duplicate(self, signature: np.ndarray, signatures: Dict[int, np.ndarray],
+                                buckets: Dict[Tuple[int, int], List[int]]) -> Optional[int]:
+        """Position among the kept chunks of the first one this signature duplicates"""
+        candidates = {position for key in self.index.band_keys(signature) for position in buckets.get(key, ())}
+        for position in sorted(candidates):
+            if estimated_jaccard(signature, signatures[position]) >= self.jaccard_threshold:
+                return position
+        return None
+
+    def _stored_text_duplicate(self, signature: np.ndarray, chunk: Dict[str, Any]) -> bool:
+        try:
+            matches = self.index.find_similar(
+                signature, self.jaccard_threshold, school_id=self.school_id,
+                exclude_source_id=self.source_id if self.replacing is None else None
+            )
+        except Exception as e:
+            logger.error(f"MinHash lookup failed, keeping chunk '{chunk.get('title', '')}': {e}")
+            return False
+        if self.replacing:
+            matches = [match for match in matches if match[0] not in self.replacing]
+        if matches:
+            logger.debug(f"Chunk '{chunk.get('title', '')}' duplicates stored chunk {matches[0][0]} "
+                         f"(jaccard {matches[0][1]:.2f})")
+        return bool(matches)
+
+    # =============== Embeddings ===============
+
+    def drop_semantic_duplicates(self, chunks: List[Dict[str, Any]], vector_db: Any) -> List[Dict[str, Any]]:
+        """The chunks whose embeddings aren't near-identical to stored or earlier chunks' embeddings"""
+        embedded = [i for i, chunk in enumerate(chunks) if chunk.get('embedding')]
+        if not embedded:
+            return chunks
+
+        vectors = np.array([chunks[i]['embedding'] for i in embedded], dtype='float32')
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+
+        dropped = set()
+        originals: Dict[int, int] = {}
+
+        # Within the import: each chunk against the chunks before it
+        for row in range(1, len(embedded)):
+            similarities = vectors[:row] @ vectors[row]
+            for earlier in np.nonzero(similarities >= self.similarity_threshold)[0]:
+                if embedded[earlier] not in dropped:
+                    originals[embedded[row]] = embedded[earlier]
+                    dropped.add(embedded[row])
+                    break
+
+        # Against the stored chunks the import won't replace
+        remaining = [i for i in embedded if i not in dropped]
+        results = vector_db.search_batch([chunks[i]['embedding'] for i in remaining], limit=self.neighbours)
+        for i, hits in zip(remaining, results):
+            for hit in hits:
+                if self._replaced(hit):
+                    continue
+                if hit['similarity_score'] >= self.similarity_threshold:
+                    dropped.add(i)
+                    break
+
+        kept = []
+        for i, chunk in enumerate(chunks):
+            if i in originals and originals[i] not in dropped:
+                self._merge(chunks[originals[i]], chunk)
+            if i not in dropped:
+                kept.append(chunk)
+
+        self.semantic_duplicates += len(dropped)
+        if dropped:
+            logger.info(f"Dropped {len(dropped)} semantically duplicate chunks of {len(chunks)}")
+        return kept
+
+    def _replaced(self, hit: Dict[str, Any]) -> bool:
+        if self.replacing is not None:
+            return hit['id'] in self.replacing
+        return self.source_id is not None and hit['metadata'].get('source_id') == str(self.source_id)
+
+    def _merge(self, kept: Dict[str, Any], duplicate: Dict[str, Any]):
+        for field in MERGED_FIELDS:
+            values = list(kept.get(field) or [])
+            for value in duplicate.get(field) or []:
+                if value not in values:
+                    values.append(value)
+            if values:
+                kept[field] = values
@@ -1,59 +1,230 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import numpy as np
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import openai
 from django.conf import settings
-from sentence_transformers import SentenceTransformer
 import logging
 
+from ..vector_db.embedding_cache import embedding_cache
+from ..vector_db.embedding_models import embedding_models, DEFAULT_COLLECTION
+from .local_embedding import get_local_embedding_service
+from .tokenization import get_token_counter
+
 logger = logging.getLogger(__name__)
 
+# Retry backoff bounds in seconds
+BASE_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+
+
+def http_status(error: Exception) -> Optional[int]:
+    """HTTP status of an API error, if it has one"""
+    return getattr(error, 'http_status', None) or getattr(error, 'status_code', None)
+
+
+# Errors raised when a request never got a response (openai 0.x and 1.x+ names)
+_CONNECTION_ERRORS = (ConnectionError, TimeoutError) + tuple(
+    error for error in (
+        getattr(openai, 'APIConnectionError', None),
+        getattr(getattr(openai, 'error', None), 'APIConnectionError', None),
+        getattr(getattr(openai, 'error', None), 'Timeout', None),
+    ) if isinstance(error, type)
+)
+
+
+def is_transient(error: Exception) -> bool:
+    """Whether a retry may succeed: rate limits, server errors, timeouts and dropped connections"""
+    status = http_status(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(error, _CONNECTION_ERRORS)
+
+
+class RequestPacer:
+    """Spaces request starts evenly to stay under a requests-per-minute limit"""
+    
+    def __init__(self, requests_per_minute: Optional[int] = None):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next_start = 0.0
+        self._lock = threading.Lock()
+    
+    def reserve(self) -> float:
+        """Claim the next request slot, returning the seconds until it starts"""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.interval
+        return start - now
+    
+    def wait(self):
+        """Block until the next request may start"""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+    
+    def pause(self, seconds: float):
+        """Hold back every request for ``seconds`` (after a rate-limit response)"""
+        with self._lock:
+            self._next_start = max(self._next_start, time.monotonic() + seconds)
+
+
 class EmbeddingGenerator:
     """Generate embeddings for knowledge chunks"""
     
-    def __init__(self, use_openai: bool = True):
-        self.use_openai = use_openai and settings.OPENAI_API_KEY
+    def __init__(self, use_openai: bool = True, requests_per_minute: Optional[int] = None,
+                 model: Optional[str] = None):
+        config = getattr(settings, 'VECTOR_DB_CONFIG', {})
+        self.batch_tokens = config.get('EMBEDDING_BATCH_TOKENS', 100000)
+        self.batch_size = config.get('EMBEDDING_BATCH_SIZE', 512)
+        self.concurrency = config.get('EMBEDDING_CONCURRENCY', 4)
+        self.max_retries = config.get('EMBEDDING_MAX_RETRIES', 5)
+        # Longer inputs are truncated (ada-002 accepts 8191 tokens)
+        self.max_input_tokens = config.get('EMBEDDING_MAX_INPUT_TOKENS', 8191)
+        # Shared by the worker threads, so the source's rate limit holds for the whole import
+        self.pacer = RequestPacer(requests_per_minute)
+        
+        # By default embed with the model the knowledge collection serves,
+        # so new chunks land in its live index
+        self.model_name = embedding_models.canonical_name(model) or embedding_models.live(DEFAULT_COLLECTION)[0]
+        if embedding_models.provider(self.model_name) == 'openai' and not (use_openai and settings.OPENAI_API_KEY):
+            if model:
+                raise ValueError(f"Embedding model {model} requires OPENAI_API_KEY")
+            # Use open-source model as fallback
+            self.model_name = config.get('LOCAL_EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+        self.use_openai = embedding_models.provider(self.model_name) == 'openai'
         
         if self.use_openai:
             openai.api_key = settings.OPENAI_API_KEY
-            self.model = "text-embedding-ada-002"
+            self.model = self.model_name
         else:
-            # Use open-source model as fallback
-            self.model = SentenceTransformer('all-MiniLM-L6-v2')
+            # Shared by every generator in the process
+            self.model = get_local_embedding_service(self.model_name)
+        self.tokens = get_token_counter(self.model_name)
+        
+        # Counters for the last generate_embeddings call
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.failed_embeddings = 0
     
     def generate_embeddings(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Generate embeddings for a list of chunks"""
         
-        chunks_with_embeddings = []
+        # Unchanged text (re-imports, repeated boilerplate) is served from the embedding cache
+        texts = [self._prepare_text_for_embedding(chunk) for chunk in chunks]
+        embeddings = embedding_cache.get_many(self.model_name, texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        self.cache_hits = len(chunks) - len(missing)
+        self.cache_misses = len(missing)
         
-        for i, chunk in enumerate(chunks):
-            try:
-                # Prepare text for embedding
-                text = self._prepare_text_for_embedding(chunk)
-                
-                # Generate embedding
-                if self.use_openai:
-                    embedding = self._generate_openai_embedding(text)
-                else:
-                    embedding = self._generate_local_embedding(text)
-                
-                # Add embedding to chunk
-                chunk['embedding'] = embedding.tolist() if hasattr(embedding, 'tolist') else embedding
-                chunk['embedding_model'] = 'openai' if self.use_openai else 'sentence-transformers'
-                
-                chunks_with_embeddings.append(chunk)
-                
-                # Log progress
-                if (i + 1) % 10 == 0:
-                    logger.info(f"Generated embeddings for {i + 1}/{len(chunks)} chunks")
-                    
-            except Exception as e:
-                logger.error(f"Failed to generate embedding for chunk {i}: {e}")
-                # Add chunk without embedding
+        generated = self._embed_texts([texts[i] for i in missing])
+        for i, embedding in zip(missing, generated):
+            embeddings[i] = embedding
+        embedding_cache.set_many(self.model_name, [texts[i] for i in missing], generated)
+        
+        self.failed_embeddings = 0
+        for chunk, embedding in zip(chunks, embeddings):
+            if embedding is None:
+                # Keep the chunk without an embedding
+                self.failed_embeddings += 1
                 chunk['embedding'] = None
                 chunk['embedding_model'] = None
-                chunks_with_embeddings.append(chunk)
+            else:
+                chunk['embedding'] = embedding.tolist() if hasattr(embedding, 'tolist') else embedding
+                chunk['embedding_model'] = self.model_name
+        
+        if self.failed_embeddings:
+            logger.error(f"Failed to generate embeddings for {self.failed_embeddings}/{len(chunks)} chunks")
         
-        return chunks_with_embeddings
+        return chunks
+    
+    # =============== Batching ===============
+    
+    def _embed_texts(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Embeddings for texts (None where one failed), in token-budgeted batches run concurrently"""
+        
+        if not texts:
+            return []
+        
+        batches = self._make_batches(texts)
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+        workers = min(self.concurrency if self.use_openai else 1, len(batches))
+        
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(self._embed_isolated, [texts[i] for i in batch]): batch
+                for batch in batches
+            }
+            done = 0
+            for future in as_completed(futures):
+                batch = futures[future]
+                for i, embedding in zip(batch, future.result()):
+                    results[i] = embedding
+                done += len(batch)
+                logger.info(f"Generated embeddings for {done}/{len(texts)} chunks")
+        
+        return results
+    
+    def _make_batches(self, texts: List[str]) -> List[List[int]]:
+        """Group text positions into batches under the token and size budgets"""
+        
+        batches, batch, batch_tokens = [], [], 0
+        for i, text in enumerate(texts):
+            tokens = min(self.tokens.count(text), self.max_input_tokens)
+            if batch and (batch_tokens + tokens > self.batch_tokens or len(batch) >= self.batch_size):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(i)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+    
+    def _embed_isolated(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Embed one batch. A batch rejected for its input is split in halves so
+        only the offending texts end up without an embedding.
+        """
+        try:
+            return self._embed_batch(texts)
+        except Exception as e:
+            if len(texts) > 1 and self._is_input_error(e):
+                middle = len(texts) // 2
+                return self._embed_isolated(texts[:middle]) + self._embed_isolated(texts[middle:])
+            logger.error(f"Failed to generate embeddings for a batch of {len(texts)} chunks: {e}")
+            return [None] * len(texts)
+    
+    def _embed_batch(self, texts: List[str]) -> List[np.ndarray]:
+        """One embedding request, retried with exponential backoff on transient errors"""
+        
+        if not self.use_openai:
+            return list(self._generate_local_embedding(texts))
+        
+        for attempt in range(self.max_retries + 1):
+            self.pacer.wait()
+            try:
+                response = openai.Embedding.create(
+                    model=self.model,
+                    input=[self.tokens.truncate(text, self.max_input_tokens) for text in texts]
+                )
+                data = sorted(response['data'], key=lambda item: item['index'])
+                return [np.array(item['embedding']) for item in data]
+            except Exception as e:
+                if self._is_input_error(e) or attempt == self.max_retries:
+                    raise
+                delay = min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempt) * random.uniform(0.5, 1.0)
+                logger.warning(f"Embedding request failed ({e}), retrying in {delay:.1f}s")
+                if http_status(e) == 429:
+                    # Rate limited: slow every worker down, not just this one
+                    self.pacer.pause(delay)
+                else:
+                    time.sleep(delay)
+    
+    def _is_input_error(self, error: Exception) -> bool:
+        """Errors a retry won't fix (the local model fails deterministically)"""
+        return not self.use_openai or http_status(error) in (400, 413, 422)
     
     def _prepare_text_for_embedding(self, chunk: Dict) -> str:
         """Prepare text for embedding generation"""
@@ -78,55 +249,14 @@ class EmbeddingGenerator:
     
     def _generate_openai_embedding(self, text: str) -> np.ndarray:
         """Generate embedding using OpenAI API"""
-        
-        # Truncate text if too long
-        if len(text) > 8000:
-            text = text[:8000]
-        
-        response = openai.Embedding.create(
-            model=self.model,
-            input=text
-        )
-        
-        return np.array(response['data'][0]['embedding'])
+        return self._embed_batch([text])[0]
     
-    def _generate_local_embedding(self, text: str) -> np.ndarray:
-        """Generate embedding using local model"""
-        
-        # Encode the text
-        embedding = self.model.encode(text)
-        
-        return embedding
+    def _generate_local_embedding(self, texts):
+        """Generate embeddings using local model (one text or a list)"""
+        return self.model.encode(texts)
     
-    def batch_generate_embeddings(self, texts: List[str], batch_size: int = 32) -> List[np.ndarray]:
+    def batch_generate_embeddings(self, texts: List[str], batch_size: int = None) -> List[Optional[np.ndarray]]:
         """Generate embeddings in batches for efficiency"""
-        
-        embeddings = []
-        
-        if self.use_openai:
-            # OpenAI handles batching internally
-            for i in range(0, len(texts), batch_size):
-                batch = texts[i:i + batch_size]
-                
-                # Truncate long texts
-                batch = [text[:8000] for text in batch]
-                
-                response = openai.Embedding.create(
-                    model=self.model,
-                    input=batch
-                )
-                
-                batch_embeddings = [np.array(item['embedding']) for item in response['data']]
-                embeddings.extend(batch_embeddings)
-                
-                logger.info(f"Processed batch {i//batch_size + 1}/{(len(texts) + batch_size - 1)//batch_size}")
-        else:
-            # Local model batching
-            for i in range(0, len(texts), batch_size):
-                batch = texts[i:i + batch_size]
-                batch_embeddings = self.model.encode(batch)
-                embeddings.extend(batch_embeddings)
-                
-                logger.info(f"Processed batch {i//batch_size + 1}/{(len(texts) + batch_size - 1)//batch_size}")
-        
-        return embeddings
\ No newline at end of file
+        if batch_size:
+            self.batch_size = batch_size
+        return self._embed_texts(texts)
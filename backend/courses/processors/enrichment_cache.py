@@ -0,0 +1,97 @@
+"""
+Persistent cache of LLM enrichment results, shared by imports and their retries
+"""
+
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+import xxhash
+from django.conf import settings
+import logging
+
+from ..vector_db.embedding_cache import normalize_text, RedisEmbeddingStore, SQLiteEmbeddingStore
+
+logger = logging.getLogger(__name__)
+
+
+def prompt_version(*templates: str) -> str:
+    """Short hash of a prompt's templates, so editing a prompt only invalidates the results it produced"""
+    return xxhash.xxh64_hexdigest('\x00'.join(templates).encode('utf-8'))
+
+
+class EnrichmentCache:
+    """
+    LLM results keyed by (prompt version, model, xxh3-128 of the normalized
+    prompt input), stored as JSON in the embedding cache's backend (Redis
+    or SQLite). Like the embedding cache, store failures are logged and
+    treated as misses.
+    """
+
+    def __init__(self, store=None):
+        self._store = store
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def store(self):
+        if self._store is None:
+            config = getattr(settings, 'VECTOR_DB_CONFIG', {})
+            if config.get('EMBEDDING_CACHE_BACKEND', 'redis') == 'redis':
+                self._store = RedisEmbeddingStore(
+                    config.get('EMBEDDING_CACHE_URL') or settings.CELERY_BROKER_URL,
+                    ttl=config.get('ENRICHMENT_CACHE_TTL'),
+                    prefix='enr:'
+                )
+            else:
+                self._store = SQLiteEmbeddingStore(
+                    os.path.join(settings.BASE_DIR, 'data/enrichment_cache.sqlite3'), table='enrichments'
+                )
+        return self._store
+
+    @staticmethod
+    def key(version: str, model: str, text: str) -> str:
+        return f"{version}:{model}:{xxhash.xxh3_128_hexdigest(normalize_text(text).encode('utf-8'))}"
+
+    def get_many(self, version: str, model: str, texts: Sequence[str]) -> List[Optional[Any]]:
+        """Cached result for each prompt input, or None"""
+        if not texts:
+            return []
+        try:
+            values = self.store.get_many([self.key(version, model, text) for text in texts])
+        except Exception as e:
+            logger.error(f"Enrichment cache lookup failed: {e}")
+            values = [None] * len(texts)
+
+        results = [json.loads(bytes(value)) if value is not None else None for value in values]
+        hits = sum(result is not None for result in results)
+        with self._lock:
+            self.hits += hits
+            self.misses += len(results) - hits
+        return results
+
+    def set_many(self, version: str, model: str, texts: Sequence[str], results: Sequence[Any]):
+        items = {
+            self.key(version, model, text): json.dumps(result).encode('utf-8')
+            for text, result in zip(texts, results) if result is not None
+        }
+        if not items:
+            return
+        try:
+            self.store.set_many(items)
+        except Exception as e:
+            logger.error(f"Enrichment cache write failed: {e}")
+
+    def get(self, version: str, model: str, text: str) -> Optional[Any]:
+        return self.get_many(version, model, [text])[0]
+
+    def set(self, version: str, model: str, text: str, result: Any):
+        self.set_many(version, model, [text], [result])
+
+    def get_stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0}
+
+
+enrichment_cache = EnrichmentCache()
@@ -0,0 +1,58 @@
+"""
+Intermediate output of course import stages, kept on disk so a failed
+import resumes at the first incomplete stage
+"""
+
+import os
+import shutil
+from typing import Any
+import ormsgpack
+import zstandard
+from django.conf import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ImportArtifactStore:
+    """
+    Stage artifacts as zstd-compressed msgpack files, one directory per job.
+
+    Paths handed out are relative to the store's root, which is what
+    ``CourseImportJob.artifacts`` records.
+    """
+
+    def __init__(self, root: str = None, level: int = 3):
+        self.root = root or os.path.join(settings.BASE_DIR, 'data/import_artifacts')
+        self.level = level
+
+    def save(self, job_id: str, stage: str, data: Any) -> str:
+        """Write a stage's output, returning its path"""
+        path = os.path.join(str(job_id), f"{stage}.msgpack.zst")
+        full_path = os.path.join(self.root, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+
+        packed = ormsgpack.packb(data, option=ormsgpack.OPT_SERIALIZE_NUMPY | ormsgpack.OPT_NON_STR_KEYS)
+        compressed = zstandard.ZstdCompressor(level=self.level).compress(packed)
+
+        # Written aside and renamed, so a killed worker never leaves a truncated artifact
+        with open(full_path + '.tmp', 'wb') as f:
+            f.write(compressed)
+        os.replace(full_path + '.tmp', full_path)
+
+        logger.debug(f"Saved {stage} artifact of job {job_id}: {len(packed)} bytes packed, {len(compressed)} stored")
+        return path
+
+    def load(self, path: str) -> Any:
+        with open(os.path.join(self.root, path), 'rb') as f:
+            packed = zstandard.ZstdDecompressor().decompress(f.read())
+        return ormsgpack.unpackb(packed, option=ormsgpack.OPT_NON_STR_KEYS)
+
+    def exists(self, path: str) -> bool:
+        return os.path.exists(os.path.join(self.root, path))
+
+    def delete_job(self, job_id: str):
+        shutil.rmtree(os.path.join(self.root, str(job_id)), ignore_errors=True)
+
+
+import_artifacts = ImportArtifactStore()
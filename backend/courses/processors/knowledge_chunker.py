@@ -1,50 +1,179 @@
+import asyncio
 import json
-from typing import List, Dict, Any
+import random
+from typing import List, Dict, Any, Collection, Optional
 import openai
+import xxhash
 from django.conf import settings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
 import logging
 
+from .tokenization import get_token_counter
+from .embedding_generator import RequestPacer, BASE_BACKOFF, MAX_BACKOFF, http_status, is_transient
+from .enrichment_cache import enrichment_cache, prompt_version
+from ..vector_db.embedding_models import embedding_models, DEFAULT_COLLECTION
+from ..vector_db.embedding_cache import normalize_text
+
 logger = logging.getLogger(__name__)
 
+# Fields of each content unit its chunks depend on, so a change elsewhere
+# (view counts, thumbnails) doesn't trigger re-processing
+FINGERPRINT_FIELDS = {
+    'lesson': ('title', 'description', 'content', 'transcript', 'key_concepts', 'difficulty', 'content_type', 'order'),
+    'segment': ('segment_title', 'segment_number', 'content', 'key_terms', 'estimated_duration'),
+    'course': ('title', 'description'),
+}
+COURSE_FINGERPRINT_FIELDS = ('title', 'subject', 'difficulty', 'source')
+
+ENRICHMENT_SYSTEM_PROMPT = "You are an expert educational content analyst."
+ENRICHMENT_CHUNK_TEMPLATE = "CHUNK {index}\nTITLE: {title}\nCONTENT: {content}"
+ENRICHMENT_PROMPT = """
+        Analyze each of these {count} pieces of educational content and extract structured information:
+        
+        {sections}
+        
+        For each chunk provide:
+        1. Primary educational concept (1-3 words)
+        2. Difficulty adjustment (beginner/intermediate/advanced)
+        3. Best teaching strategy (direct_instruction, socratic, worked_example, discovery, analogy)
+        4. Key learning objectives (list 2-3)
+        5. Common student misconceptions (list 1-3)
+        6. Suggested analogies (list 1-2)
+        
+        Return a JSON object {{"chunks": [...]}} with one entry per chunk, each with these keys:
+        chunk (the CHUNK number), concept, difficulty, teaching_strategy, learning_objectives,
+        misconceptions, analogies.
+        """
+# Cached analyses are keyed by this, so editing the prompt only invalidates its own results
+ENRICHMENT_PROMPT_VERSION = prompt_version(ENRICHMENT_SYSTEM_PROMPT, ENRICHMENT_CHUNK_TEMPLATE, ENRICHMENT_PROMPT)
+
 class KnowledgeChunker:
     """Process raw course content into structured knowledge chunks"""
     
-    def __init__(self):
+    def __init__(self, embedding_model: str = None, requests_per_minute: Optional[int] = None):
+        config = getattr(settings, 'VECTOR_DB_CONFIG', {})
+        
+        # Chunks are measured in tokens of the model that embeds them
+        embedding_model = embedding_model or embedding_models.live(DEFAULT_COLLECTION)[0]
+        self.tokens = get_token_counter(embedding_model)
+        self.prompt_tokens = get_token_counter()
+        self.enrichment_content_tokens = config.get('ENRICHMENT_CONTENT_TOKENS', 250)
+        self.enrichment_model = config.get('ENRICHMENT_MODEL', 'gpt-3.5-turbo')
+        self.enrichment_batch_size = config.get('ENRICHMENT_BATCH_SIZE', 8)
+        self.enrichment_concurrency = config.get('ENRICHMENT_CONCURRENCY', 8)
+        self.enrichment_max_retries = config.get('ENRICHMENT_MAX_RETRIES', 4)
+        self.enrichment_response_tokens = config.get('ENRICHMENT_RESPONSE_TOKENS', 200)
+        # The source's rate limit holds across all prompts in flight
+        self.pacer = RequestPacer(requests_per_minute)
+        
+        # Counters for the last enrichment
+        self.enrichment_cache_hits = 0
+        self.enrichment_cache_misses = 0
+        
+        self.chunk_tokens = config.get('CHUNK_TOKENS', 200)
+        self.chunk_overlap_tokens = config.get('CHUNK_OVERLAP_TOKENS', 25)
         self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=800,
-            chunk_overlap=100,
-            length_function=len,
+            chunk_size=self.chunk_tokens,
+            chunk_overlap=self.chunk_overlap_tokens,
+            length_function=self.tokens.count,
             separators=["\n\n", "\n", ". ", " ", ""]
         )
         
         openai.api_key = settings.OPENAI_API_KEY
     
-    def process_course_content(self, course_data: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Process course content into knowledge chunks"""
-        
-        chunks = []
+    def content_units(self, course_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        The lessons (or content segments, or the course description) chunks
+        are cut from, each with a key that's stable across imports and a
+        fingerprint of the content its chunks depend on
+        """
         
-        # Extract lessons or content segments
         if 'lessons' in course_data:
-            # Process each lesson
-            for lesson in course_data['lessons']:
-                lesson_chunks = self._process_lesson(lesson, course_data)
-                chunks.extend(lesson_chunks)
+            kind, items = 'lesson', course_data['lessons']
         elif 'structured_content' in course_data:
-            # Process structured content
-            for segment in course_data['structured_content']:
-                segment_chunks = self._process_content_segment(segment, course_data)
-                chunks.extend(segment_chunks)
+            kind, items = 'segment', course_data['structured_content']
         else:
-            # Fallback: process description as single chunk
-            chunks = self._process_text_content(course_data)
+            kind, items = 'course', [course_data]
+        
+        course_fields = self._fingerprint_fields(course_data, COURSE_FINGERPRINT_FIELDS)
+        # Re-chunk everything when the chunking itself changes
+        chunking = [self.tokens.model, self.chunk_tokens, self.chunk_overlap_tokens]
+        
+        units = []
+        seen = {}
+        for i, item in enumerate(items):
+            if kind == 'lesson':
+                identity = item.get('url') or item.get('title') or str(item.get('order', i))
+                title = item.get('title', '')
+            elif kind == 'segment':
+                identity = str(item.get('segment_number', i + 1))
+                title = item.get('segment_title', '')
+            else:
+                identity = title = course_data.get('title', '')
+            
+            # Repeated identities (two lessons with one title) are numbered in order
+            seen[identity] = seen.get(identity, 0) + 1
+            if seen[identity] > 1:
+                identity = f"{identity}#{seen[identity]}"
+            
+            payload = json.dumps(
+                [kind, self._fingerprint_fields(item, FINGERPRINT_FIELDS[kind]), course_fields, chunking],
+                sort_keys=True, default=str
+            )
+            units.append({
+                'key': xxhash.xxh3_128_hexdigest(f"{kind}:{identity}".encode('utf-8')),
+                'kind': kind,
+                'title': title,
+                'fingerprint': xxhash.xxh3_128_hexdigest(payload.encode('utf-8')),
+                'item': item,
+            })
+        
+        return units
+    
+    def _fingerprint_fields(self, data: Dict[str, Any], fields: tuple) -> Dict[str, Any]:
+        """The fields' values, with text normalized so whitespace-only edits don't count as changes"""
+        return {
+            field: normalize_text(data[field]) if isinstance(data.get(field), str) else data.get(field)
+            for field in fields
+        }
+    
+    def process_course_content(self, course_data: Dict[str, Any],
+                               units: Optional[Collection[str]] = None) -> List[Dict[str, Any]]:
+        """Process course content into knowledge chunks (only the content units with these keys, if given)"""
+        
+        chunks = self.chunk_course_content(course_data, units=units)
         
         # Enrich chunks with AI analysis
-        enriched_chunks = self._enrich_chunks_with_ai(chunks)
+        return self.enrich_chunks(chunks)
+    
+    def chunk_course_content(self, course_data: Dict[str, Any],
+                             units: Optional[Collection[str]] = None) -> List[Dict[str, Any]]:
+        """Split course content into knowledge chunks without AI enrichment"""
+        
+        chunks = []
         
-        return enriched_chunks
+        for unit in self.content_units(course_data):
+            if units is not None and unit['key'] not in units:
+                continue
+            
+            if unit['kind'] == 'lesson':
+                unit_chunks = self._process_lesson(unit['item'], course_data)
+            elif unit['kind'] == 'segment':
+                unit_chunks = self._process_content_segment(unit['item'], course_data)
+            else:
+                # Fallback: process description as single chunk
+                unit_chunks = self._process_text_content(course_data)
+            
+            for chunk in unit_chunks:
+                chunk['content_unit'] = unit['key']
+            chunks.extend(unit_chunks)
+        
+        # Token counts let embedding batches and prompts be packed to their budgets
+        for chunk in chunks:
+            chunk['token_count'] = self.tokens.count(chunk['content'])
+        
+        return chunks
     
     def _process_lesson(self, lesson: Dict, course_data: Dict) -> List[Dict]:
         """Process a lesson into knowledge chunks"""
@@ -89,21 +218,29 @@ class KnowledgeChunker:
     def _process_content_segment(self, segment: Dict, course_data: Dict) -> List[Dict]:
         """Process a content segment into knowledge chunks"""
         
-        chunk = {
-            'title': segment.get('segment_title', f"Segment {segment.get('segment_number', 1)}"),
-            'content': segment.get('content', ''),
-            'content_type': 'concept',
-            'difficulty_level': course_data.get('difficulty', 'intermediate'),
-            'subject': course_data.get('subject', 'general'),
-            'topic': course_data.get('title', 'general'),
-            'subtopics': segment.get('key_terms', []),
-            'source_metadata': {
-                'segment_number': segment.get('segment_number', 1),
-                'estimated_duration': segment.get('estimated_duration', 0)
+        title = segment.get('segment_title', f"Segment {segment.get('segment_number', 1)}")
+        
+        # Segments over the chunk budget are split like lessons
+        text_chunks = self.text_splitter.split_text(segment.get('content', '')) or ['']
+        
+        chunks = []
+        for i, text in enumerate(text_chunks):
+            chunk = {
+                'title': title if len(text_chunks) == 1 else f"{title} - Part {i+1}",
+                'content': text,
+                'content_type': 'concept',
+                'difficulty_level': course_data.get('difficulty', 'intermediate'),
+                'subject': course_data.get('subject', 'general'),
+                'topic': course_data.get('title', 'general'),
+                'subtopics': segment.get('key_terms', []),
+                'source_metadata': {
+                    'segment_number': segment.get('segment_number', 1),
+                    'estimated_duration': segment.get('estimated_duration', 0)
+                }
             }
-        }
+            chunks.append(chunk)
         
-        return [chunk]
+        return chunks
     
     def _process_text_content(self, course_data: Dict) -> List[Dict]:
         """Fallback text processing"""
@@ -148,70 +285,138 @@ class KnowledgeChunker:
         
         return type_mapping.get(content_type, 'concept')
     
-    def _enrich_chunks_with_ai(self, chunks: List[Dict]) -> List[Dict]:
-        """Use AI to enrich knowledge chunks with metadata"""
+    def enrich_chunks(self, chunks: List[Dict]) -> List[Dict]:
+        """
+        Use AI to enrich knowledge chunks with metadata.
         
-        enriched_chunks = []
+        Analyses are looked up in the enrichment cache first. The rest are
+        packed ``ENRICHMENT_BATCH_SIZE`` chunks to a prompt with up to
+        ``ENRICHMENT_CONCURRENCY`` prompts in flight, paced to the source's
+        rate limit, and cached as each prompt completes, so a task killed
+        part way (or retried, or re-importing the same text) resumes where
+        it stopped.
+        """
         
-        for chunk in chunks:
-            try:
-                # Generate educational metadata using GPT
-                enriched = self._analyze_with_gpt(chunk)
-                enriched_chunks.append(enriched)
-            except Exception as e:
-                logger.warning(f"AI enrichment failed for chunk: {e}")
-                # Use original chunk if AI fails
-                enriched_chunks.append(chunk)
+        self.enrichment_cache_hits = 0
+        self.enrichment_cache_misses = 0
+        if not chunks:
+            return chunks
         
-        return enriched_chunks
-    
-    def _analyze_with_gpt(self, chunk: Dict) -> Dict:
-        """Analyze chunk with GPT to extract educational metadata"""
+        inputs = [self._enrichment_input(chunk) for chunk in chunks]
+        cached = enrichment_cache.get_many(ENRICHMENT_PROMPT_VERSION, self.enrichment_model, inputs)
         
-        prompt = f"""
-        Analyze this educational content and extract structured information:
+        pending = []
+        for chunk, text, analysis in zip(chunks, inputs, cached):
+            if analysis is not None:
+                self._apply_analysis(chunk, analysis)
+            else:
+                pending.append((chunk, text))
+        self.enrichment_cache_hits = len(chunks) - len(pending)
+        self.enrichment_cache_misses = len(pending)
         
-        TITLE: {chunk['title']}
-        CONTENT: {chunk['content'][:1000]}
+        if pending and not settings.OPENAI_API_KEY:
+            logger.warning(f"OPENAI_API_KEY isn't set, skipping AI enrichment of {len(pending)} chunks")
+        elif pending:
+            batches = [pending[i:i + self.enrichment_batch_size]
+                       for i in range(0, len(pending), self.enrichment_batch_size)]
+            asyncio.run(self._enrich_batches(batches))
         
-        Please provide:
-        1. Primary educational concept (1-3 words)
-        2. Difficulty adjustment (beginner/intermediate/advanced)
-        3. Best teaching strategy (direct_instruction, socratic, worked_example, discovery, analogy)
-        4. Key learning objectives (list 2-3)
-        5. Common student misconceptions (list 1-3)
-        6. Suggested analogies (list 1-2)
+        return chunks
+    
+    def _enrichment_input(self, chunk: Dict) -> str:
+        """The chunk text an enrichment prompt includes (and its cache key covers)"""
+        return f"{chunk['title']}\n{self.prompt_tokens.truncate(chunk['content'], self.enrichment_content_tokens)}"
+    
+    async def _enrich_batches(self, batches: List[List[tuple]]):
+        semaphore = asyncio.Semaphore(self.enrichment_concurrency)
         
-        Return as JSON with these keys: concept, difficulty, teaching_strategy, 
-        learning_objectives, misconceptions, analogies.
-        """
+        async def enrich(batch):
+            async with semaphore:
+                analyses = await self._analyze_batch([chunk for chunk, _ in batch])
+            for (chunk, _), analysis in zip(batch, analyses):
+                # Keep the original chunk if AI fails
+                if analysis is not None:
+                    self._apply_analysis(chunk, analysis)
+            enrichment_cache.set_many(
+                ENRICHMENT_PROMPT_VERSION, self.enrichment_model, [text for _, text in batch], analyses
+            )
         
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are an expert educational content analyst."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=500
-        )
+        await asyncio.gather(*(enrich(batch) for batch in batches))
+    
+    async def _analyze_batch(self, batch: List[Dict]) -> List[Optional[Dict]]:
+        """Analyses of the batch's chunks (None where the model gave none), from one prompt"""
+        
+        messages = [
+            {"role": "system", "content": ENRICHMENT_SYSTEM_PROMPT},
+            {"role": "user", "content": self._batch_prompt(batch)}
+        ]
         
+        for attempt in range(self.enrichment_max_retries + 1):
+            delay = self.pacer.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                response = await asyncio.to_thread(
+                    openai.ChatCompletion.create,
+                    model=self.enrichment_model,
+                    messages=messages,
+                    temperature=0.3,
+                    max_tokens=self.enrichment_response_tokens * len(batch),
+                    response_format={"type": "json_object"}
+                )
+                return self._parse_batch(response.choices[0].message.content, len(batch))
+            except Exception as e:
+                # Anything but a rate limit, server error or lost connection fails the same way again
+                if not is_transient(e) or attempt == self.enrichment_max_retries:
+                    logger.warning(f"AI enrichment failed for a batch of {len(batch)} chunks: {e}")
+                    return [None] * len(batch)
+                delay = min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempt) * random.uniform(0.5, 1.0)
+                logger.warning(f"AI enrichment request failed ({e}), retrying in {delay:.1f}s")
+                if http_status(e) == 429:
+                    # Rate limited: hold back every prompt, not just this one
+                    self.pacer.pause(delay)
+                else:
+                    await asyncio.sleep(delay)
+    
+    def _batch_prompt(self, batch: List[Dict]) -> str:
+        sections = "\n\n".join(
+            ENRICHMENT_CHUNK_TEMPLATE.format(
+                index=i,
+                title=chunk['title'],
+                content=self.prompt_tokens.truncate(chunk['content'], self.enrichment_content_tokens)
+            )
+            for i, chunk in enumerate(batch)
+        )
+        return ENRICHMENT_PROMPT.format(count=len(batch), sections=sections)
+    
+    def _parse_batch(self, content: str, size: int) -> List[Optional[Dict]]:
         try:
-            analysis = json.loads(response.choices[0].message.content)
-            
-            # Update chunk with AI analysis
-            chunk.update({
-                'concept': analysis.get('concept', ''),
-                'difficulty_level': analysis.get('difficulty', chunk['difficulty_level']),
-                'teaching_strategy': analysis.get('teaching_strategy', 'direct_instruction'),
-                'learning_objectives': analysis.get('learning_objectives', []),
-                'common_misconceptions': analysis.get('misconceptions', []),
-                'suggested_analogies': analysis.get('analogies', []),
-                'ai_analyzed': True
-            })
-            
-        except json.JSONDecodeError:
-            # Keep original if parsing fails
-            chunk['ai_analyzed'] = False
+            entries = json.loads(content).get('chunks', [])
+        except (json.JSONDecodeError, AttributeError):
+            logger.warning(f"Unparseable AI enrichment response for a batch of {size} chunks")
+            return [None] * size
         
-        return chunk
\ No newline at end of file
+        analyses = [None] * size
+        for position, entry in enumerate(entries):
+            if not isinstance(entry, dict):
+                continue
+            index = entry.pop('chunk', position)
+            if isinstance(index, int) and 0 <= index < size:
+                analyses[index] = entry
+        return analyses
+    
+    def _apply_analysis(self, chunk: Dict, analysis: Dict):
+        """Update chunk with AI analysis"""
+        chunk.update({
+            'concept': analysis.get('concept', ''),
+            'difficulty_level': analysis.get('difficulty', chunk['difficulty_level']),
+            'teaching_strategy': analysis.get('teaching_strategy', 'direct_instruction'),
+            'learning_objectives': analysis.get('learning_objectives', []),
+            'common_misconceptions': analysis.get('misconceptions', []),
+            'suggested_analogies': analysis.get('analogies', []),
+            'ai_analyzed': True
+        })
+    
+    def _analyze_with_gpt(self, chunk: Dict) -> Dict:
+        """Analyze chunk with GPT to extract educational metadata"""
+        return self.enrich_chunks([chunk])[0]
@@ -0,0 +1,192 @@
+"""
+Long-lived local embedding model with dynamic micro-batching
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Dict, List, Union
+import numpy as np
+from django.conf import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+LOCAL_EMBEDDING_BACKENDS = ('torch', 'onnx')
+
+
+class LocalEmbeddingService:
+    """
+    A sentence-transformers model loaded once per process and shared by every
+    caller.
+
+    Callers enqueue their texts and block on a future. A single worker thread
+    takes whatever is queued, waits up to ``max_wait`` seconds for more (up to
+    ``max_batch_size`` texts) and encodes the lot in one forward pass, so many
+    small concurrent requests cost a few batched passes instead of one pass
+    each.
+
+    Callers give up after ``timeout`` seconds, so a hung model (OOM, a CUDA
+    error) fails their requests instead of blocking them. If the worker loop
+    dies, the requests it holds are failed and the next call starts a new one.
+
+    The ``onnx`` backend runs the model with ONNX Runtime, by default the
+    int8-quantized export (``onnx_file``); it falls back to torch when ONNX
+    Runtime isn't installed.
+    """
+
+    def __init__(self, model_name: str, backend: str = None, max_batch_size: int = None,
+                 max_wait: float = None, onnx_file: str = None, timeout: float = None):
+        config = getattr(settings, 'VECTOR_DB_CONFIG', {})
+        self.model_name = model_name
+        self.backend = backend or config.get('LOCAL_EMBEDDING_BACKEND', 'torch')
+        if self.backend not in LOCAL_EMBEDDING_BACKENDS:
+            raise ValueError(f"Unknown local embedding backend '{self.backend}', expected one of {LOCAL_EMBEDDING_BACKENDS}")
+        self.max_batch_size = max_batch_size or config.get('LOCAL_EMBEDDING_BATCH_SIZE', 64)
+        self.max_wait = max_wait if max_wait is not None else config.get('LOCAL_EMBEDDING_MAX_WAIT', 0.005)
+        self.onnx_file = onnx_file or config.get('LOCAL_EMBEDDING_ONNX_FILE')
+        self.timeout = timeout if timeout is not None else config.get('LOCAL_EMBEDDING_TIMEOUT', 60)
+
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._worker_lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+        self._queue = None
+
+        self.stats = {'requests': 0, 'texts': 0, 'batches': 0}
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    start_time = time.time()
+                    self._model = self._load_model()
+                    logger.info(f"Loaded local embedding model {self.model_name} ({self.backend}) "
+                                f"in {time.time() - start_time:.2f}s")
+        return self._model
+
+    def _load_model(self):
+        from sentence_transformers import SentenceTransformer
+
+        if self.backend == 'onnx':
+            try:
+                model_kwargs = {'file_name': self.onnx_file} if self.onnx_file else None
+                return SentenceTransformer(self.model_name, backend='onnx', model_kwargs=model_kwargs)
+            except Exception as e:
+                logger.warning(f"ONNX backend unavailable for {self.model_name}, using torch: {e}")
+                self.backend = 'torch'
+        return SentenceTransformer(self.model_name)
+
+    def warm_up(self):
+        """Load the model and run one pass, so the first real request isn't slow"""
+        self.encode(['warm up'])
+
+    def encode(self, texts: Union[str, List[str]]) -> np.ndarray:
+        """Embeddings of the texts (one vector for a single string)"""
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype='float32')
+
+        future = Future()
+        self._get_queue().put((texts, future))
+        try:
+            embeddings = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # Still queued: the worker skips it. Already encoding: the result is dropped
+            future.cancel()
+            raise TimeoutError(f"Local embedding of {len(texts)} texts with {self.model_name} "
+                               f"timed out after {self.timeout}s")
+        return embeddings[0] if single else embeddings
+
+    def _get_queue(self) -> queue.Queue:
+        """The request queue, with its worker thread started in this process"""
+        with self._worker_lock:
+            # Threads don't survive a fork (Celery prefork workers), so start one per process
+            if self._worker is None or self._worker_pid != os.getpid() or not self._worker.is_alive():
+                self._queue = queue.Queue()
+                self._worker = threading.Thread(
+                    target=self._run, args=(self._queue,), daemon=True, name='local-embedding'
+                )
+                self._worker_pid = os.getpid()
+                self._worker.start()
+            return self._queue
+
+    def _run(self, requests: queue.Queue):
+        batch = []
+        try:
+            while True:
+                batch = [requests.get()]
+                count = len(batch[0][0])
+                deadline = time.monotonic() + self.max_wait
+                while count < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(requests.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+                    count += len(batch[-1][0])
+                # Requests whose callers timed out were cancelled
+                batch = [request for request in batch if request[1].set_running_or_notify_cancel()]
+                if batch:
+                    self._encode_batch(batch)
+                batch = []
+        except BaseException as e:
+            logger.error(f"Local embedding worker for {self.model_name} stopped: {e!r}")
+            self._fail_pending(requests, batch, RuntimeError(f"Local embedding worker stopped: {e!r}"))
+
+    def _fail_pending(self, requests: queue.Queue, batch, error: Exception):
+        """Fail the dead worker's batch and everything queued behind it"""
+        with self._worker_lock:
+            # Later calls start a new worker with a new queue
+            if self._queue is requests:
+                self._worker = None
+        while True:
+            try:
+                batch.append(requests.get_nowait())
+            except queue.Empty:
+                break
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    def _encode_batch(self, batch):
+        texts = [text for request_texts, _ in batch for text in request_texts]
+        try:
+            embeddings = self.model.encode(texts, batch_size=self.max_batch_size, convert_to_numpy=True)
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            # Don't fail every caller for one bad request
+            for request in batch:
+                self._encode_batch([request])
+            return
+
+        self.stats['requests'] += len(batch)
+        self.stats['texts'] += len(texts)
+        self.stats['batches'] += 1
+        offset = 0
+        for request_texts, future in batch:
+            future.set_result(embeddings[offset:offset + len(request_texts)])
+            offset += len(request_texts)
+
+
+_services: Dict[str, LocalEmbeddingService] = {}
+_services_lock = threading.Lock()
+
+
+def get_local_embedding_service(model_name: str = None) -> LocalEmbeddingService:
+    """The process-wide service for a model"""
+    model_name = model_name or getattr(settings, 'VECTOR_DB_CONFIG', {}).get('LOCAL_EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+    with _services_lock:
+        service = _services.get(model_name)
+        if service is None:
+            service = _services[model_name] = LocalEmbeddingService(model_name)
+        return service
@@ -0,0 +1,120 @@
+"""
+Cached tokenizers for token-budgeted chunking, embedding batches and prompts
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Dict
+import xxhash
+from django.conf import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Hugging Face repos holding the fast tokenizer of each model
+TOKENIZER_REPOS = {
+    'text-embedding-ada-002': 'Xenova/text-embedding-ada-002',
+    'text-embedding-3-small': 'Xenova/text-embedding-3-small',
+    'gpt-3.5-turbo': 'Xenova/gpt-3.5-turbo',
+    'gpt-4': 'Xenova/gpt-4',
+    'all-MiniLM-L6-v2': 'sentence-transformers/all-MiniLM-L6-v2',
+}
+
+# Characters per token assumed when no tokenizer can be loaded
+CHARS_PER_TOKEN = 4
+
+# Token counts each counter remembers
+COUNT_CACHE_SIZE = 65536
+
+
+class TokenCounter:
+    """
+    Token counting and truncation with one model's tokenizer.
+
+    Uses tiktoken when it's installed and knows the model, otherwise the
+    model's Hugging Face fast tokenizer, otherwise an estimate of
+    ``CHARS_PER_TOKEN`` characters per token (offline hosts). Tokenizer
+    counts are memoized by a hash of the text, since the splitter measures
+    the same pieces repeatedly; keying on the texts themselves would keep
+    every measured document alive.
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+        self.backend, self._tokenizer = self._load()
+        self._counts: 'OrderedDict[int, int]' = OrderedDict()
+        self._counts_lock = threading.Lock()
+
+    def _load(self):
+        try:
+            import tiktoken
+            return 'tiktoken', tiktoken.encoding_for_model(self.model)
+        except (ImportError, KeyError):
+            pass
+
+        repo = TOKENIZER_REPOS.get(self.model)
+        if repo:
+            try:
+                from tokenizers import Tokenizer
+                tokenizer = Tokenizer.from_pretrained(repo)
+                tokenizer.no_truncation()
+                tokenizer.no_padding()
+                return 'huggingface', tokenizer
+            except Exception as e:
+                logger.warning(f"No tokenizer for {self.model}, estimating token counts: {e}")
+        return 'estimate', None
+
+    def count(self, text: str) -> int:
+        """Tokens in the text"""
+        if not text or self.backend == 'estimate':
+            return self._count(text)
+
+        key = xxhash.xxh3_64_intdigest(text.encode('utf-8'))
+        with self._counts_lock:
+            count = self._counts.get(key)
+            if count is not None:
+                self._counts.move_to_end(key)
+                return count
+
+        count = self._count(text)
+        with self._counts_lock:
+            self._counts[key] = count
+            while len(self._counts) > COUNT_CACHE_SIZE:
+                self._counts.popitem(last=False)
+        return count
+
+    def _count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.backend == 'tiktoken':
+            return len(self._tokenizer.encode(text, disallowed_special=()))
+        if self.backend == 'huggingface':
+            return len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+        return -(-len(text) // CHARS_PER_TOKEN)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """The longest prefix of the text within ``max_tokens`` tokens"""
+        if not text or self.count(text) <= max_tokens:
+            return text or ''
+        if max_tokens <= 0:
+            return ''
+        if self.backend == 'tiktoken':
+            return self._tokenizer.decode(self._tokenizer.encode(text, disallowed_special=())[:max_tokens])
+        if self.backend == 'huggingface':
+            offsets = self._tokenizer.encode(text, add_special_tokens=False).offsets
+            return text[:offsets[max_tokens - 1][1]]
+        return text[:max_tokens * CHARS_PER_TOKEN]
+
+
+_counters: Dict[str, TokenCounter] = {}
+_counters_lock = threading.Lock()
+
+
+def get_token_counter(model: str = None) -> TokenCounter:
+    """The process-wide token counter for a model (default: the prompt model)"""
+    model = model or getattr(settings, 'VECTOR_DB_CONFIG', {}).get('PROMPT_MODEL', 'gpt-3.5-turbo')
+    with _counters_lock:
+        counter = _counters.get(model)
+        if counter is None:
+            counter = _counters[model] = TokenCounter(model)
+        return counter
@@ -7,19 +7,42 @@ from django.utils import timezone
 from django.db import transaction
 import openai
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.embeddings import OpenAIEmbeddings
-import numpy as np
 
 from courses.models import CourseSource, AIKnowledgeChunk, CourseImportJob, AIKnowledgeGraph
+from courses.processors.embedding_generator import EmbeddingGenerator
+from courses.vector_db.embedding_codec import encode_embedding
+from courses.vector_db.manager import VectorDBManager
+from courses.vector_db.query_embedding import embed_query
+from courses.processors.enrichment_cache import enrichment_cache, prompt_version
+
+EXTRACTION_MODEL = "gpt-4"
+EXTRACTION_SYSTEM_PROMPT = "You are an educational content analyzer."
+EXTRACTION_PROMPT = """
+        Analyze this educational content and extract structured knowledge chunks:
+        
+        Content: {text}
+        
+        Extract knowledge chunks with:
+        1. Title
+        2. Content (concise explanation)
+        3. Content type (concept, example, problem, definition, analogy, quiz, summary)
+        4. Difficulty level (beginner, intermediate, advanced)
+        5. Subject
+        6. Topic
+        7. Subtopics (list)
+        8. Suggested teaching strategy
+        
+        Return as JSON list.
+        """
+# Cached extractions are keyed by this, so editing the prompt only invalidates its own results
+EXTRACTION_PROMPT_VERSION = prompt_version(EXTRACTION_SYSTEM_PROMPT, EXTRACTION_PROMPT)
 
 class AICourseTrainingPipeline:
     """Pipeline to process courses and train the AI knowledge base"""
     
     def __init__(self):
-        self.embeddings = OpenAIEmbeddings(
-            openai_api_key=settings.OPENAI_API_KEY,
-            model="text-embedding-ada-002"
-        )
+        # Embeds with the live model of the knowledge collection, like course imports
+        self.embedding_generator = EmbeddingGenerator()
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000,
             chunk_overlap=200,
@@ -81,6 +104,10 @@ class AICourseTrainingPipeline:
         with transaction.atomic():
             saved_chunks = []
             for chunk_data in chunks_with_embeddings:
+                embedding_bytes, embedding_dtype, embedding_dimensions = None, '', 1536
+                if chunk_data.get('embedding'):
+                    embedding_bytes, embedding_dtype, embedding_dimensions = encode_embedding(chunk_data['embedding'])
+                
                 chunk = AIKnowledgeChunk.objects.create(
                     title=chunk_data['title'],
                     content=chunk_data['content'],
@@ -93,8 +120,10 @@ class AICourseTrainingPipeline:
                     source=job.source,
                     source_url=job.source_url,
                     source_metadata=chunk_data.get('metadata', {}),
-                    embedding=chunk_data['embedding'].tobytes() if chunk_data.get('embedding') else None,
-                    embedding_model='text-embedding-ada-002',
+                    embedding=embedding_bytes,
+                    embedding_dtype=embedding_dtype,
+                    embedding_dimensions=embedding_dimensions,
+                    embedding_model=chunk_data.get('embedding_model') or '',
                     embedding_generated_at=timezone.now(),
                 )
                 saved_chunks.append(chunk)
@@ -115,36 +144,24 @@ class AICourseTrainingPipeline:
         chunks = []
         
         # Use AI to identify and structure knowledge
-        prompt = f"""
-        Analyze this educational content and extract structured knowledge chunks:
-        
-        Content: {content.get('text', '')[:5000]}
-        
-        Extract knowledge chunks with:
-        1. Title
-        2. Content (concise explanation)
-        3. Content type (concept, example, problem, definition, analogy, quiz, summary)
-        4. Difficulty level (beginner, intermediate, advanced)
-        5. Subject
-        6. Topic
-        7. Subtopics (list)
-        8. Suggested teaching strategy
-        
-        Return as JSON list.
-        """
+        text = content.get('text', '')[:5000]
         
         try:
-            response = openai.ChatCompletion.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are an educational content analyzer."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3
-            )
-            
-            # Parse AI response
-            extracted_data = json.loads(response.choices[0].message.content)
+            # Retries and re-imports of the same text reuse the earlier extraction
+            extracted_data = enrichment_cache.get(EXTRACTION_PROMPT_VERSION, EXTRACTION_MODEL, text)
+            cached = extracted_data is not None
+            if not cached:
+                response = openai.ChatCompletion.create(
+                    model=EXTRACTION_MODEL,
+                    messages=[
+                        {"role": "system", "content": EXTRACTION_SYSTEM_PROMPT},
+                        {"role": "user", "content": EXTRACTION_PROMPT.format(text=text)}
+                    ],
+                    temperature=0.3
+                )
+                
+                # Parse AI response
+                extracted_data = json.loads(response.choices[0].message.content)
             
             for item in extracted_data:
                 chunks.append({
@@ -158,10 +175,14 @@ class AICourseTrainingPipeline:
                     'teaching_strategy': item.get('teaching_strategy', 'direct_instruction'),
                     'metadata': {
                         'source': source.name,
-                        'extracted_by': 'gpt-4',
+                        'extracted_by': EXTRACTION_MODEL,
                         'original_title': content.get('title', '')
                     }
                 })
+            
+            # Cached once it's known to parse into chunks
+            if not cached:
+                enrichment_cache.set(EXTRACTION_PROMPT_VERSION, EXTRACTION_MODEL, text, extracted_data)
                 
         except Exception as e:
             # Fallback to simple text splitting
@@ -186,21 +207,8 @@ class AICourseTrainingPipeline:
     def _generate_embeddings(self, chunks: List[Dict]) -> List[Dict]:
         """Generate embeddings for knowledge chunks"""
         
-        texts = [chunk['content'] for chunk in chunks]
-        
-        try:
-            # Generate embeddings in batches
-            embeddings = self.embeddings.embed_documents(texts)
-            
-            for i, chunk in enumerate(chunks):
-                if i < len(embeddings):
-                    chunk['embedding'] = np.array(embeddings[i])
-            
-        except Exception as e:
-            print(f"Embedding generation failed: {e}")
-            # Chunks will be stored without embeddings initially
-        
-        return chunks
+        # Records the model on each chunk; ones that fail are stored without an embedding
+        return self.embedding_generator.generate_embeddings(chunks)
     
     def _build_knowledge_graph(self, chunks: List[AIKnowledgeChunk]):
         """Build relationships between knowledge chunks"""
@@ -255,26 +263,20 @@ class AICourseTrainingPipeline:
 class AIModelTrainer:
     """Train AI models on the knowledge base"""
     
-    def __init__(self):
-        self.knowledge_base = []
-        
+    def __init__(self, vector_db: VectorDBManager = None):
+        # Retrieval runs on the shared vector and keyword indexes,
+        # so nothing is loaded per trainer
+        self._vector_db = vector_db
+    
+    @property
+    def vector_db(self) -> VectorDBManager:
+        if self._vector_db is None:
+            self._vector_db = VectorDBManager()
+        return self._vector_db
+    
     def load_knowledge_base(self):
-        """Load all knowledge chunks for training"""
-        chunks = AIKnowledgeChunk.objects.all().select_related('source')
-        
-        for chunk in chunks:
-            self.knowledge_base.append({
-                'id': str(chunk.id),
-                'title': chunk.title,
-                'content': chunk.content,
-                'content_type': chunk.content_type,
-                'difficulty': chunk.difficulty_level,
-                'subject': chunk.subject,
-                'topic': chunk.topic,
-                'embedding': np.frombuffer(chunk.embedding) if chunk.embedding else None
-            })
-        
-        return len(self.knowledge_base)
+        """Number of knowledge chunks available (they're searched in place, not loaded)"""
+        return AIKnowledgeChunk.objects.count()
     
     def train_teaching_strategy_model(self):
         """Train model to select optimal teaching strategies"""
@@ -283,37 +285,42 @@ class AIModelTrainer:
         pass
     
     def find_relevant_knowledge(self, query: str, subject: str = None, 
-                                difficulty: str = 'beginner', limit: int = 10) -> List[Dict]:
+                                difficulty: str = 'beginner', limit: int = 10,
+                                query_embedding: List[float] = None) -> List[Dict]:
         """Find relevant knowledge chunks for a query"""
         
-        if not self.knowledge_base:
-            self.load_knowledge_base()
+        if query_embedding is None:
+            query_embedding = embed_query(query, model=self.vector_db.embedding_model)
         
-        # Simple keyword matching (would be replaced with vector search)
-        query_lower = query.lower()
-        relevant = []
+        # Hybrid keyword + vector search over the shared indexes; subject and
+        # difficulty only boost matching chunks, as before
+        results = self.vector_db.hybrid_search(query, query_embedding, limit=limit * 3)
         
-        for chunk in self.knowledge_base:
-            score = 0
+        relevant = []
+        for result in results:
+            metadata = result['metadata']
+            score = result.get('rrf_score', 0.0)
             
-            # Keyword matching
-            if query_lower in chunk['content'].lower():
-                score += 2
-            if query_lower in chunk['title'].lower():
-                score += 3
-            if subject and subject.lower() in chunk['subject'].lower():
-                score += 1
-            if difficulty == chunk['difficulty']:
-                score += 1
+            if subject and subject.lower() in (metadata.get('subject') or '').lower():
+                score *= 1.25
+            if difficulty and difficulty == (metadata.get('difficulty_level') or '').lower():
+                score *= 1.25
             
-            if score > 0:
-                relevant.append({
-                    'chunk': chunk,
-                    'score': score,
-                    'relevance': 'keyword'
-                })
+            relevant.append({
+                'chunk': {
+                    'id': result['id'],
+                    'title': metadata.get('title', ''),
+                    'content': result['content'],
+                    'content_type': metadata.get('content_type'),
+                    'difficulty': metadata.get('difficulty_level'),
+                    'subject': metadata.get('subject'),
+                    'topic': metadata.get('topic')
+                },
+                'score': score,
+                'relevance': 'hybrid'
+            })
         
         # Sort by score
         relevant.sort(key=lambda x: x['score'], reverse=True)
         
-        return relevant[:limit]
\ No newline at end of file
+        return relevant[:limit]
@@ -1,7 +1,14 @@
-from django.db.models.signals import post_save, pre_save
+from django.db import transaction
+from django.db.models.signals import post_save, pre_save, post_delete
 from django.dispatch import receiver
 from django.utils.text import slugify
-from .models import Course, Module, Lesson
+import logging
+from .models import Course, Module, Lesson, AIKnowledgeChunk
+from .vector_db.content_store import chunk_content_store
+from .vector_db.keyword_index import keyword_index
+from .vector_db.minhash_index import minhash_index
+
+logger = logging.getLogger(__name__)
 
 @receiver(pre_save, sender=Course)
 def generate_course_slug(sender, instance, **kwargs):
@@ -37,4 +44,52 @@ def update_course_stats(sender, instance, created, **kwargs):
         instance.total_lessons = total_lessons
         
         # Don't call save() here to avoid infinite recursion
-        # This will be updated when the course is saved again
\ No newline at end of file
+        # This will be updated when the course is saved again
+
+@receiver(post_save, sender=AIKnowledgeChunk)
+@receiver(post_delete, sender=AIKnowledgeChunk)
+def invalidate_chunk_content(sender, instance, **kwargs):
+    """Drop cached content so vector search hits see the saved chunk"""
+    chunk_content_store.invalidate(instance.id)
+
+@receiver(post_save, sender=AIKnowledgeChunk)
+def index_chunk_keywords(sender, instance, **kwargs):
+    """Keep the BM25 keyword index in sync once the chunk is committed"""
+    def update():
+        try:
+            keyword_index.add_chunk(instance)
+        except Exception as e:
+            logger.error(f"Failed to update keyword index for chunk {instance.id}: {e}")
+    transaction.on_commit(update)
+
+@receiver(post_delete, sender=AIKnowledgeChunk)
+def unindex_chunk_keywords(sender, instance, **kwargs):
+    """Drop a deleted chunk from the BM25 keyword index"""
+    chunk_id = instance.id
+    def update():
+        try:
+            keyword_index.remove_chunks([chunk_id])
+        except Exception as e:
+            logger.error(f"Failed to remove chunk {chunk_id} from keyword index: {e}")
+    transaction.on_commit(update)
+
+@receiver(post_save, sender=AIKnowledgeChunk)
+def index_chunk_signature(sender, instance, **kwargs):
+    """Keep the MinHash near-duplicate index in sync once the chunk is committed"""
+    def update():
+        try:
+            minhash_index.add_chunk(instance)
+        except Exception as e:
+            logger.error(f"Failed to update MinHash index for chunk {instance.id}: {e}")
+    transaction.on_commit(update)
+
+@receiver(post_delete, sender=AIKnowledgeChunk)
+def unindex_chunk_signature(sender, instance, **kwargs):
+    """Drop a deleted chunk from the MinHash near-duplicate index"""
+    chunk_id = instance.id
+    def update():
+        try:
+            minhash_index.remove_chunks([chunk_id])
+        except Exception as e:
+            logger.error(f"Failed to remove chunk {chunk_id} from MinHash index: {e}")
+    transaction.on_commit(update)
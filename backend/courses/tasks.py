@@ -1,25 +1,46 @@
 from celery import shared_task
 from celery.utils.log import get_task_logger
+from django.conf import settings
 from django.utils import timezone
 from django.db import transaction
+from django.db.models import Q
+from contextlib import nullcontext
+import numpy as np
 import time
 
-from .models import CourseSource, CourseImportJob, AIKnowledgeChunk
+from .models import CourseSource, CourseImportJob, ContentFingerprint, AIKnowledgeChunk
 from .extractors.khan_academy import KhanAcademyExtractor
 from .extractors.youtube_educational import YouTubeEducationalExtractor
 from .processors.knowledge_chunker import KnowledgeChunker
 from .processors.embedding_generator import EmbeddingGenerator
-from .vector_db.manager import VectorDBManager
+from .processors.deduplicator import ChunkDeduplicator
+from .processors.import_artifacts import import_artifacts
+from .vector_db.manager import VectorDBManager, VectorQuotaExceeded
+from .vector_db.embedding_codec import encode_embedding, decode_chunk_embedding
+from .vector_db.keyword_index import keyword_index
+from .vector_db.minhash_index import minhash_index
+from .vector_db.embedding_models import embedding_models, DEFAULT_COLLECTION
+from .vector_db.registry import vector_index_registry
 
 logger = get_task_logger(__name__)
 
+# Job fields that the time spent in a stage is also recorded into
+STAGE_TIME_FIELDS = {'enrich': 'ai_analysis_time', 'embed': 'embedding_time'}
+
 @shared_task(bind=True, max_retries=3)
-def import_course_from_url(self, source_url: str, source_type: str, user_id: int = None):
-    """Celery task to import course from URL"""
+def import_course_from_url(self, source_url: str, source_type: str, user_id: int = None,
+                           school_id: int = None):
+    """
+    Celery task to import course from URL (into a school's private collection if school_id is given).
+    
+    Runs as the stages in CourseImportJob.STAGE_CHOICES, checkpointing each one's output, so a
+    retry (which keeps the task id) resumes the job at its first incomplete stage.
+    """
     
     # Create import job record
     source, created = CourseSource.objects.get_or_create(
         base_url=source_url,
+        school_id=school_id,
         defaults={
             'name': source_type,
             'source_type': source_type,
@@ -27,63 +48,146 @@ def import_course_from_url(self, source_url: str, source_type: str, user_id: int
         }
     )
     
-    job = CourseImportJob.objects.create(
-        source=source,
-        source_url=source_url,
+    job, job_created = CourseImportJob.objects.get_or_create(
         job_id=self.request.id,
-        status='processing',
-        started_at=timezone.now()
+        defaults={
+            'source': source,
+            'source_url': source_url,
+            'initiated_by_id': user_id,
+            'status': 'processing',
+            'started_at': timezone.now()
+        }
     )
+    if not job_created:
+        _resume_job(job)
     
     try:
         # Step 1: Extract content
-        logger.info(f"Starting extraction for {source_url}")
-        job.status = 'extracting'
-        job.save()
+        def extract():
+            logger.info(f"Starting extraction for {source_url}")
+            
+            extractor = None
+            if source_type == 'khan_academy':
+                extractor = KhanAcademyExtractor(source_url)
+            elif source_type in ['youtube', 'youtube_educational']:
+                extractor = YouTubeEducationalExtractor(source_url)
+            else:
+                # Try generic extractor
+                extractor = KhanAcademyExtractor(source_url)  # Fallback
+            
+            if not extractor.validate_source():
+                raise ValueError(f"Invalid source URL: {source_url}")
+            
+            return extractor.extract_course_content()
         
-        extractor = None
-        if source_type == 'khan_academy':
-            extractor = KhanAcademyExtractor(source_url)
-        elif source_type in ['youtube', 'youtube_educational']:
-            extractor = YouTubeEducationalExtractor(source_url)
-        else:
-            # Try generic extractor
-            extractor = KhanAcademyExtractor(source_url)  # Fallback
+        course_data = _run_stage(job, 'extract', extract, status='extracting')
         
-        if not extractor.validate_source():
-            raise ValueError(f"Invalid source URL: {source_url}")
+        chunker = KnowledgeChunker(requests_per_minute=source.requests_per_minute)
         
-        course_data = extractor.extract_course_content()
+        # Step 2: Split the new and changed content into knowledge chunks
+        def chunk():
+            # Only lessons/segments that are new or changed since the last import are processed
+            units = chunker.content_units(course_data)
+            stored = {} if created else {
+                fingerprint.unit_key: fingerprint for fingerprint in ContentFingerprint.objects.filter(source=source)
+            }
+            changed = [
+                unit for unit in units
+                if unit['key'] not in stored
+                or stored[unit['key']].is_removed
+                or stored[unit['key']].fingerprint != unit['fingerprint']
+            ]
+            unit_keys = {unit['key'] for unit in units}
+            removed = [fingerprint for key, fingerprint in stored.items()
+                       if key not in unit_keys and not fingerprint.is_removed]
+            
+            job.units_changed = len(changed)
+            job.units_unchanged = len(units) - len(changed)
+            job.units_removed = len(removed)
+            logger.info(f"{len(units)} lessons/segments: {job.units_changed} new or changed, "
+                        f"{job.units_unchanged} unchanged, {job.units_removed} removed")
+            
+            # Chunks of changed and removed units are replaced, as are chunks
+            # imported before fingerprinting (no unit)
+            replaced_units = [unit['key'] for unit in changed] + [fingerprint.unit_key for fingerprint in removed]
+            replaced_ids = [] if created or not (changed or removed) else [
+                str(chunk_id) for chunk_id in
+                AIKnowledgeChunk.objects.filter(source=source)
+                .filter(Q(content_unit__in=replaced_units) | Q(content_unit=''))
+                .values_list('id', flat=True)
+            ]
+            
+            knowledge_chunks = chunker.chunk_course_content(course_data, units={unit['key'] for unit in changed})
+            job.total_chunks_extracted = len(knowledge_chunks)
+            
+            return {
+                'changed': [{key: value for key, value in unit.items() if key != 'item'} for unit in changed],
+                'removed': [fingerprint.pk for fingerprint in removed],
+                'replaced_ids': replaced_ids,
+                'chunks': knowledge_chunks,
+            }
         
-        # Step 2: Process into knowledge chunks
-        logger.info(f"Processing {len(course_data.get('lessons', []))} lessons")
-        job.status = 'processing'
-        job.save()
+        plan = _run_stage(job, 'chunk', chunk)
+        changed, removed, replaced_ids = plan['changed'], plan['removed'], plan['replaced_ids']
         
-        chunker = KnowledgeChunker()
-        knowledge_chunks = chunker.process_course_content(course_data)
+        if not changed and not removed:
+            _complete_job(job)
+            logger.info(f"No changes in {source_url} since the last import")
+            return {
+                'job_id': self.request.id,
+                'source_url': source_url,
+                'chunks_extracted': 0,
+                'status': 'completed'
+            }
         
-        job.total_chunks_extracted = len(knowledge_chunks)
-        job.save()
+        # Step 3: Enrich chunks with AI analysis
+        def enrich():
+            knowledge_chunks = chunker.enrich_chunks(plan['chunks'])
+            job.enrichment_cache_hits = chunker.enrichment_cache_hits
+            job.enrichment_cache_misses = chunker.enrichment_cache_misses
+            logger.info(f"Enrichment cache: {job.enrichment_cache_hits} hits, {job.enrichment_cache_misses} misses")
+            return knowledge_chunks
         
-        # Step 3: Generate embeddings
-        logger.info(f"Generating embeddings for {len(knowledge_chunks)} chunks")
-        job.status = 'embedding'
-        job.save()
+        knowledge_chunks = _run_stage(job, 'enrich', enrich)
         
-        embedding_generator = EmbeddingGenerator()
-        chunks_with_embeddings = embedding_generator.generate_embeddings(knowledge_chunks)
+        vector_db = VectorDBManager(school=source.school)
         
-        # Step 4: Save to database
-        logger.info("Saving chunks to database")
+        # Step 4: Generate embeddings
+        def embed():
+            # Drop near-duplicates of stored chunks and of each other before paying for embeddings
+            deduplicator = ChunkDeduplicator(source, replacing=replaced_ids)
+            unique_chunks = deduplicator.drop_text_duplicates(knowledge_chunks)
+            job.near_duplicates_skipped = deduplicator.near_duplicates
+            
+            logger.info(f"Generating embeddings for {len(unique_chunks)} chunks")
+            embedding_generator = EmbeddingGenerator(requests_per_minute=source.requests_per_minute)
+            chunks_with_embeddings = embedding_generator.generate_embeddings(unique_chunks)
+            job.chunks_with_embeddings = sum(1 for chunk in chunks_with_embeddings if chunk.get('embedding'))
+            job.embedding_cache_hits = embedding_generator.cache_hits
+            job.embedding_cache_misses = embedding_generator.cache_misses
+            logger.info(f"Embedding cache: {job.embedding_cache_hits} hits, {job.embedding_cache_misses} misses")
+            
+            chunks_with_embeddings = deduplicator.drop_semantic_duplicates(chunks_with_embeddings, vector_db)
+            job.semantic_duplicates_skipped = deduplicator.semantic_duplicates
+            logger.info(f"Skipped {job.near_duplicates_skipped} near-duplicate and "
+                        f"{job.semantic_duplicates_skipped} semantically duplicate chunks")
+            return chunks_with_embeddings
         
-        saved_chunks = []
-        with transaction.atomic():
+        chunks_with_embeddings = _run_stage(job, 'embed', embed, status='embedding', pack=_pack_embeddings)
+        
+        # Step 5: Save to database
+        def save():
+            logger.info("Saving chunks to database")
+            
+            if replaced_ids:
+                AIKnowledgeChunk.objects.filter(id__in=replaced_ids).delete()
+            
+            saved_ids = []
             for chunk_data in chunks_with_embeddings:
-                # Convert embedding to bytes for storage
-                embedding_bytes = None
+                # Encode embedding for storage (VECTOR_DB_CONFIG['EMBEDDING_STORAGE_DTYPE'])
+                embedding_bytes, embedding_dtype, embedding_dimensions = None, '', 1536
                 if chunk_data.get('embedding'):
-                    embedding_bytes = np.array(chunk_data['embedding']).tobytes()
+                    embedding_bytes, embedding_dtype, embedding_dimensions = encode_embedding(chunk_data['embedding'])
                 
                 # Create knowledge chunk
                 chunk = AIKnowledgeChunk.objects.create(
@@ -103,45 +207,42 @@ def import_course_from_url(self, source_url: str, source_type: str, user_id: int
                     source_url=source_url,
                     source_metadata=chunk_data.get('source_metadata', {}),
                     embedding=embedding_bytes,
-                    embedding_model=chunk_data.get('embedding_model'),
+                    embedding_dtype=embedding_dtype,
+                    embedding_dimensions=embedding_dimensions,
+                    embedding_model=chunk_data.get('embedding_model') or '',
                     embedding_generated_at=timezone.now(),
+                    token_count=chunk_data.get('token_count', 0),
+                    content_unit=chunk_data.get('content_unit', ''),
                     ai_analyzed=chunk_data.get('ai_analyzed', False)
                 )
-                saved_chunks.append(chunk)
-        
-        # Step 5: Add to vector database
-        logger.info("Adding chunks to vector database")
+                saved_ids.append(str(chunk.id))
+            return saved_ids
         
-        vector_db = VectorDBManager()
+        # Saved in the same transaction as its checkpoint, so chunks are never saved twice
+        saved_ids = _run_stage(job, 'save', save, atomic=True)
+        saved_chunks = list(AIKnowledgeChunk.objects.filter(id__in=saved_ids).select_related('source'))
         
-        # Prepare chunks for vector DB
-        vector_chunks = []
-        for chunk in saved_chunks:
-            vector_chunk = {
-                'id': str(chunk.id),
-                'title': chunk.title,
-                'content': chunk.content,
-                'content_type': chunk.content_type,
-                'difficulty_level': chunk.difficulty_level,
-                'subject': chunk.subject,
-                'topic': chunk.topic,
-                'subtopics': chunk.subtopics,
-                'concept': chunk.concept,
-                'teaching_strategy': chunk.teaching_strategy,
-                'source_metadata': {
-                    'source': source.name,
-                    'source_url': source_url
-                },
-                'embedding': np.frombuffer(chunk.embedding) if chunk.embedding else None
-            }
-            vector_chunks.append(vector_chunk)
+        # Step 6: Add to vector database
+        def index():
+            logger.info("Adding chunks to vector database")
+            
+            if replaced_ids:
+                vector_db.delete_chunks(replaced_ids)
+            
+            vector_chunks = [_vector_chunk(chunk) for chunk in saved_chunks]
+            vector_db.add_knowledge_chunks(vector_chunks)
+            
+            # Recorded last, so a failure before this point re-processes the units on the next import
+            _record_fingerprints(source, changed, removed, saved_chunks)
+            return len(vector_chunks)
         
-        vector_db.add_knowledge_chunks(vector_chunks)
+        try:
+            _run_stage(job, 'index', index)
+        finally:
+            vector_db.close()
         
-        # Step 6: Update job status
-        job.status = 'completed'
-        job.completed_at = timezone.now()
-        job.save()
+        # Step 7: Update job status
+        _complete_job(job)
         
         logger.info(f"Successfully imported course from {source_url}")
         
@@ -153,17 +254,30 @@ def import_course_from_url(self, source_url: str, source_type: str, user_id: int
         }
         
     except Exception as e:
-        logger.error(f"Import failed: {e}")
+        logger.error(f"Import failed after stage '{job.stage or 'none'}': {e}")
         job.status = 'failed'
         job.error_message = str(e)
         job.save()
         
-        # Retry logic
-        if self.request.retries < self.max_retries:
+        # Retry logic (a full school collection won't have room on retry either)
+        if self.request.retries < self.max_retries and not isinstance(e, VectorQuotaExceeded):
             raise self.retry(exc=e, countdown=60 * (2 ** self.request.retries))
         else:
             raise
 
+@shared_task
+def retry_import_job(job_pk: int):
+    """Re-run a failed import job, resuming at its first incomplete stage"""
+    
+    job = CourseImportJob.objects.select_related('source').get(pk=job_pk)
+    import_course_from_url.apply_async(
+        args=[job.source_url, job.source.source_type],
+        kwargs={'user_id': job.initiated_by_id, 'school_id': job.source.school_id},
+        task_id=job.job_id
+    )
+    logger.info(f"Queued retry of import job {job.job_id} after stage '{job.stage or 'none'}'")
+    return job.job_id
+
 @shared_task
 def sync_popular_courses():
     """Periodic task to sync popular courses"""
@@ -215,60 +329,332 @@ def cleanup_old_import_jobs(days_old: int = 7):
         completed_at__lt=cutoff_date
     ).delete()
     
+    # Jobs that failed that long ago won't be resumed; their stage artifacts go
+    stale_jobs = CourseImportJob.objects.filter(status='failed', updated_at__lt=cutoff_date).exclude(artifacts={})
+    for job in stale_jobs:
+        import_artifacts.delete_job(job.job_id)
+        job.artifacts = {}
+        job.save(update_fields=['artifacts'])
+    
     logger.info(f"Cleaned up {deleted_count} old import jobs")
     return deleted_count
 
+def _resume_job(job: CourseImportJob):
+    """Reset a failed job for another run, keeping the checkpoints whose artifacts are still stored"""
+    stages = [choice[0] for choice in CourseImportJob.STAGE_CHOICES]
+    completed = stages[:stages.index(job.stage) + 1] if job.stage else []
+    kept = []
+    for stage in completed:
+        if stage not in job.artifacts or not import_artifacts.exists(job.artifacts[stage]):
+            break
+        kept.append(stage)
+    if len(kept) < len(completed):
+        logger.warning(f"Import job {job.job_id} is missing the {completed[len(kept)]} artifact, "
+                       f"re-running from there")
+    
+    job.stage = kept[-1] if kept else ''
+    job.artifacts = {stage: job.artifacts[stage] for stage in kept}
+    job.status = 'processing'
+    job.error_message = ''
+    job.completed_at = None
+    job.save()
+    logger.info(f"Resuming import job {job.job_id} after stage '{job.stage or 'none'}'")
+
+def _run_stage(job: CourseImportJob, stage: str, run, status: str = 'processing', atomic: bool = False,
+               pack=None):
+    """
+    Output of an import stage: loaded from its checkpoint when the job already got
+    past it, otherwise run, checkpointed, and timed into ``job.stage_times``.
+    ``pack`` converts the output for storage; ``atomic`` runs the stage in the
+    transaction that records its checkpoint.
+    """
+    if job.has_completed_stage(stage):
+        logger.info(f"Reusing the {stage} checkpoint of import job {job.job_id}")
+        return import_artifacts.load(job.artifacts[stage])
+    
+    job.status = status
+    job.save()
+    
+    with transaction.atomic() if atomic else nullcontext():
+        start_time = time.time()
+        output = run()
+        elapsed = time.time() - start_time
+        
+        job.artifacts[stage] = import_artifacts.save(job.job_id, stage, pack(output) if pack else output)
+        job.stage_times[stage] = elapsed
+        if stage in STAGE_TIME_FIELDS:
+            setattr(job, STAGE_TIME_FIELDS[stage], elapsed)
+        job.stage = stage
+        job.save()
+    
+    logger.info(f"Import job {job.job_id} finished stage {stage} in {elapsed:.1f}s")
+    return output
+
+def _pack_embeddings(chunks: list) -> list:
+    """Chunks with float32 embeddings, half the size of msgpack's float64 in the checkpoint"""
+    return [
+        {**chunk, 'embedding': np.asarray(chunk['embedding'], dtype='float32')} if chunk.get('embedding') else chunk
+        for chunk in chunks
+    ]
+
+def _complete_job(job: CourseImportJob):
+    """Mark a job completed, dropping its stage artifacts (the checkpoint history stays on the job)"""
+    import_artifacts.delete_job(job.job_id)
+    job.artifacts = {}
+    job.status = 'completed'
+    job.completed_at = timezone.now()
+    job.save()
+
+def _record_fingerprints(source: CourseSource, changed: list, removed: list, saved_chunks: list):
+    """Store the fingerprints of re-processed content units and tombstone removed ones (by pk)"""
+    counts = {}
+    unembedded = set()
+    for chunk in saved_chunks:
+        counts[chunk.content_unit] = counts.get(chunk.content_unit, 0) + 1
+        if chunk.embedding is None:
+            unembedded.add(chunk.content_unit)
+    
+    for unit in changed:
+        ContentFingerprint.objects.update_or_create(
+            source=source,
+            unit_key=unit['key'],
+            defaults={
+                'unit_title': unit['title'][:200],
+                # A unit with chunks left unembedded is re-processed by the next import
+                'fingerprint': '' if unit['key'] in unembedded else unit['fingerprint'],
+                'chunk_count': counts.get(unit['key'], 0),
+                'removed_at': None,
+            }
+        )
+    
+    ContentFingerprint.objects.filter(pk__in=removed).update(
+        removed_at=timezone.now(), chunk_count=0
+    )
+
+def _vector_chunk(chunk: AIKnowledgeChunk) -> dict:
+    """Vector DB payload of a saved knowledge chunk"""
+    return {
+        'id': str(chunk.id),
+        'title': chunk.title,
+        'content': chunk.content,
+        'content_type': chunk.content_type,
+        'difficulty_level': chunk.difficulty_level,
+        'subject': chunk.subject,
+        'topic': chunk.topic,
+        'subtopics': chunk.subtopics,
+        'concept': chunk.concept,
+        'teaching_strategy': chunk.teaching_strategy,
+        'source_metadata': {
+            'source': chunk.source.name if chunk.source else 'unknown',
+            'source_id': str(chunk.source_id) if chunk.source_id else None,
+            'source_url': chunk.source_url
+        },
+        'embedding': decode_chunk_embedding(chunk),
+        'embedding_model': chunk.embedding_model,
+    }
+
+def _build_index_generation(model: str, generation: int, batch_size: int = 500) -> int:
+    """
+    Index every knowledge chunk into a new (model, generation) of the knowledge
+    collection, alongside the live one. Stored embeddings made by the model are
+    reused and the rest are re-embedded (and saved). Chunks imported or deleted
+    meanwhile are caught up before returning.
+    """
+    managers = {}
+    indexed, failed = set(), set()
+    generator = None
+    
+    def manager_for(school):
+        key = school.pk if school is not None else None
+        if key not in managers:
+            managers[key] = VectorDBManager(school=school, embedding_model=model, generation=generation)
+        return managers[key]
+    
+    def has_embedding(chunk):
+        return bool(chunk.embedding) and embedding_models.canonical_name(chunk.embedding_model) == model
+    
+    def index_batch(chunks):
+        nonlocal generator
+        stale = [chunk for chunk in chunks if not has_embedding(chunk)]
+        if stale:
+            generator = generator or EmbeddingGenerator(model=model)
+            embedded = generator.generate_embeddings([
+                {
+                    'title': chunk.title,
+                    'content': chunk.content,
+                    'concept': chunk.concept,
+                    'learning_objectives': chunk.learning_objectives,
+                    'subtopics': chunk.subtopics,
+                }
+                for chunk in stale
+            ])
+            now = timezone.now()
+            updated = []
+            for chunk, chunk_data in zip(stale, embedded):
+                if chunk_data['embedding'] is None:
+                    continue
+                chunk.embedding, chunk.embedding_dtype, chunk.embedding_dimensions = encode_embedding(chunk_data['embedding'])
+                chunk.embedding_model = model
+                chunk.embedding_generated_at = now
+                updated.append(chunk)
+            AIKnowledgeChunk.objects.bulk_update(
+                updated, ['embedding', 'embedding_dtype', 'embedding_dimensions', 'embedding_model', 'embedding_generated_at']
+            )
+        
+        by_school = {}
+        for chunk in chunks:
+            if has_embedding(chunk):
+                school = chunk.source.school if chunk.source_id else None
+                by_school.setdefault(school.pk if school else None, (school, []))[1].append(chunk)
+            else:
+                failed.add(str(chunk.id))
+        
+        for school, school_chunks in by_school.values():
+            chunk_ids = [str(chunk.id) for chunk in school_chunks]
+            try:
+                manager_for(school).add_knowledge_chunks([_vector_chunk(chunk) for chunk in school_chunks])
+                indexed.update(chunk_ids)
+            except VectorQuotaExceeded as e:
+                logger.error(f"Skipping {len(school_chunks)} chunks: {e}")
+                failed.update(chunk_ids)
+    
+    def index_chunks(queryset):
+        batch = []
+        for chunk in queryset.select_related('source__school').order_by('pk').iterator(chunk_size=batch_size):
+            batch.append(chunk)
+            if len(batch) == batch_size:
+                index_batch(batch)
+                batch = []
+        if batch:
+            index_batch(batch)
+    
+    try:
+        index_chunks(AIKnowledgeChunk.objects.all())
+        
+        # Catch up with imports and deletions made while the generation was built
+        for _ in range(3):
+            current = {str(chunk_id) for chunk_id in AIKnowledgeChunk.objects.values_list('id', flat=True)}
+            missing = current - indexed - failed
+            removed = indexed - current
+            if not missing and not removed:
+                break
+            for manager in managers.values():
+                manager.delete_chunks(list(removed))
+            indexed -= removed
+            index_chunks(AIKnowledgeChunk.objects.filter(id__in=missing))
+        
+        for manager in managers.values():
+            manager.persist()
+    finally:
+        for manager in managers.values():
+            manager.close()
+    
+    if failed:
+        logger.warning(f"{len(failed)} chunks could not be embedded with {model} and were left out")
+    return len(indexed)
+
+def _build_and_switch(model: str) -> dict:
+    model = embedding_models.canonical_name(model)
+    dimension = embedding_models.dimension(model)
+    generation = embedding_models.begin_generation(DEFAULT_COLLECTION)
+    logger.info(f"Building generation {generation} of {DEFAULT_COLLECTION} with {model} ({dimension}-d)")
+    
+    start_time = time.time()
+    count = _build_index_generation(model, generation)
+    
+    # Managers (requests, tutor sessions, imports) move to the new index from here on
+    embedding_models.switch(DEFAULT_COLLECTION, model, generation)
+    logger.info(f"Indexed {count} chunks with {model} in {time.time() - start_time:.1f}s; "
+                f"generation {generation} is live")
+    
+    # The previous generation's files go once every process has had time to move off it
+    grace = getattr(settings, 'VECTOR_DB_CONFIG', {}).get('RETIRED_GENERATION_GRACE', 300)
+    remove_retired_index_generations.apply_async(args=[DEFAULT_COLLECTION], countdown=grace)
+    return {'embedding_model': model, 'generation': generation, 'chunks_indexed': count}
+
 @shared_task
 def rebuild_vector_db_index():
-    """Rebuild vector database index from all knowledge chunks"""
+    """Rebuild the vector index from the stored embeddings, switching over once it's complete"""
     
     logger.info("Starting vector DB index rebuild")
+    model, _ = embedding_models.live(DEFAULT_COLLECTION)
+    return _build_and_switch(model)
+
+@shared_task
+def reembed_knowledge_base(embedding_model: str):
+    """Re-embed every knowledge chunk with another model, switching queries to it once complete"""
+    
+    logger.info(f"Starting re-embedding with {embedding_model}")
+    return _build_and_switch(embedding_model)
+
+@shared_task
+def remove_retired_index_generations(collection_name: str = DEFAULT_COLLECTION):
+    """Delete the index files of generations superseded by a rebuild or re-embedding"""
     
-    # Get all knowledge chunks
-    chunks = AIKnowledgeChunk.objects.all().select_related('source')
+    removed = []
+    for model, generation in embedding_models.retired(collection_name):
+        index_path = embedding_models.index_path(collection_name, model, generation)
+        held = vector_index_registry.unload_unreferenced(
+            lambda key: embedding_models.in_generation(key, index_path)
+        )
+        if held:
+            # Retried by the next scheduled run
+            logger.info(f"Keeping {model} generation {generation} of {collection_name}: "
+                        f"{len(held)} of its indexes are still in use")
+            continue
+        
+        embedding_models.remove_generation(collection_name, model, generation)
+        removed.append(f"{model}-g{generation}")
     
-    if not chunks.exists():
-        logger.warning("No knowledge chunks found to index")
-        return 0
+    return removed
+
+@shared_task
+def rebuild_keyword_index():
+    """Rebuild the BM25 keyword index from all knowledge chunks"""
     
-    # Initialize vector DB
-    vector_db = VectorDBManager()
+    logger.info("Starting keyword index rebuild")
     
-    # Clear existing collection
-    try:
-        vector_db.client.delete_collection(vector_db.collection_name)
-        logger.info(f"Deleted old collection: {vector_db.collection_name}")
-    except:
-        pass
-    
-    # Recreate collection
-    vector_db.collection = vector_db._get_or_create_collection()
-    
-    # Prepare and add chunks
-    vector_chunks = []
-    for chunk in chunks:
-        vector_chunk = {
-            'id': str(chunk.id),
-            'title': chunk.title,
-            'content': chunk.content,
-            'content_type': chunk.content_type,
-            'difficulty_level': chunk.difficulty_level,
-            'subject': chunk.subject,
-            'topic': chunk.topic,
-            'subtopics': chunk.subtopics,
-            'concept': chunk.concept,
-            'teaching_strategy': chunk.teaching_strategy,
-            'source_metadata': {
-                'source': chunk.source.name if chunk.source else 'unknown',
-                'source_url': chunk.source_url
-            },
-            'embedding': np.frombuffer(chunk.embedding) if chunk.embedding else None
-        }
-        vector_chunks.append(vector_chunk)
+    chunks = AIKnowledgeChunk.objects.select_related('source').only(
+        'id', 'title', 'content', 'subtopics', 'subject', 'topic', 'difficulty_level',
+        'content_type', 'source__school'
+    )
+    
+    keyword_index.clear()
+    
+    batch = []
+    count = 0
+    for chunk in chunks.iterator(chunk_size=1000):
+        batch.append(chunk)
+        if len(batch) == 1000:
+            keyword_index.add_chunks(batch)
+            count += len(batch)
+            batch = []
+    keyword_index.add_chunks(batch)
+    count += len(batch)
+    
+    logger.info(f"Successfully rebuilt keyword index with {count} chunks")
+    return count
+
+@shared_task
+def rebuild_minhash_index():
+    """Rebuild the MinHash near-duplicate index from all knowledge chunks"""
+    
+    logger.info("Starting MinHash index rebuild")
+    
+    chunks = AIKnowledgeChunk.objects.select_related('source').only('id', 'content', 'source__school')
+    
+    minhash_index.clear()
     
-    # Add in batches
-    vector_db.add_knowledge_chunks(vector_chunks)
-    vector_db.persist()
+    batch = []
+    count = 0
+    for chunk in chunks.iterator(chunk_size=1000):
+        batch.append(chunk)
+        if len(batch) == 1000:
+            minhash_index.add_chunks(batch)
+            count += len(batch)
+            batch = []
+    minhash_index.add_chunks(batch)
+    count += len(batch)
     
-    logger.info(f"Successfully rebuilt vector DB with {len(vector_chunks)} chunks")
-    return len(vector_chunks)
\ No newline at end of file
+    logger.info(f"Successfully rebuilt MinHash index with {count} chunks")
+    return count
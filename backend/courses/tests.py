@@ -1,3 +1,353 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from users.models import School, UpperclassUser
+from .models import CourseImportJob, CourseSource
+from .processors.deduplicator import ChunkDeduplicator
+from .processors.import_artifacts import import_artifacts
+from .tasks import _pack_embeddings, _run_stage
+from .vector_db.embedding_models import embedding_models
+from .vector_db.faiss_manager import FAISSVectorDB
+from .vector_db.manager import VectorDBManager, VectorQuotaExceeded
+from .vector_db.minhash_index import MinHashIndex
+from .vector_db.registry import vector_index_registry
+
+
+class FAISSTrainingTombstoneTests(SimpleTestCase):
+    """Vectors deleted while staged must not outlive the switch to a trained index"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.vectors = np.random.default_rng(0).normal(size=(60, 16)).astype('float32')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _add(self, db, start, stop):
+        db.add_embeddings(list(self.vectors[start:stop]), [{'subject': 'math'}] * (stop - start),
+                          [f'id{i}' for i in range(start, stop)])
+
+    def test_filtered_search_after_training(self):
+        db = FAISSVectorDB(f"{self.directory}/index", dimension=16, fsync=False,
+                           storage='int8', min_train_size=50)
+        self._add(db, 0, 20)
+        db.delete_by_ids(['id1', 'id2'])
+        self._add(db, 20, 60)
+
+        self.assertFalse(db._is_staging())
+        self.assertEqual(len(db.metadata), db.index.ntotal)
+
+        results = db.search(self.vectors[3], k=5, filters={'subject': 'math'})
+        self.assertEqual(results[0]['id'], 'id3')
+        self.assertFalse({'id1', 'id2'} & {result['id'] for result in results})
+
+        db.rebuild_index()
+        self.assertEqual(len(db.metadata), 58)
+        self.assertEqual(db.search(self.vectors[3], k=1, filters={'subject': 'math'})[0]['id'], 'id3')
+
+
+class FAISSSegmentLogTests(SimpleTestCase):
+    """Writes reach other instances through the segment log and survive compaction"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.vectors = np.random.default_rng(1).normal(size=(40, 16)).astype('float32')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _open(self):
+        return FAISSVectorDB(f"{self.directory}/index", dimension=16, fsync=False)
+
+    def _add(self, db, start, stop):
+        db.add_embeddings(list(self.vectors[start:stop]), [{'subject': 'math'}] * (stop - start),
+                          [f'id{i}' for i in range(start, stop)])
+
+    def _nearest(self, db, i, k=1):
+        return [result['id'] for result in db.search(self.vectors[i], k=k)]
+
+    def test_reload_replays_log(self):
+        db = self._open()
+        self._add(db, 0, 30)
+        db.delete_by_ids(['id4'])
+
+        reloaded = self._open()
+        self.assertEqual(reloaded.get_stats()['live_vectors'], 29)
+        self.assertEqual(self._nearest(reloaded, 7), ['id7'])
+        self.assertNotIn('id4', self._nearest(reloaded, 4, k=5))
+
+    def test_compaction_survives_reload(self):
+        db = self._open()
+        self._add(db, 0, 30)
+        db.delete_by_ids(['id4'])
+        opened_before = self._open()
+
+        db.compact()
+        stats = db.get_stats()
+        self.assertEqual((stats['base_generation'], stats['tombstones'], stats['pending_log_bytes']), (1, 0, 0))
+
+        # Logged on top of the new base snapshot
+        self._add(db, 30, 40)
+
+        reloaded = self._open()
+        self.assertEqual(reloaded.base_generation, 1)
+        self.assertEqual(reloaded.get_stats()['live_vectors'], 39)
+        self.assertEqual(self._nearest(reloaded, 7) + self._nearest(reloaded, 35), ['id7', 'id35'])
+        self.assertNotIn('id4', self._nearest(reloaded, 4, k=5))
+
+        # An instance whose log segment was compacted away reloads the snapshot
+        opened_before.refresh()
+        self.assertEqual(opened_before.get_stats()['live_vectors'], 39)
+        self.assertEqual(self._nearest(opened_before, 35), ['id35'])
+
+
+class SchoolCollectionTests(SimpleTestCase):
+    """School collections are searched only by their school's managers and capped by tier"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        config = {**settings.VECTOR_DB_CONFIG, 'SHARD_BY': '', 'SCHOOL_VECTOR_QUOTAS': {'free': 30}}
+        overridden = override_settings(VECTOR_DB_CONFIG=config)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+        for patcher in (mock.patch.object(embedding_models, 'data_dir', self.directory),
+                        mock.patch.object(embedding_models, '_states', {})):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.vectors = None
+
+    def tearDown(self):
+        vector_index_registry.unload_unreferenced(lambda key: key.startswith(self.directory))
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _manager(self, school_id=None, enable_custom_courses=True):
+        school = None
+        if school_id is not None:
+            school = School(pk=school_id, name=f'School {school_id}', subscription_tier='free',
+                            enable_custom_courses=enable_custom_courses, is_active=True)
+        manager = VectorDBManager(school=school)
+        self.addCleanup(manager.close)
+        if self.vectors is None:
+            self.vectors = np.random.default_rng(2).normal(size=(40, manager.dimension)).astype('float32')
+        return manager
+
+    def _chunks(self, prefix, start, stop):
+        return [{'id': f'{prefix}{i}', 'embedding': self.vectors[i], 'subject': 'math'} for i in range(start, stop)]
+
+    def _nearest(self, manager, i, limit=3):
+        return [result['id'] for result in manager.search_similar(self.vectors[i].tolist(), limit=limit)]
+
+    def test_school_collections_are_private(self):
+        shared = self._manager()
+        first = self._manager(school_id=1)
+        twelfth = self._manager(school_id=12)
+        shared.add_knowledge_chunks(self._chunks('shared', 0, 5))
+        twelfth.add_knowledge_chunks(self._chunks('twelfth', 5, 10))
+
+        self.assertEqual(self._nearest(twelfth, 7)[0], 'twelfth7')
+        # School 1 has no collection yet; school 12's (a key prefix of it) isn't it
+        self.assertEqual(self._nearest(first, 2)[0], 'shared2')
+        self.assertFalse(any(chunk_id.startswith('twelfth') for chunk_id in self._nearest(first, 7, limit=10)))
+        self.assertNotIn(first.school_index_path, vector_index_registry.keys(first.school_index_path))
+        self.assertEqual(first.get_collection_stats()['school']['vectors'], 0)
+
+        first.add_knowledge_chunks(self._chunks('first', 10, 15))
+        self.assertEqual(self._nearest(first, 12)[0], 'first12')
+        self.assertFalse(any(chunk_id.startswith('first') for chunk_id in self._nearest(twelfth, 12, limit=15)))
+        self.assertEqual(
+            {chunk_id.rstrip('0123456789') for chunk_id in self._nearest(shared, 12, limit=15)}, {'shared'}
+        )
+
+    def test_quota(self):
+        school = self._manager(school_id=3)
+        school.add_knowledge_chunks(self._chunks('school', 0, 25))
+        with self.assertRaises(VectorQuotaExceeded):
+            school.add_knowledge_chunks(self._chunks('school', 25, 35))
+        self.assertEqual(school.get_collection_stats()['school']['vectors'], 25)
+
+        school.add_knowledge_chunks(self._chunks('school', 25, 30))
+        self.assertEqual(school.get_collection_stats()['school'], {'school_id': 3, 'vectors': 30, 'quota': 30})
+
+        # Schools without custom courses get no collection at all
+        with self.assertRaises(VectorQuotaExceeded):
+            self._manager(school_id=4, enable_custom_courses=False).add_knowledge_chunks(self._chunks('other', 0, 1))
+
+
+class KnowledgeSearchScopeTests(TestCase):
+    """search_by_query only searches the private collection of a school the user belongs to"""
+
+    def setUp(self):
+        self.admin = self._user('admin')
+        self.school = School.objects.create(name='Northside High', license_key='northside', admin=self.admin,
+                                            enable_custom_courses=True)
+        self.student = self._user('student')
+        self.teacher = self._user('teacher')
+        self.school.students.add(self.student)
+        self.school.teachers.add(self.teacher)
+
+    def _user(self, username, **fields):
+        return UpperclassUser.objects.create_user(username=username, email=f'{username}@example.com',
+                                                  password='password', **fields)
+
+    def _searched_school(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        with mock.patch('courses.views.VectorDBManager') as manager, \
+                mock.patch('courses.views.embed_query', return_value=None):
+            manager.return_value.hybrid_search.return_value = []
+            response = client.get(reverse('knowledge-chunk-search-by-query'), {'q': 'photosynthesis'})
+        self.assertEqual(response.status_code, 200)
+        return manager.call_args.kwargs['school']
+
+    def test_members_search_their_school(self):
+        for user in (self.student, self.teacher, self.admin):
+            with self.subTest(user=user.username):
+                self.assertEqual(self._searched_school(user), self.school)
+
+    def test_school_name_grants_no_access(self):
+        outsider = self._user('outsider', school_name='Northside High')
+        self.assertIsNone(self._searched_school(outsider))
+
+    def test_school_without_custom_content(self):
+        self.school.enable_custom_courses = False
+        self.school.save()
+        self.assertIsNone(self._searched_school(self.student))
+
+
+class ImportStageResumeTests(TestCase):
+    """A failed import resumes at the stage that failed, reusing the earlier stages' checkpoints"""
+
+    STAGES = [stage for stage, _ in CourseImportJob.STAGE_CHOICES]
+    OUTPUTS = {
+        'extract': {'title': 'Algebra', 'lessons': [{'title': 'Linear equations', 'content': 'Solve for x.'}]},
+        'chunk': {'changed': [{'key': 'lesson:1', 'fingerprint': 'f1'}], 'removed': [7], 'replaced_ids': [],
+                  'chunks': [{'title': 'Linear equations', 'content': 'Solve for x.'}]},
+        'enrich': [{'title': 'Linear equations', 'content': 'Solve for x.', 'subject': 'math'}],
+        'embed': [{'title': 'Linear equations', 'embedding': [0.5, -0.25, 1.0]}],
+        'save': ['3f2b6c1e-0000-4000-8000-000000000001'],
+        'index': 1,
+    }
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        patcher = mock.patch.object(import_artifacts, 'root', self.directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.source = CourseSource.objects.create(name='Khan Academy', source_type='khan_academy')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _import(self, job, calls, fail_at=None):
+        outputs = {}
+        for stage in self.STAGES:
+            def run(stage=stage):
+                calls.append(stage)
+                if stage == fail_at:
+                    raise RuntimeError(f"{stage} failed")
+                return self.OUTPUTS[stage]
+            outputs[stage] = _run_stage(job, stage, run, atomic=stage == 'save',
+                                        pack=_pack_embeddings if stage == 'embed' else None)
+        return outputs
+
+    def test_resume_at_each_stage(self):
+        for failed in self.STAGES:
+            with self.subTest(failed=failed):
+                job = CourseImportJob.objects.create(source=self.source, source_url='https://example.com/algebra',
+                                                     job_id=f'job-{failed}')
+                with self.assertRaises(RuntimeError):
+                    self._import(job, [], fail_at=failed)
+
+                # The retried task loads the job afresh
+                job = CourseImportJob.objects.get(pk=job.pk)
+                calls = []
+                outputs = self._import(job, calls)
+
+                self.assertEqual(calls, self.STAGES[self.STAGES.index(failed):])
+                self.assertEqual(outputs, self.OUTPUTS)
+                self.assertEqual(job.stage, 'index')
+                self.assertEqual(set(job.artifacts), set(self.STAGES))
+
+
+class _StoredVectors:
+    """search_batch over a fixed set of stored embeddings, like VectorDBManager's"""
+
+    def __init__(self, stored):
+        self.stored = stored
+
+    def search_batch(self, embeddings, limit=10):
+        results = []
+        for embedding in embeddings:
+            embedding = np.asarray(embedding) / np.linalg.norm(embedding)
+            hits = [
+                {'id': chunk_id, 'metadata': {}, 'similarity_score': float(embedding @ vector / np.linalg.norm(vector))}
+                for chunk_id, vector in self.stored.items()
+            ]
+            results.append(sorted(hits, key=lambda hit: -hit['similarity_score'])[:limit])
+        return results
+
+
+class ChunkDeduplicationTests(SimpleTestCase):
+    """Duplicates within an import are merged into the first chunk; duplicates of stored chunks are skipped"""
+
+    STORED_TEXT = ("Photosynthesis converts light energy into chemical energy stored in glucose, "
+                   "using carbon dioxide and water and releasing oxygen as a by-product in the chloroplasts.")
+    TEXT = ("Newton's second law states that the net force on an object equals its mass times its "
+            "acceleration, so a larger force produces a larger acceleration for the same mass of the object.")
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.index = MinHashIndex(path=f"{self.directory}/minhash.sqlite3")
+        self.index.add_chunk(SimpleNamespace(id='stored', content=self.STORED_TEXT, source_id=None, source=None))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _deduplicator(self, **kwargs):
+        deduplicator = ChunkDeduplicator(**kwargs)
+        deduplicator.index = self.index
+        return deduplicator
+
+    def test_text_duplicates(self):
+        chunks = [
+            {'title': 'Second law', 'content': self.TEXT, 'subtopics': ['force']},
+            {'title': 'Second law again', 'content': self.TEXT.replace('the object.', 'the body.'),
+             'subtopics': ['force', 'acceleration'], 'suggested_analogies': ['pushing a cart']},
+            {'title': 'Photosynthesis', 'content': self.STORED_TEXT, 'subtopics': ['plants']},
+        ]
+        deduplicator = self._deduplicator()
+        kept = deduplicator.drop_text_duplicates(chunks)
+
+        self.assertEqual([chunk['title'] for chunk in kept], ['Second law'])
+        self.assertEqual(kept[0]['subtopics'], ['force', 'acceleration'])
+        self.assertEqual(kept[0]['suggested_analogies'], ['pushing a cart'])
+        self.assertEqual(deduplicator.near_duplicates, 2)
+
+    def test_replaced_chunks_are_not_duplicates(self):
+        chunks = [{'title': 'Photosynthesis', 'content': self.STORED_TEXT}]
+        kept = self._deduplicator(replacing=['stored']).drop_text_duplicates(chunks)
+        self.assertEqual(kept, chunks)
+
+    def test_semantic_duplicates(self):
+        vector_db = _StoredVectors({'stored': np.array([0.0, 1.0, 0.0])})
+        chunks = [
+            {'title': 'Original', 'embedding': [1.0, 0.0, 0.0], 'learning_objectives': ['define']},
+            {'title': 'Paraphrase', 'embedding': [0.999, 0.01, 0.0], 'learning_objectives': ['apply']},
+            {'title': 'Stored', 'embedding': [0.01, 0.999, 0.0], 'learning_objectives': ['recall']},
+            {'title': 'Unrelated', 'embedding': [0.0, 0.0, 1.0]},
+            {'title': 'Not embedded'},
+        ]
+        deduplicator = self._deduplicator()
+        kept = deduplicator.drop_semantic_duplicates(chunks, vector_db)
+
+        self.assertEqual([chunk['title'] for chunk in kept], ['Original', 'Unrelated', 'Not embedded'])
+        self.assertEqual(kept[0]['learning_objectives'], ['define', 'apply'])
+        self.assertEqual(deduplicator.semantic_duplicates, 2)
@@ -0,0 +1,105 @@
+"""
+Inverted attribute index used to pre-filter FAISS searches
+"""
+
+from array import array
+from typing import Any, Dict, Iterable, Optional, Tuple
+import numpy as np
+
+# Metadata keys that get posting lists; other filter keys are checked after the search
+FILTERABLE_ATTRIBUTES = ('subject', 'topic', 'difficulty_level', 'content_type', 'source', 'source_id')
+
+
+def normalize_value(value: Any) -> Any:
+    """Filters match strings case-insensitively, like FAISSVectorDB._passes_filters"""
+    return value.lower() if isinstance(value, str) else value
+
+
+class AttributeIndex:
+    """
+    Maps (attribute, value) to the sorted FAISS labels that carry it.
+
+    Postings are int64 arrays appended in label order, so intersecting a few
+    of them is cheap and the result can be handed to a FAISS IDSelector.
+    """
+
+    def __init__(self, attributes: Iterable[str] = FILTERABLE_ATTRIBUTES):
+        self.attributes = tuple(attributes)
+        self.postings: Dict[str, Dict[Any, array]] = {attr: {} for attr in self.attributes}
+
+    def add(self, label: int, metadata: Dict[str, Any]):
+        """Index one vector's metadata"""
+        for attr in self.attributes:
+            value = metadata.get(attr)
+            if value is None:
+                continue
+            self.postings[attr].setdefault(normalize_value(value), array('q')).append(label)
+
+    def rebuild(self, labelled_metadata: Iterable[Tuple[int, Dict[str, Any]]]):
+        """Rebuild all postings from (label, metadata) pairs"""
+        self.postings = {attr: {} for attr in self.attributes}
+        for label, metadata in labelled_metadata:
+            self.add(label, metadata)
+
+    def load(self, store):
+        """Rebuild all postings from a MetadataStore, column at a time"""
+        self.postings = {attr: {} for attr in self.attributes}
+        for attr in self.attributes:
+            merged: Dict[Any, list] = {}
+            for value, labels in store.postings(attr).items():
+                merged.setdefault(normalize_value(value), []).append(labels)
+            for value, parts in merged.items():
+                labels = parts[0] if len(parts) == 1 else np.sort(np.concatenate(parts))
+                self.postings[attr][value] = array('q', labels.astype('int64').tobytes())
+
+    def split_filters(self, filters: Optional[Dict]) -> Tuple[Dict, Dict]:
+        """Split filters into (indexed, residual), dropping None values"""
+        indexed, residual = {}, {}
+        for key, value in (filters or {}).items():
+            if value is None:
+                continue
+            if key in self.postings:
+                indexed[key] = value
+            else:
+                residual[key] = value
+        return indexed, residual
+
+    def match(self, filters: Dict[str, Any]) -> np.ndarray:
+        """Sorted labels that satisfy every indexed filter"""
+        lists = []
+        for key, value in filters.items():
+            posting = self.postings[key].get(normalize_value(value))
+            if posting is None:
+                return np.empty(0, dtype='int64')
+            lists.append(posting)
+
+        # Intersect smallest first so highly selective filters stay cheap
+        lists.sort(key=len)
+        labels = np.array(lists[0], dtype='int64')
+        for posting in lists[1:]:
+            if not len(labels):
+                break
+            labels = np.intersect1d(labels, np.array(posting, dtype='int64'), assume_unique=True)
+        return labels
+
+    def value_counts(self, attr: str) -> Dict[Any, int]:
+        """Number of vectors per value of an attribute"""
+        return {value: len(posting) for value, posting in self.postings.get(attr, {}).items()}
+
+
+def build_selector(labels: np.ndarray, label_space: int):
+    """
+    FAISS IDSelector for a set of labels in ``[0, label_space)``: a bitmap when
+    the set is dense, a hashed batch otherwise. The selector references the
+    label/bitmap array, so callers must keep the returned tuple alive for the
+    whole search.
+    """
+    # Imported here so SimpleVectorDB can use this module without FAISS
+    import faiss
+
+    if label_space and len(labels) * 32 > label_space:
+        mask = np.zeros(label_space, dtype=bool)
+        mask[labels] = True
+        bitmap = np.packbits(mask, bitorder='little')
+        return faiss.IDSelectorBitmap(bitmap), bitmap
+    return faiss.IDSelectorBatch(labels), labels
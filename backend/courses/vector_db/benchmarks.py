@@ -0,0 +1,296 @@
+"""
+Helpers for benchmarking vector index configurations
+"""
+
+import time
+import tempfile
+import threading
+from types import SimpleNamespace
+import faiss
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple
+
+from .embedding_codec import encode_embedding, decode_embedding
+from .faiss_manager import FAISSVectorDB
+from .manager import reciprocal_rank_fusion
+
+
+def synthetic_embeddings(n: int, dimension: int, n_clusters: int = 100, seed: int = 0) -> np.ndarray:
+    """Clustered, L2-normalized vectors (uniform random data is unrealistically hard for ANN)"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dimension)).astype('float32')
+    assignments = rng.integers(0, n_clusters, size=n)
+    vectors = centers[assignments] + 0.5 * rng.normal(size=(n, dimension)).astype('float32')
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def perturbed_queries(vectors: np.ndarray, n_queries: int, noise: float = 0.1, seed: int = 1) -> np.ndarray:
+    """Queries near (but not equal to) stored vectors"""
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)
+    queries = vectors[picks] + noise * rng.normal(size=(len(picks), vectors.shape[1])).astype('float32')
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return queries
+
+
+def exact_neighbors(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Ground-truth top-k row indices by brute-force inner product"""
+    similarities = queries @ vectors.T
+    top = np.argpartition(-similarities, min(k, vectors.shape[0] - 1), axis=1)[:, :k]
+    order = np.take_along_axis(similarities, top, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(top, order, axis=1)
+
+
+def recall_at_k(truth: np.ndarray, results: List[List[int]], k: int) -> float:
+    """Mean fraction of the true top-k found in the returned top-k"""
+    hits = 0
+    for true_row, result_row in zip(truth, results):
+        hits += len(set(true_row[:k].tolist()) & set(result_row[:k]))
+    return hits / float(k * len(truth))
+
+
+def latency_summary(samples: List[float]) -> Dict[str, float]:
+    """p50 / p99 / mean of latency samples, in milliseconds"""
+    latencies = np.array(samples) * 1000.0
+    return {
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'mean_ms': float(latencies.mean()),
+    }
+
+
+def build_benchmark_db(tmp_dir: str, vectors: np.ndarray, index_type: str, batch_size: int = 1000,
+                       metadatas: Optional[List[Dict[str, Any]]] = None, **index_options) -> FAISSVectorDB:
+    """Load vectors into a throwaway FAISSVectorDB under tmp_dir"""
+    db = FAISSVectorDB(
+        index_path=f"{tmp_dir}/bench",
+        dimension=vectors.shape[1],
+        fsync=False,
+        index_type=index_type,
+        # Train as soon as the whole set is loaded
+        min_train_size=index_options.pop('min_train_size', len(vectors)),
+        **index_options
+    )
+    
+    for start in range(0, len(vectors), batch_size):
+        batch = vectors[start:start + batch_size]
+        db.add_embeddings(
+            embeddings=list(batch),
+            metadatas=metadatas[start:start + len(batch)] if metadatas else [{} for _ in range(len(batch))],
+            ids=[str(i) for i in range(start, start + len(batch))]
+        )
+    return db
+
+
+def benchmark_index(vectors: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int,
+                    index_type: str, batch_size: int = 1000, **index_options) -> Dict[str, Any]:
+    """Build a throwaway FAISSVectorDB of the given type and measure recall and latency"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        build_start = time.perf_counter()
+        db = build_benchmark_db(tmp_dir, vectors, index_type, batch_size, **index_options)
+        build_time = time.perf_counter() - build_start
+        
+        results = []
+        samples = []
+        for query in queries:
+            query_start = time.perf_counter()
+            hits = db.search(query, k=k)
+            samples.append(time.perf_counter() - query_start)
+            results.append([int(hit['id']) for hit in hits])
+        
+        row = {
+            'index_type': index_type,
+            'actual_index': db.get_stats()['index_type'],
+            'recall_at_k': recall_at_k(truth, results, k),
+            'build_seconds': build_time,
+            'bytes_per_vector': len(faiss.serialize_index(db.index)) / max(1, db.index.ntotal),
+        }
+        row.update(latency_summary(samples))
+        row.update({key: value for key, value in index_options.items() if value is not None})
+        return row
+
+
+def benchmark_embedding_codec(vectors: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int,
+                              dtype: str) -> Dict[str, Any]:
+    """Bytes per stored embedding and recall@k after an encode/decode round trip"""
+    encoded = [encode_embedding(vector, dtype)[0] for vector in vectors]
+    decoded = np.array([decode_embedding(data, dtype) for data in encoded])
+    
+    scores = queries @ decoded.T
+    results = np.argsort(-scores, axis=1)[:, :k].tolist()
+    return {
+        'dtype': dtype,
+        'bytes_per_vector': sum(len(data) for data in encoded) / len(encoded),
+        'recall_at_k': recall_at_k(truth, results, k),
+    }
+
+
+def benchmark_batch_search(db, queries: np.ndarray, k: int, batch_size: int,
+                           filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Queries per second of one search() call per query versus search_batch() in chunks"""
+    loop_start = time.perf_counter()
+    loop_results = [db.search(query, k=k, filters=filters) for query in queries]
+    loop_time = time.perf_counter() - loop_start
+    
+    batch_start = time.perf_counter()
+    batch_results = []
+    for start in range(0, len(queries), batch_size):
+        batch_results.extend(db.search_batch(queries[start:start + batch_size], k=k, filters_per_query=filters))
+    batch_time = time.perf_counter() - batch_start
+    
+    # Both paths should return the same hits
+    agreement = np.mean([
+        len({hit['id'] for hit in a} & {hit['id'] for hit in b}) / float(len(a)) if a else float(not b)
+        for a, b in zip(loop_results, batch_results)
+    ])
+    
+    return {
+        'batch_size': batch_size,
+        'filters': ','.join(f"{key}={value}" for key, value in (filters or {}).items()) or '-',
+        'loop_qps': len(queries) / loop_time,
+        'batch_qps': len(queries) / batch_time,
+        'speedup': loop_time / batch_time,
+        'agreement': float(agreement),
+    }
+
+
+def synthetic_corpus(n_docs: int, dimension: int, n_topics: int = 50, vocabulary: int = 2000,
+                     seed: int = 0) -> Tuple[List[SimpleNamespace], np.ndarray, np.ndarray]:
+    """
+    Chunk-like documents made of topic words, filler words and one rare term
+    each (think formula names), with embeddings clustered by topic.
+    Returns (documents, embeddings, topic of each document).
+    """
+    rng = np.random.default_rng(seed)
+    topic_words = [[f"topic{t}word{j}" for j in range(20)] for t in range(n_topics)]
+    filler = [f"word{j}" for j in range(vocabulary)]
+    topics = rng.integers(0, n_topics, size=n_docs)
+
+    documents = []
+    for i, topic in enumerate(topics):
+        words = rng.choice(topic_words[topic], 8).tolist() + rng.choice(filler, 60).tolist() + [f"term{i}"]
+        rng.shuffle(words)
+        documents.append(SimpleNamespace(
+            id=str(i), title=' '.join(topic_words[topic][:3]), content=' '.join(words), subtopics=[],
+            subject='benchmark', topic=f"topic{topic}", difficulty_level='intermediate',
+            content_type='concept', source_id=None, source=None
+        ))
+
+    centers = rng.normal(size=(n_topics, dimension)).astype('float32')
+    embeddings = centers[topics] + 0.8 * rng.normal(size=(n_docs, dimension)).astype('float32')
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return documents, embeddings, topics
+
+
+def term_queries(documents: List[SimpleNamespace], embeddings: np.ndarray, n_queries: int,
+                 noise: float = 0.2, term_fraction: float = 0.5,
+                 seed: int = 1) -> Tuple[List[str], np.ndarray, List[str]]:
+    """
+    Queries for one document each, with a noisy copy of its embedding. A
+    ``term_fraction`` of them name the document's rare term; the others only
+    use words of its topic, like a paraphrase.
+    Returns (query texts, query embeddings, target document IDs).
+    """
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(documents), size=min(n_queries, len(documents)), replace=False)
+
+    texts = []
+    for pick in picks:
+        words = [word for word in documents[pick].content.split() if word.startswith('topic')]
+        terms = [f"term{pick}"] if rng.random() < term_fraction else []
+        texts.append(' '.join(terms + rng.choice(words, 3).tolist()))
+
+    queries = embeddings[picks] + noise * rng.normal(size=(len(picks), embeddings.shape[1])).astype('float32')
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return texts, queries, [documents[pick].id for pick in picks]
+
+
+def benchmark_retrievers(db, keyword_index, texts: List[str], queries: np.ndarray, targets: List[str],
+                         k: int, depth: int = 50, rrf_k: int = 60) -> List[Dict[str, Any]]:
+    """Hit rate@k, MRR and latency of BM25, vector and RRF-fused hybrid retrieval"""
+
+    def keyword(text, query):
+        return [hit['id'] for hit in keyword_index.search(text, limit=depth)]
+
+    def vector(text, query):
+        return [hit['id'] for hit in db.search(query, k=depth)]
+
+    def hybrid(text, query):
+        fused = reciprocal_rank_fusion([vector(text, query), keyword(text, query)], k=rrf_k)
+        return [item_id for item_id, _ in fused]
+
+    rows = []
+    for name, retrieve in (('bm25', keyword), ('vector', vector), ('hybrid', hybrid)):
+        samples = []
+        hits = 0
+        reciprocal_ranks = 0.0
+        for text, query, target in zip(texts, queries, targets):
+            start = time.perf_counter()
+            ranking = retrieve(text, query)[:k]
+            samples.append(time.perf_counter() - start)
+            if target in ranking:
+                hits += 1
+                reciprocal_ranks += 1.0 / (ranking.index(target) + 1)
+
+        row = {
+            'retriever': name,
+            'hit_rate_at_k': hits / float(len(targets)),
+            'mrr': reciprocal_ranks / len(targets),
+        }
+        row.update(latency_summary(samples))
+        rows.append(row)
+    return rows
+
+
+def synthetic_sentences(n: int, vocabulary: int = 5000, min_words: int = 20, max_words: int = 120,
+                        seed: int = 0) -> List[str]:
+    """Random word sequences with chunk-like lengths"""
+    rng = np.random.default_rng(seed)
+    words = [f"w{i}" for i in range(vocabulary)]
+    return [' '.join(rng.choice(words, rng.integers(min_words, max_words))) for _ in range(n)]
+
+
+def benchmark_local_embedding(encode, texts: List[str], callers: int = 1,
+                              request_size: int = 1) -> Dict[str, Any]:
+    """
+    Throughput of an encode function called by ``callers`` concurrent threads,
+    each sending ``request_size`` texts per call
+    """
+    requests = [texts[i:i + request_size] for i in range(0, len(texts), request_size)]
+    samples = []
+
+    def run(requests_slice):
+        for request in requests_slice:
+            start = time.perf_counter()
+            encode(request)
+            samples.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=run, args=(requests[i::callers],)) for i in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    row = {'texts_per_sec': len(texts) / elapsed}
+    row.update(latency_summary(samples))
+    return row
+
+
+def format_table(rows: List[Dict[str, Any]], columns: Optional[List[str]] = None) -> str:
+    """Render benchmark rows as a fixed-width text table"""
+    if not rows:
+        return ''
+    columns = columns or list(rows[0].keys())
+
+    def cell(value):
+        return f"{value:.4f}" if isinstance(value, float) else str(value)
+
+    widths = [max(len(col), *(len(cell(row.get(col, ''))) for row in rows)) for col in columns]
+    lines = ['  '.join(col.ljust(width) for col, width in zip(columns, widths))]
+    lines.append('  '.join('-' * width for width in widths))
+    for row in rows:
+        lines.append('  '.join(cell(row.get(col, '')).ljust(width) for col, width in zip(columns, widths)))
+    return '\n'.join(lines)
@@ -0,0 +1,98 @@
+"""
+Bulk, cached lookup of knowledge chunk content for vector search hits
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Iterable
+from django.conf import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkContentStore:
+    """
+    LRU cache of ``AIKnowledgeChunk.content`` keyed by chunk ID.
+
+    Misses are fetched with a single ``id__in`` query, so hydrating a page of
+    search hits costs at most one database round-trip. Entries are dropped
+    when a chunk is saved or deleted in this process (see courses.signals);
+    the TTL bounds how stale another worker's copy can get.
+    """
+
+    def __init__(self, max_entries: int = None, ttl: float = None):
+        config = getattr(settings, 'VECTOR_DB_CONFIG', {})
+        self.max_entries = max_entries or config.get('CONTENT_CACHE_SIZE', 10000)
+        self.ttl = ttl or config.get('CONTENT_CACHE_TTL', 300)
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, chunk_ids: Iterable[str]) -> Dict[str, str]:
+        """Content for each known chunk ID (unknown IDs are left out)"""
+        chunk_ids = list(dict.fromkeys(str(chunk_id) for chunk_id in chunk_ids))
+        contents = {}
+        missing = []
+        now = time.monotonic()
+
+        with self._lock:
+            for chunk_id in chunk_ids:
+                entry = self._entries.get(chunk_id)
+                if entry is not None and now - entry[1] < self.ttl:
+                    self._entries.move_to_end(chunk_id)
+                    contents[chunk_id] = entry[0]
+                else:
+                    missing.append(chunk_id)
+            self.hits += len(contents)
+            self.misses += len(missing)
+
+        if missing:
+            fetched = self._fetch(missing)
+            contents.update(fetched)
+
+            with self._lock:
+                for chunk_id, content in fetched.items():
+                    self._entries[chunk_id] = (content, now)
+                    self._entries.move_to_end(chunk_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        return contents
+
+    def get(self, chunk_id: str) -> str:
+        return self.get_many([chunk_id]).get(str(chunk_id), "")
+
+    def _fetch(self, chunk_ids) -> Dict[str, str]:
+        from courses.models import AIKnowledgeChunk
+
+        # Vector IDs that aren't chunk UUIDs can't be in the table
+        valid_ids = []
+        for chunk_id in chunk_ids:
+            try:
+                valid_ids.append(uuid.UUID(chunk_id))
+            except ValueError:
+                continue
+        if not valid_ids:
+            return {}
+
+        try:
+            chunks = AIKnowledgeChunk.objects.filter(id__in=valid_ids).only('id', 'content')
+            return {str(chunk.id): chunk.content for chunk in chunks}
+        except Exception as e:
+            logger.error(f"Failed to load chunk content: {e}")
+            return {}
+
+    def invalidate(self, chunk_id: str):
+        with self._lock:
+            self._entries.pop(str(chunk_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+chunk_content_store = ChunkContentStore()
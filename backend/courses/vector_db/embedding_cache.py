@@ -0,0 +1,167 @@
+"""
+Content-addressed cache of text embeddings, shared by ingestion and queries
+"""
+
+import os
+import sqlite3
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+import xxhash
+from django.conf import settings
+import logging
+
+from .embedding_codec import encode_embedding, decode_embedding
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """NFC-normalized text with whitespace runs collapsed"""
+    return ' '.join(unicodedata.normalize('NFC', text or '').split())
+
+
+def cache_key(model: str, text: str) -> str:
+    return f"{model}:{xxhash.xxh3_128_hexdigest(normalize_text(text).encode('utf-8'))}"
+
+
+class RedisEmbeddingStore:
+    """Embeddings in Redis, so every web and Celery process shares them"""
+
+    def __init__(self, url: str, ttl: int = None, prefix: str = 'emb:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        return self.client.mget([self.prefix + key for key in keys])
+
+    def set_many(self, items: Dict[str, bytes]):
+        pipeline = self.client.pipeline(transaction=False)
+        for key, value in items.items():
+            pipeline.set(self.prefix + key, value, ex=self.ttl)
+        pipeline.execute()
+
+
+class SQLiteEmbeddingStore:
+    """Embeddings in a local SQLite file (single-host deployments)"""
+
+    def __init__(self, path: str, table: str = 'embeddings'):
+        self.path = path
+        self.table = table
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        found = {}
+        conn = self._connection()
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ', '.join('?' for _ in batch)
+            found.update(conn.execute(
+                f"SELECT key, value FROM {self.table} WHERE key IN ({placeholders})", batch
+            ).fetchall())
+        return [found.get(key) for key in keys]
+
+    def set_many(self, items: Dict[str, bytes]):
+        conn = self._connection()
+        with conn:
+            conn.executemany(f"INSERT OR REPLACE INTO {self.table} (key, value) VALUES (?, ?)", items.items())
+
+
+class EmbeddingCache:
+    """
+    Embeddings keyed by (model, xxh3-128 of the normalized text).
+
+    Values are stored with the embedding codec (float16 by default), prefixed
+    with their dtype. Store failures are logged and treated as misses, so a
+    cache outage only costs provider calls.
+    """
+
+    def __init__(self, store=None):
+        config = getattr(settings, 'VECTOR_DB_CONFIG', {})
+        self.dtype = config.get('EMBEDDING_CACHE_DTYPE', 'float16')
+        self._store = store
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def store(self):
+        if self._store is None:
+            config = getattr(settings, 'VECTOR_DB_CONFIG', {})
+            backend = config.get('EMBEDDING_CACHE_BACKEND', 'redis')
+            if backend == 'redis':
+                self._store = RedisEmbeddingStore(
+                    config.get('EMBEDDING_CACHE_URL') or settings.CELERY_BROKER_URL,
+                    ttl=config.get('EMBEDDING_CACHE_TTL')
+                )
+            else:
+                self._store = SQLiteEmbeddingStore(
+                    os.path.join(settings.BASE_DIR, 'data/embedding_cache.sqlite3')
+                )
+        return self._store
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Cached embedding of each text, or None"""
+        if not texts:
+            return []
+        try:
+            values = self.store.get_many([cache_key(model, text) for text in texts])
+        except Exception as e:
+            logger.error(f"Embedding cache lookup failed: {e}")
+            values = [None] * len(texts)
+
+        embeddings = []
+        for value in values:
+            if value is None:
+                embeddings.append(None)
+                continue
+            dtype, _, data = bytes(value).partition(b':')
+            embeddings.append(decode_embedding(data, dtype.decode('ascii')))
+
+        hits = sum(embedding is not None for embedding in embeddings)
+        with self._lock:
+            self.hits += hits
+            self.misses += len(embeddings) - hits
+        return embeddings
+
+    def set_many(self, model: str, texts: Sequence[str], embeddings: Sequence):
+        items = {}
+        for text, embedding in zip(texts, embeddings):
+            if embedding is None:
+                continue
+            data, dtype, _ = encode_embedding(embedding, self.dtype)
+            items[cache_key(model, text)] = dtype.encode('ascii') + b':' + data
+        if not items:
+            return
+        try:
+            self.store.set_many(items)
+        except Exception as e:
+            logger.error(f"Embedding cache write failed: {e}")
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        return self.get_many(model, [text])[0]
+
+    def set(self, model: str, text: str, embedding):
+        self.set_many(model, [text], [embedding])
+
+    def get_stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0}
+
+
+embedding_cache = EmbeddingCache()
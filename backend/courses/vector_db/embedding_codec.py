@@ -0,0 +1,83 @@
+"""
+Compact byte encodings for stored embeddings
+"""
+
+import struct
+from typing import Optional, Sequence, Tuple, Union
+import numpy as np
+from django.conf import settings
+
+STORAGE_DTYPES = ('float32', 'float16', 'int8')
+
+# int8 vectors are prefixed with their float32 scale
+_SCALE = struct.Struct('<f')
+
+
+def default_storage_dtype() -> str:
+    return getattr(settings, 'VECTOR_DB_CONFIG', {}).get('EMBEDDING_STORAGE_DTYPE', 'float16')
+
+
+def encode_embedding(embedding: Union[Sequence[float], np.ndarray],
+                     dtype: Optional[str] = None) -> Tuple[bytes, str, int]:
+    """
+    Encode an embedding for ``AIKnowledgeChunk.embedding``.
+    Returns (bytes, dtype, dimension); int8 uses a per-vector scale.
+    """
+    dtype = dtype or default_storage_dtype()
+    vector = np.asarray(embedding, dtype='float32').ravel()
+
+    if dtype == 'float32':
+        data = vector.astype('<f4').tobytes()
+    elif dtype == 'float16':
+        data = vector.astype('<f2').tobytes()
+    elif dtype == 'int8':
+        peak = float(np.abs(vector).max()) if len(vector) else 0.0
+        scale = peak / 127.0 if peak else 1.0
+        codes = np.clip(np.rint(vector / scale), -127, 127).astype('int8')
+        data = _SCALE.pack(scale) + codes.tobytes()
+    else:
+        raise ValueError(f"Unknown embedding storage dtype '{dtype}', expected one of {STORAGE_DTYPES}")
+
+    return data, dtype, len(vector)
+
+
+def decode_embedding(data: Union[bytes, memoryview], dtype: Optional[str] = None,
+                     dimension: Optional[int] = None) -> np.ndarray:
+    """Decode stored embedding bytes to a float32 vector"""
+    data = bytes(data)
+    dtype = dtype or infer_dtype(len(data), dimension)
+
+    if dtype == 'float64':
+        return np.frombuffer(data, dtype='<f8').astype('float32')
+    if dtype == 'float32':
+        return np.frombuffer(data, dtype='<f4').copy()
+    if dtype == 'float16':
+        return np.frombuffer(data, dtype='<f2').astype('float32')
+    if dtype == 'int8':
+        scale, = _SCALE.unpack_from(data)
+        return np.frombuffer(data, dtype='int8', offset=_SCALE.size).astype('float32') * scale
+    raise ValueError(f"Unknown embedding storage dtype '{dtype}'")
+
+
+def infer_dtype(n_bytes: int, dimension: Optional[int] = None) -> str:
+    """Guess the dtype of embeddings stored before the dtype was recorded"""
+    dimension = dimension or 1536
+    if n_bytes == dimension * 8:
+        # np.array(...).tobytes() on Python floats
+        return 'float64'
+    if n_bytes == dimension * 4:
+        return 'float32'
+    if n_bytes == dimension * 2:
+        return 'float16'
+    if n_bytes == dimension + _SCALE.size:
+        return 'int8'
+    # Legacy rows were written as float64 without a dimension
+    return 'float64'
+
+
+def decode_chunk_embedding(chunk) -> Optional[np.ndarray]:
+    """Decoded embedding of an AIKnowledgeChunk, or None"""
+    if not chunk.embedding:
+        return None
+    return decode_embedding(chunk.embedding, getattr(chunk, 'embedding_dtype', None) or None,
+                            chunk.embedding_dimensions)
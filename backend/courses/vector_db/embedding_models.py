@@ -0,0 +1,198 @@
+"""
+Registry of embedding models and the index generation each collection serves
+"""
+
+import glob
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from django.conf import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMBEDDING_MODELS = {
+    'text-embedding-ada-002': {'dimension': 1536, 'provider': 'openai'},
+    'text-embedding-3-small': {'dimension': 1536, 'provider': 'openai'},
+    'all-MiniLM-L6-v2': {'dimension': 384, 'provider': 'local'},
+}
+
+# Labels EmbeddingGenerator stored before chunks recorded the model name
+MODEL_ALIASES = {
+    'openai': 'text-embedding-ada-002',
+    'sentence-transformers': 'all-MiniLM-L6-v2',
+}
+
+# Collection searched by the tutor, course search and imports
+DEFAULT_COLLECTION = 'upperclass_knowledge'
+
+# Indexes built before the registry hold ada-002 vectors at the bare collection path
+LEGACY_INDEX_MODEL = 'text-embedding-ada-002'
+
+
+class UnknownEmbeddingModel(ValueError):
+    """An embedding model missing from VECTOR_DB_CONFIG['EMBEDDING_MODELS']"""
+
+
+class EmbeddingModelRegistry:
+    """
+    Maps embedding model names to their dimension and provider, and each
+    collection to the (model, generation) of the index it serves.
+
+    Every (model, generation) of a collection has its own index files, so
+    vectors of different dimensions never share an index. The live pair is
+    kept in ``data/embedding_generation_<collection>.json``, replaced
+    atomically when a rebuild or re-embedding switches over; the pairs a
+    switch superseded are listed there until their files are removed.
+    """
+
+    def __init__(self, models: Dict[str, Dict[str, Any]] = None, data_dir: str = None):
+        config = getattr(settings, 'VECTOR_DB_CONFIG', {})
+        self.models = models or config.get('EMBEDDING_MODELS', DEFAULT_EMBEDDING_MODELS)
+        self.default_model = config.get('EMBEDDING_MODEL', LEGACY_INDEX_MODEL)
+        self.data_dir = data_dir or os.path.join(settings.BASE_DIR, 'data')
+        self.refresh_interval = config.get('REFRESH_INTERVAL', 1.0)
+        self._states: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    # =============== Models ===============
+
+    def canonical_name(self, model: Optional[str]) -> Optional[str]:
+        if not model:
+            return None
+        return MODEL_ALIASES.get(model, model)
+
+    def __contains__(self, model: str) -> bool:
+        return self.canonical_name(model) in self.models
+
+    def get(self, model: str) -> Dict[str, Any]:
+        name = self.canonical_name(model)
+        if name not in self.models:
+            raise UnknownEmbeddingModel(f"Unknown embedding model '{model}', expected one of {list(self.models)}")
+        return self.models[name]
+
+    def dimension(self, model: str) -> int:
+        return self.get(model)['dimension']
+
+    def provider(self, model: str) -> str:
+        return self.get(model).get('provider', 'openai')
+
+    def model_for_dimension(self, dimension: int, preferred: str = None) -> str:
+        """A registered model producing vectors of this dimension, ``preferred`` first"""
+        candidates = [name for name, spec in self.models.items() if spec['dimension'] == dimension]
+        if not candidates:
+            raise UnknownEmbeddingModel(f"No embedding model produces {dimension}-d vectors")
+        return preferred if preferred in candidates else candidates[0]
+
+    # =============== Generations ===============
+
+    def index_path(self, collection_name: str, model: str, generation: int = 0) -> str:
+        path = f"{self.data_dir}/faiss_{collection_name}"
+        if model == LEGACY_INDEX_MODEL and not generation:
+            return path
+        slug = re.sub(r'[^a-z0-9]+', '_', model.lower()).strip('_')
+        return f"{path}-{slug}-g{generation}"
+
+    def _state_path(self, collection_name: str) -> str:
+        return os.path.join(self.data_dir, f"embedding_generation_{collection_name}.json")
+
+    def _state(self, collection_name: str) -> Dict[str, Any]:
+        read_at, state = self._states.get(collection_name, (0.0, None))
+        if state is not None and time.monotonic() - read_at < self.refresh_interval:
+            return state
+
+        state = {'model': self.default_model, 'generation': 0, 'next_generation': 1}
+        try:
+            with open(self._state_path(collection_name)) as f:
+                state.update(json.load(f))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to read embedding generation of {collection_name}: {e}")
+        self._states[collection_name] = (time.monotonic(), state)
+        return state
+
+    def live(self, collection_name: str) -> Tuple[str, int]:
+        """(model, generation) of the index the collection currently serves"""
+        state = self._state(collection_name)
+        return self.canonical_name(state['model']), int(state['generation'])
+
+    def _write_state(self, collection_name: str, state: Dict[str, Any]):
+        os.makedirs(self.data_dir, exist_ok=True)
+        path = self._state_path(collection_name)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self._states[collection_name] = (time.monotonic(), state)
+
+    def begin_generation(self, collection_name: str) -> int:
+        """Reserve a generation number for a new index, never used before"""
+        with self._lock:
+            self._states.pop(collection_name, None)
+            state = dict(self._state(collection_name))
+            generation = int(state['next_generation'])
+            state['next_generation'] = generation + 1
+            self._write_state(collection_name, state)
+            return generation
+
+    def switch(self, collection_name: str, model: str, generation: int):
+        """Make (model, generation) the collection's live index"""
+        self.get(model)
+        with self._lock:
+            self._states.pop(collection_name, None)
+            state = dict(self._state(collection_name))
+            previous = (self.canonical_name(state['model']), int(state['generation']))
+            current = (self.canonical_name(model), int(generation))
+            retired = [pair for pair in state.get('retired', []) if tuple(pair) != current]
+            if previous != current and list(previous) not in retired:
+                retired.append(list(previous))
+            state.update(model=current[0], generation=current[1], retired=retired)
+            self._write_state(collection_name, state)
+        logger.info(f"Collection {collection_name} switched from {previous[0]} generation {previous[1]} "
+                    f"to {model} generation {generation}")
+
+    # =============== Retired generations ===============
+
+    def retired(self, collection_name: str) -> List[Tuple[str, int]]:
+        """(model, generation) pairs a switch superseded whose files haven't been removed"""
+        return [(model, int(generation)) for model, generation in self._state(collection_name).get('retired', [])]
+
+    @staticmethod
+    def in_generation(path: str, index_path: str) -> bool:
+        """Whether an index or file belongs to the generation at ``index_path`` (its shards and schools included)"""
+        return path == index_path or path.startswith((f"{index_path}.", f"{index_path}__", f"{index_path}_school_"))
+
+    def remove_generation(self, collection_name: str, model: str, generation: int) -> int:
+        """Delete a retired generation's index files, returning how many were removed"""
+        index_path = self.index_path(collection_name, model, generation)
+        if (self.canonical_name(model), int(generation)) == self.live(collection_name):
+            raise ValueError(f"{model} generation {generation} is the live index of {collection_name}")
+
+        paths = glob.glob(f"{glob.escape(index_path)}*")
+        removed = 0
+        for path in paths:
+            if not self.in_generation(path, index_path):
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+            removed += 1
+
+        with self._lock:
+            self._states.pop(collection_name, None)
+            state = dict(self._state(collection_name))
+            state['retired'] = [pair for pair in state.get('retired', []) if tuple(pair) != (model, generation)]
+            self._write_state(collection_name, state)
+        logger.info(f"Removed {removed} files of {collection_name} {model} generation {generation}")
+        return removed
+
+
+embedding_models = EmbeddingModelRegistry()
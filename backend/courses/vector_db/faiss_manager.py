@@ -6,90 +6,457 @@ import numpy as np
 import faiss
 import pickle
 import json
+import threading
+import time
 from typing import List, Dict, Any, Optional
 from django.conf import settings
 import os
 import logging
 
+from .segment_log import SegmentLog, StaleLogPosition
+from .attribute_index import AttributeIndex, build_selector, normalize_value
+from .metadata_store import MetadataStore
+from .simple_db import SimpleVectorDB  # noqa: F401 -- re-exported for existing imports
+
 logger = logging.getLogger(__name__)
 
+INDEX_TYPES = ('flat', 'hnsw', 'ivf_flat', 'ivf_pq')
+IVF_INDEX_TYPES = ('ivf_flat', 'ivf_pq')
+# In-index vector encodings; float16 and int8 use FAISS scalar quantizers
+INDEX_STORAGES = ('float32', 'float16', 'int8')
+
 class FAISSVectorDB:
     """FAISS-based vector database manager"""
     
-    def __init__(self, index_path: str = None, dimension: int = 1536):
+    def __init__(self, index_path: str = None, dimension: int = 1536, fsync: bool = True,
+                 compaction_ratio: float = 1.0, min_compaction_bytes: int = 64 * 1024 * 1024,
+                 index_type: str = None, nlist: int = None, nprobe: int = None, pq_m: int = None,
+                 hnsw_m: int = None, ef_construction: int = None, ef_search: int = None,
+                 min_train_size: int = None, storage: str = None):
         self.dimension = dimension  # OpenAI ada-002 embedding dimension
         self.index_path = index_path or os.path.join(settings.BASE_DIR, 'data/faiss_index')
         
         # Ensure directory exists
         os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
         
-        # Initialize index and metadata
+        # Index type and tuning knobs, defaulting to settings.VECTOR_DB_CONFIG
+        config = getattr(settings, 'VECTOR_DB_CONFIG', {})
+        self.index_type = index_type or config.get('INDEX_TYPE', 'flat')
+        if self.index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{self.index_type}', expected one of {INDEX_TYPES}")
+        
+        self.storage = storage or config.get('INDEX_STORAGE', 'float32')
+        if self.storage not in INDEX_STORAGES:
+            raise ValueError(f"Unknown index storage '{self.storage}', expected one of {INDEX_STORAGES}")
+        
+        self.nlist = nlist or config.get('NLIST')  # None = derived from the training set size
+        self.nprobe = nprobe or config.get('NPROBE', 16)
+        self.pq_m = pq_m or config.get('PQ_M', 64)
+        self.hnsw_m = hnsw_m or config.get('HNSW_M', 32)
+        self.ef_construction = ef_construction or config.get('EF_CONSTRUCTION', 200)
+        self.ef_search = ef_search or config.get('EF_SEARCH', 128)
+        self.min_train_size = min_train_size or config.get('MIN_TRAIN_SIZE', 10000)
+        
+        # Filtered searches with at most this many candidates are scanned exactly
+        self.exact_search_threshold = config.get('EXACT_SEARCH_THRESHOLD', 2048)
+        self.residual_oversample = config.get('RESIDUAL_FILTER_OVERSAMPLE', 10)
+        self.attribute_index = AttributeIndex()
+        
+        # Compaction runs once the log outgrows the base snapshot by this ratio,
+        # which keeps total bytes written linear in the number of vectors
+        self.compaction_ratio = compaction_ratio
+        self.min_compaction_bytes = min_compaction_bytes
+        self.base_bytes = 0
+        # Base snapshot generation the in-memory state was built from
+        self.base_generation = 0
+        # ...or once this fraction of the stored vectors is tombstoned
+        self.tombstone_compaction_ratio = config.get('TOMBSTONE_COMPACTION_RATIO', 0.2)
+        
+        # Initialize index and metadata. Vectors carry stable int64 labels;
+        # the metadata store maps them to vector ids and metadata.
         self.index = None
-        self.metadata = []
-        self.id_to_index = {}
-        self.index_to_id = {}
+        self.metadata = MetadataStore()
+        self.next_label = 0
+        # Labels of deleted vectors still stored in the index; hidden at query
+        # time and physically removed by the next compaction
+        self.tombstones = set()
+        self._tombstone_labels = None
+        # Bumped by every write applied in memory, so caches of search results
+        # can tell when they're stale
+        self.version = 0
+        
+        self._lock = threading.RLock()
+        self._compaction_lock = threading.Lock()
+        self._compaction_thread = None
+        self.log = SegmentLog(self.index_path, fsync=fsync)
         
         # Load existing index if exists
         self._load_index()
     
     def _load_index(self):
-        """Load existing FAISS index from disk"""
+        """Load the base snapshot from disk and replay the log segments on top of it"""
         try:
-            index_file = f"{self.index_path}.index"
-            metadata_file = f"{self.index_path}.metadata"
+            self.log.manifest = self.log.read_manifest()
+            self.log.position = (self.log.manifest['covered'] + 1, 0)
+            self.log.pending_bytes = 0
             
-            if os.path.exists(index_file) and os.path.exists(metadata_file):
-                # Load index
-                self.index = faiss.read_index(index_file)
-                
-                # Load metadata
-                with open(metadata_file, 'rb') as f:
-                    data = pickle.load(f)
-                    self.metadata = data['metadata']
-                    self.id_to_index = data['id_to_index']
-                    self.index_to_id = data['index_to_id']
-                
-                logger.info(f"Loaded FAISS index with {self.index.ntotal} vectors")
+            base_prefix = self.log.base_prefix()
+            legacy_index = f"{self.index_path}.index"
+            self.base_generation = self.log.manifest['base']
+            
+            if base_prefix:
+                self._read_snapshot(base_prefix)
+            elif not self.log.has_manifest() and os.path.exists(legacy_index):
+                # Full-rewrite snapshot written before the segment log existed
+                self._read_snapshot(self.index_path)
             else:
                 # Create new index
                 self._create_new_index()
+            
+            replayed = 0
+            for record in self.log.read_new():
+                self._apply_record(record)
+                replayed += 1
+            
+            logger.info(f"Loaded FAISS index with {self.index.ntotal} vectors "
+                        f"({replayed} log records replayed)")
                 
         except Exception as e:
             logger.error(f"Failed to load FAISS index: {e}")
             self._create_new_index()
     
+    def _read_snapshot(self, prefix: str):
+        """Read a base snapshot (index + metadata) written by ``compact``"""
+        index_file = f"{prefix}.index"
+        columns_dir = f"{prefix}.columns"
+        
+        self.index = faiss.read_index(index_file)
+        
+        if os.path.isdir(columns_dir):
+            # Columns are memory-mapped, not read
+            self.metadata = MetadataStore.open(columns_dir)
+            self.next_label = self.metadata.schema['next_label']
+            self._set_tombstones(self.metadata.schema['tombstones'])
+            metadata_bytes = sum(entry.stat().st_size for entry in os.scandir(columns_dir))
+        else:
+            self._read_pickled_metadata(f"{prefix}.metadata")
+            metadata_bytes = os.path.getsize(f"{prefix}.metadata")
+        
+        self._upgrade_positional_index()
+        
+        self.attribute_index.load(self.metadata)
+        self.base_bytes = os.path.getsize(index_file) + metadata_bytes
+    
+    def _read_pickled_metadata(self, metadata_file: str):
+        """Read metadata from a snapshot written before the columnar store"""
+        with open(metadata_file, 'rb') as f:
+            data = pickle.load(f)
+        
+        metadata = data['metadata']
+        if isinstance(metadata, list):
+            # Snapshot written before stable labels: labels are row positions
+            metadata = dict(enumerate(metadata))
+        index_to_id = data['index_to_id']
+        
+        self.metadata = MetadataStore.from_records(
+            (label, index_to_id[label], metadata[label]) for label in sorted(metadata)
+        )
+        self.next_label = data.get('next_label', len(metadata))
+        self._set_tombstones(data.get('tombstones', ()))
+        for label in self.tombstones:
+            if self.metadata.label_of(index_to_id[label]) == label:
+                self.metadata.unlink(index_to_id[label])
+        logger.info("Read pickled FAISS metadata; it is converted to columns on the next compaction")
+    
+    def _upgrade_positional_index(self):
+        """Give an index loaded from an old snapshot explicit labels (its row positions)"""
+        index = faiss.downcast_index(self.index)
+        if isinstance(index, faiss.IndexIDMap):
+            return
+        if isinstance(index, faiss.IndexIVF):
+            index.set_direct_map_type(faiss.DirectMap.Hashtable)
+            return
+        
+        vectors = self.index.reconstruct_n(0, self.index.ntotal)
+        self.index = self._empty_index()
+        self.index.add_with_ids(vectors, np.arange(len(vectors), dtype='int64'))
+        self._maybe_train_index()
+        logger.info(f"Upgraded FAISS index with {len(vectors)} vectors to stable labels")
+    
     def _create_new_index(self):
         """Create a new FAISS index"""
-        # Using IndexFlatIP (Inner Product) for cosine similarity
-        # Since OpenAI embeddings are normalized, inner product = cosine similarity
-        self.index = faiss.IndexFlatIP(self.dimension)
-        self.metadata = []
-        self.id_to_index = {}
-        self.index_to_id = {}
+        self.index = self._empty_index()
+        self.metadata = MetadataStore()
+        self.next_label = 0
+        self._set_tombstones(())
+        self.attribute_index = AttributeIndex()
+        self.base_bytes = 0
         logger.info("Created new FAISS index")
     
-    def _save_index(self):
-        """Save FAISS index to disk"""
-        try:
-            # Save index
-            index_file = f"{self.index_path}.index"
-            faiss.write_index(self.index, index_file)
-            
-            # Save metadata
-            metadata_file = f"{self.index_path}.metadata"
-            data = {
-                'metadata': self.metadata,
-                'id_to_index': self.id_to_index,
-                'index_to_id': self.index_to_id
-            }
-            
-            with open(metadata_file, 'wb') as f:
-                pickle.dump(data, f)
-            
-            logger.info(f"Saved FAISS index with {self.index.ntotal} vectors")
+    def _empty_index(self):
+        """Empty index of the configured type that accepts explicit int64 labels"""
+        # IVF indexes and int8 quantizers need training data, so vectors are staged
+        # in a flat index until there are enough of them (see _maybe_train_index)
+        if self._needs_training():
+            return faiss.IndexIDMap2(faiss.IndexFlatIP(self.dimension))
+        return faiss.IndexIDMap2(self._build_index())
+    
+    def _needs_training(self) -> bool:
+        return self.index_type in IVF_INDEX_TYPES or self.storage == 'int8'
+    
+    def _is_staging(self) -> bool:
+        """Whether vectors are still held in the flat staging index"""
+        return self._needs_training() and isinstance(self._inner_index(), faiss.IndexFlat)
+    
+    def _quantizer_type(self):
+        """Scalar quantizer for the configured storage, or None for float32"""
+        return {
+            'float16': faiss.ScalarQuantizer.QT_fp16,
+            'int8': faiss.ScalarQuantizer.QT_8bit,
+        }.get(self.storage)
+    
+    def _build_index(self, n_vectors: int = 0):
+        """Create an empty index of the configured type (IVF indexes still need training)"""
+        # All index types use inner product: vectors are L2-normalized on insert,
+        # so inner product = cosine similarity
+        qtype = self._quantizer_type()
+        
+        if self.index_type == 'hnsw':
+            if qtype is None:
+                index = faiss.IndexHNSWFlat(self.dimension, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            else:
+                index = faiss.IndexHNSWSQ(self.dimension, qtype, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = self.ef_construction
+            return index
+        
+        if self.index_type in IVF_INDEX_TYPES:
+            # ~4*sqrt(n) lists, while keeping at least 39 training points per centroid
+            nlist = self.nlist or max(1, min(int(4 * np.sqrt(n_vectors)), n_vectors // 39))
+            quantizer = faiss.IndexFlatIP(self.dimension)
             
-        except Exception as e:
-            logger.error(f"Failed to save FAISS index: {e}")
+            if self.index_type == 'ivf_pq':
+                # PQ codes are already compressed; storage only applies to the other types
+                index = faiss.IndexIVFPQ(quantizer, self.dimension, nlist,
+                                         self._pq_subquantizers(), 8, faiss.METRIC_INNER_PRODUCT)
+            elif qtype is None:
+                index = faiss.IndexIVFFlat(quantizer, self.dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+            else:
+                index = faiss.IndexIVFScalarQuantizer(quantizer, self.dimension, nlist, qtype,
+                                                      faiss.METRIC_INNER_PRODUCT)
+            return index
+        
+        if qtype is None:
+            return faiss.IndexFlatIP(self.dimension)
+        return faiss.IndexScalarQuantizer(self.dimension, qtype, faiss.METRIC_INNER_PRODUCT)
+    
+    def _pq_subquantizers(self) -> int:
+        """Largest number of PQ sub-quantizers <= pq_m that divides the dimension"""
+        m = min(self.pq_m, self.dimension)
+        while self.dimension % m:
+            m -= 1
+        return m
+    
+    def _train_threshold(self) -> int:
+        """Number of vectors needed before the index is trained"""
+        if self.nlist:
+            return max(self.min_train_size, 39 * self.nlist)
+        return self.min_train_size
+    
+    def _maybe_train_index(self):
+        """Swap the flat staging index for a trained index once enough vectors exist"""
+        if not self._is_staging() or self.index.ntotal < self._train_threshold():
+            return
+        
+        start_time = time.time()
+        labels = self._live_labels()
+        vectors = self.index.reconstruct_batch(labels)
+        
+        index = self._build_index(len(vectors))
+        index.train(vectors)
+        if isinstance(index, faiss.IndexIVF):
+            # IVF indexes store labels natively; the hashtable direct map keeps
+            # reconstruct() and remove_ids() working on arbitrary labels
+            index.set_direct_map_type(faiss.DirectMap.Hashtable)
+        else:
+            index = faiss.IndexIDMap2(index)
+        index.add_with_ids(vectors, labels)
+        
+        self.index = index
+        self._forget_tombstones()
+        logger.info(f"Trained {self.index_type}/{self.storage} index on "
+                    f"{len(vectors)} vectors in {time.time() - start_time:.1f}s")
+    
+    def rebuild_index(self):
+        """Rebuild the current vectors into the configured index type and snapshot it"""
+        with self._lock:
+            self._rebuild_live_vectors()
+        
+        self.compact()
+    
+    def _rebuild_live_vectors(self):
+        """Re-add the live vectors, under their existing labels, to a fresh index"""
+        labels = self._live_labels()
+        vectors = self.index.reconstruct_batch(labels)
+        
+        self.index = self._empty_index()
+        self.index.add_with_ids(vectors, labels)
+        self._forget_tombstones()
+        self._maybe_train_index()
+    
+    def _inner_index(self):
+        """The active index, looking through the IndexIDMap2 wrapper"""
+        index = faiss.downcast_index(self.index)
+        if isinstance(index, faiss.IndexIDMap):
+            index = faiss.downcast_index(index.index)
+        return index
+    
+    def _search_params(self, selector=None, k: int = 0):
+        """Per-query search parameters (nprobe / efSearch / IDSelector) for the active index"""
+        index = self._inner_index()
+        if isinstance(index, faiss.IndexIVF):
+            params = faiss.SearchParametersIVF(nprobe=self.nprobe)
+        elif isinstance(index, faiss.IndexHNSW):
+            params = faiss.SearchParametersHNSW(efSearch=max(self.ef_search, k))
+        elif selector is not None:
+            params = faiss.SearchParameters()
+        else:
+            return None
+        
+        if selector is not None:
+            params.sel = selector
+        return params
+    
+    # =============== Persistence ===============
+    
+    def refresh(self):
+        """Pick up records written to the log by other processes"""
+        with self._lock:
+            self._catch_up()
+    
+    def _catch_up(self, repair: bool = False):
+        """Apply records appended to the log by other processes"""
+        try:
+            for record in self.log.read_new(repair=repair):
+                self._apply_record(record)
+        except StaleLogPosition:
+            # Our segment was compacted away before we finished reading it
+            logger.info("FAISS log position is stale, reloading index")
+            self._load_index()
+    
+    def _apply_record(self, record: Dict[str, Any]):
+        """Apply a log record to the in-memory index"""
+        self.version += 1
+        op = record['op']
+        if op == 'add':
+            self._add_to_memory(record['embeddings'], record['metadatas'], record['ids'])
+        elif op == 'delete':
+            self._delete_from_memory(set(record['ids']))
+        else:
+            logger.warning(f"Ignoring unknown FAISS log record: {op}")
+    
+    def _append_record(self, record: Dict[str, Any]):
+        """Durably log a record, then apply it in memory"""
+        with self._lock, self.log.locked():
+            self._catch_up(repair=True)
+            self.log.append(record)
+            self._apply_record(record)
+        
+        self._maybe_compact()
+    
+    def _maybe_compact(self):
+        """Start a background compaction once the log has outgrown the base snapshot"""
+        threshold = max(self.min_compaction_bytes, self.compaction_ratio * self.base_bytes)
+        if self.log.pending_bytes < threshold and self._dead_ratio() < self.tombstone_compaction_ratio:
+            return
+        
+        with self._lock:
+            if self._compaction_thread and self._compaction_thread.is_alive():
+                return
+            self._compaction_thread = threading.Thread(
+                target=self.compact, name=f"faiss-compaction-{os.path.basename(self.index_path)}",
+                daemon=True
+            )
+            self._compaction_thread.start()
+    
+    def compact(self):
+        """Merge the sealed log segments into a new base snapshot"""
+        with self._compaction_lock:
+            store = None
+            try:
+                # Seal the active segment and capture the state it describes.
+                # Writers continue in the new segment while the snapshot is written.
+                with self._lock, self.log.locked():
+                    self._catch_up(repair=True)
+                    covered = self.log.rotate()
+                    generation = self.log.reserve_base()
+                    
+                    if self.tombstones:
+                        self._purge_tombstones()
+                    
+                    index_bytes = faiss.serialize_index(self.index)
+                    store = self.metadata
+                    columns, schema = store.encode()
+                    schema['next_label'] = self.next_label
+                    schema['tombstones'] = sorted(self.tombstones)
+                
+                prefix = self.log.base_prefix(generation)
+                self._write_file(f"{prefix}.index", index_bytes)
+                MetadataStore.write(f"{prefix}.columns", columns, schema, fsync=self.log.fsync)
+                
+                with self.log.locked():
+                    committed = self.log.commit_base(generation, covered)
+                
+                if not committed:
+                    store.discard_journal()
+                    self.log.remove_base(generation)
+                    return
+                
+                with self._lock:
+                    # Drop the in-memory overlays in favour of the mapped columns
+                    if self.metadata is store:
+                        self.metadata = store.rebase(f"{prefix}.columns")
+                        self.base_generation = generation
+                
+                self.base_bytes = len(index_bytes) + sum(column.nbytes for column in columns.values())
+                logger.info(f"Compacted FAISS index with {self.index.ntotal} vectors "
+                            f"into generation {generation}")
+                
+            except Exception as e:
+                if store is not None:
+                    store.discard_journal()
+                logger.error(f"Failed to compact FAISS index: {e}")
+    
+    def _purge_tombstones(self):
+        """Physically remove tombstoned vectors from the index and metadata"""
+        start_time = time.time()
+        labels = self._tombstone_array()
+        index = self._inner_index()
+        
+        if isinstance(index, faiss.IndexIVF):
+            # The hashtable direct map only supports removal by explicit id list
+            index.remove_ids(faiss.IDSelectorArray(labels))
+        elif isinstance(index, faiss.IndexHNSW):
+            # HNSW graphs can't drop nodes, so re-add the survivors
+            self._rebuild_live_vectors()
+        else:
+            self.index.remove_ids(faiss.IDSelectorBatch(labels))
+        
+        self._forget_tombstones()
+        
+        logger.info(f"Purged {len(labels)} deleted vectors from FAISS index "
+                    f"in {time.time() - start_time:.2f}s")
+    
+    def _write_file(self, path: str, data: bytes):
+        """Write a file atomically (temp file + fsync + rename)"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            if self.log.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    
+    # =============== Writes ===============
     
     def add_embeddings(self, embeddings: List[np.ndarray], metadatas: List[Dict], ids: List[str]):
         """Add embeddings to the index"""
@@ -103,54 +470,109 @@ class FAISSVectorDB:
         # Normalize embeddings for cosine similarity
         faiss.normalize_L2(embeddings_array)
         
-        # Add to index
-        start_idx = self.index.ntotal
-        self.index.add(embeddings_array)
-        
-        # Update metadata and id mappings
-        for i, (metadata, vector_id) in enumerate(zip(metadatas, ids)):
-            idx = start_idx + i
-            self.metadata.append(metadata)
-            self.id_to_index[vector_id] = idx
-            self.index_to_id[idx] = vector_id
-        
-        # Save index
-        self._save_index()
+        # Only this batch is written to disk, not the whole index
+        self._append_record({
+            'op': 'add',
+            'embeddings': embeddings_array,
+            'metadatas': list(metadatas),
+            'ids': list(ids)
+        })
         
         logger.info(f"Added {len(embeddings)} embeddings to FAISS index")
     
-    def search(self, query_embedding: np.ndarray, k: int = 10, filters: Optional[Dict] = None) -> List[Dict[str, Any]]:
-        """Search for similar vectors"""
-        
-        if self.index.ntotal == 0:
-            return []
-        
-        # Prepare query
-        query_array = np.array([query_embedding]).astype('float32')
-        faiss.normalize_L2(query_array)
+    def _add_to_memory(self, embeddings_array: np.ndarray, metadatas: List[Dict], ids: List[str]):
+        """Add already normalized embeddings to the in-memory index"""
         
-        # Search
-        distances, indices = self.index.search(query_array, min(k, self.index.ntotal))
+        # Add to index under fresh labels
+        labels = np.arange(self.next_label, self.next_label + len(ids), dtype='int64')
+        self.next_label += len(ids)
+        self.index.add_with_ids(embeddings_array, labels)
         
-        # Prepare results
+        # Update metadata and id mappings
+        for idx, metadata, vector_id in zip(labels.tolist(), metadatas, ids):
+            previous = self.metadata.add(idx, vector_id, metadata)
+            if previous is not None:
+                # Re-adding an id replaces the stored vector
+                self._tombstone(previous)
+            self.attribute_index.add(idx, metadata)
+        
+        self._maybe_train_index()
+    
+    def search(self, query_embedding: np.ndarray, k: int = 10, filters: Optional[Dict] = None) -> List[Dict[str, Any]]:
+        """Search for similar vectors, applying indexed metadata filters inside the search"""
+        return self.search_batch(np.array([query_embedding]), k=k, filters_per_query=[filters])[0]
+    
+    def search_batch(self, query_matrix: np.ndarray, k: int = 10,
+                     filters_per_query: Optional[Any] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Search many queries at once. ``filters_per_query`` is one filter dict
+        per query, a single dict applied to every query, or None. Queries that
+        share the same indexed filters go through a single FAISS call.
+        """
+        
+        # Prepare queries
+        query_array = np.array(query_matrix, dtype='float32', ndmin=2)
+        n_queries = len(query_array)
+        if filters_per_query is None or isinstance(filters_per_query, dict):
+            filters_per_query = [filters_per_query] * n_queries
+        if len(filters_per_query) != n_queries:
+            raise ValueError("filters_per_query must have one entry per query")
+        
+        # Compaction and training swap the index and drop metadata rows under the
+        # lock, and one instance serves every request thread of the process
+        with self._lock:
+            if self.index.ntotal == len(self.tombstones):
+                return [[] for _ in range(n_queries)]
+            faiss.normalize_L2(query_array)
+            
+            # Filters on indexed attributes become an IDSelector; anything else
+            # is checked afterwards, so over-fetch to leave room for rejects
+            groups: Dict[tuple, List[int]] = {}
+            split = [self.attribute_index.split_filters(filters) for filters in filters_per_query]
+            for row, (indexed_filters, _) in enumerate(split):
+                key = tuple(sorted((attr, normalize_value(value)) for attr, value in indexed_filters.items()))
+                groups.setdefault(key, []).append(row)
+            
+            results = [None] * n_queries
+            for rows in groups.values():
+                indexed_filters = split[rows[0]][0]
+                fetch_k = k * self.residual_oversample if any(split[row][1] for row in rows) else k
+                
+                # Search
+                if indexed_filters:
+                    candidates = self.attribute_index.match(indexed_filters)
+                    if self.tombstones:
+                        candidates = np.setdiff1d(candidates, self._tombstone_array(), assume_unique=True)
+                    distances, indices = self._filtered_search(query_array[rows], candidates, fetch_k)
+                else:
+                    distances, indices = self._unfiltered_search(query_array[rows], fetch_k)
+                
+                for i, row in enumerate(rows):
+                    results[row] = self._collect_results(distances[i], indices[i], split[row][1], k)
+            
+            return results
+    
+    def _collect_results(self, distances: np.ndarray, indices: np.ndarray,
+                         residual_filters: Dict, k: int) -> List[Dict[str, Any]]:
+        """Turn one query's labels into result dicts, applying filters that have no posting list"""
         results = []
-        for distance, idx in zip(distances[0], indices[0]):
+        for distance, idx in zip(distances, indices):
             if idx == -1:  # No more results
                 continue
             
             # Get metadata
-            metadata = self.metadata[idx]
-            vector_id = self.index_to_id.get(idx, f"idx_{idx}")
+            metadata = self.metadata.get(idx)
+            vector_id = self.metadata.id_of(idx) or f"idx_{idx}"
             
-            # Apply filters if provided
-            if filters and not self._passes_filters(metadata, filters):
+            # Apply filters that have no posting list
+            if residual_filters and not self._passes_filters(metadata, residual_filters):
                 continue
             
             results.append({
                 'id': vector_id,
                 'metadata': metadata,
                 'similarity_score': float(distance),  # Cosine similarity (0-1)
-                'index': idx
+                'index': int(idx)
             })
         
         # Sort by similarity score (descending)
@@ -158,6 +580,131 @@ class FAISSVectorDB:
         
         return results[:k]
     
+    def _unfiltered_search(self, query_array: np.ndarray, k: int):
+        """Search every live vector; tombstoned labels are excluded inside the index"""
+        wanted = min(k, self.index.ntotal - len(self.tombstones))
+        if not self.tombstones:
+            return self.index.search(query_array, wanted, params=self._search_params(k=wanted))
+        
+        dead = faiss.IDSelectorBatch(self._tombstone_array())
+        selector = faiss.IDSelectorNot(dead)
+        params = self._search_params(selector, k=wanted)
+        
+        distances, indices = self.index.search(query_array, wanted, params=params)
+        for _ in range(2):
+            short = (indices >= 0).sum(axis=1) < wanted
+            if not short.any() or not self._widen_search(params):
+                break
+            distances[short], indices[short] = self.index.search(query_array[short], wanted, params=params)
+        return distances, indices
+    
+    def _filtered_search(self, query_array: np.ndarray, candidates: np.ndarray, k: int):
+        """
+        Search restricted to candidate labels. Returns min(k, len(candidates))
+        hits per query: small candidate sets are scanned exactly, larger ones
+        go through the index with an IDSelector, widening nprobe/efSearch for
+        queries whose ANN traversal runs out of matching vectors.
+        """
+        wanted = min(k, len(candidates))
+        if wanted == 0:
+            n_queries = len(query_array)
+            return np.empty((n_queries, 0), dtype='float32'), np.empty((n_queries, 0), dtype='int64')
+        
+        if len(candidates) <= self.exact_search_threshold:
+            return self._exact_search(query_array, candidates, wanted)
+        
+        selector, _selector_data = build_selector(candidates, self._label_space())
+        params = self._search_params(selector, k=wanted)
+        
+        distances, indices = self.index.search(query_array, wanted, params=params)
+        short = (indices >= 0).sum(axis=1) < wanted
+        for _ in range(2):
+            if not short.any() or not self._widen_search(params):
+                break
+            distances[short], indices[short] = self.index.search(query_array[short], wanted, params=params)
+            short = (indices >= 0).sum(axis=1) < wanted
+        
+        if short.any():
+            distances[short], indices[short] = self._exact_search(query_array[short], candidates, wanted)
+        return distances, indices
+    
+    def _exact_search(self, query_array: np.ndarray, candidates: np.ndarray, k: int, block_size: int = 4096):
+        """Brute-force top-k over the candidate labels for every query, in bounded-memory blocks"""
+        n_queries = len(query_array)
+        best_scores = np.empty((n_queries, 0), dtype='float32')
+        best_labels = np.empty((n_queries, 0), dtype='int64')
+        
+        for start in range(0, len(candidates), block_size):
+            block = candidates[start:start + block_size]
+            block_scores = query_array @ self.index.reconstruct_batch(block).T
+            scores = np.concatenate([best_scores, block_scores], axis=1)
+            labels = np.concatenate([best_labels, np.broadcast_to(block, block_scores.shape)], axis=1)
+            
+            if scores.shape[1] > k:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, top, axis=1)
+                labels = np.take_along_axis(labels, top, axis=1)
+            best_scores, best_labels = scores, labels
+        
+        order = np.argsort(-best_scores, axis=1)
+        return np.take_along_axis(best_scores, order, axis=1), np.take_along_axis(best_labels, order, axis=1)
+    
+    
+    def _widen_search(self, params) -> bool:
+        """Raise nprobe / efSearch for a retry; False when already exhaustive"""
+        if isinstance(params, faiss.SearchParametersIVF):
+            nlist = faiss.extract_index_ivf(self.index).nlist
+            if params.nprobe >= nlist:
+                return False
+            params.nprobe = min(nlist, params.nprobe * 4)
+            return True
+        if isinstance(params, faiss.SearchParametersHNSW):
+            if params.efSearch >= 4096:
+                return False
+            params.efSearch = params.efSearch * 4
+            return True
+        return False
+    
+    def _label_space(self) -> int:
+        """Upper bound (exclusive) of the labels stored in the index"""
+        return self.next_label
+    
+    # =============== Tombstones ===============
+    
+    def _tombstone(self, label: int):
+        """Hide a stored vector from searches until the next compaction"""
+        self.tombstones.add(label)
+        self._tombstone_labels = None
+    
+    def _set_tombstones(self, labels):
+        self.tombstones = set(labels)
+        self._tombstone_labels = None
+    
+    def _forget_tombstones(self):
+        """Drop the metadata of tombstoned vectors once the index no longer holds them"""
+        if not self.tombstones:
+            return
+        self.metadata.remove(self._tombstone_array().tolist())
+        self._set_tombstones(())
+        self.attribute_index.load(self.metadata)
+    
+    def _tombstone_array(self) -> np.ndarray:
+        """Sorted int64 array of tombstoned labels (cached until the set changes)"""
+        if self._tombstone_labels is None:
+            self._tombstone_labels = np.array(sorted(self.tombstones), dtype='int64')
+        return self._tombstone_labels
+    
+    def _live_labels(self) -> np.ndarray:
+        """Sorted labels of the vectors that have not been deleted"""
+        labels = self.metadata.labels()
+        if not self.tombstones:
+            return labels
+        return np.setdiff1d(labels, self._tombstone_array(), assume_unique=True)
+    
+    def _dead_ratio(self) -> float:
+        """Fraction of the stored vectors that are tombstoned"""
+        return len(self.tombstones) / self.index.ntotal if self.index.ntotal else 0.0
+    
     def _passes_filters(self, metadata: Dict, filters: Dict) -> bool:
         """Check if metadata passes all filters"""
         for key, value in filters.items():
@@ -178,165 +725,78 @@ class FAISSVectorDB:
         return True
     
     def delete_by_ids(self, ids: List[str]) -> int:
-        """Delete vectors by IDs (FAISS doesn't support deletion, so we recreate)"""
+        """Delete vectors by IDs"""
         
         if not ids:
             return 0
         
-        # Get indices to keep
-        indices_to_keep = []
-        new_metadata = []
-        new_id_to_index = {}
-        new_index_to_id = {}
-        
-        new_idx = 0
-        for old_idx, metadata in enumerate(self.metadata):
-            vector_id = self.index_to_id.get(old_idx)
-            
-            if vector_id not in ids:
-                # Keep this vector
-                indices_to_keep.append(old_idx)
-                new_metadata.append(metadata)
-                new_id_to_index[vector_id] = new_idx
-                new_index_to_id[new_idx] = vector_id
-                new_idx += 1
-        
-        if len(indices_to_keep) == len(self.metadata):
+        existing = [vector_id for vector_id in ids if self.metadata.label_of(vector_id) is not None]
+        if not existing:
             # Nothing to delete
             return 0
         
-        # Reconstruct index with only kept vectors
-        # Get all embeddings
-        all_embeddings = self.index.reconstruct_n(0, self.index.ntotal)
-        
-        # Keep only selected embeddings
-        kept_embeddings = all_embeddings[indices_to_keep]
-        
-        # Create new index
-        new_index = faiss.IndexFlatIP(self.dimension)
-        faiss.normalize_L2(kept_embeddings)
-        new_index.add(kept_embeddings)
-        
-        # Update instance variables
-        self.index = new_index
-        self.metadata = new_metadata
-        self.id_to_index = new_id_to_index
-        self.index_to_id = new_index_to_id
-        
-        # Save
-        self._save_index()
+        self._append_record({'op': 'delete', 'ids': existing})
         
-        deleted_count = len(ids) - (len(self.metadata) - len(indices_to_keep))
-        logger.info(f"Deleted {deleted_count} vectors from FAISS index")
+        logger.info(f"Deleted {len(existing)} vectors from FAISS index")
         
-        return deleted_count
+        return len(existing)
+    
+    def _delete_from_memory(self, ids: set):
+        """Tombstone the given IDs; the index itself is only rewritten by compaction"""
+        for vector_id in ids:
+            label = self.metadata.unlink(vector_id)
+            if label is not None:
+                self._tombstone(label)
+    
+    def delete_by_filters(self, filters: Dict[str, Any]) -> int:
+        """Delete every vector whose indexed attributes match the filters"""
+        indexed_filters, residual_filters = self.attribute_index.split_filters(filters)
+        if residual_filters or not indexed_filters:
+            raise ValueError(f"delete_by_filters only supports indexed attributes: "
+                             f"{self.attribute_index.attributes}")
+        
+        with self._lock:
+            labels = self.attribute_index.match(indexed_filters)
+            ids = [self.metadata.id_of(label) for label in labels.tolist() if label not in self.tombstones]
+        
+        return self.delete_by_ids(ids)
+    
+    def has_value(self, attribute: str, value: Any) -> bool:
+        """Whether any live vector carries this value of an indexed attribute"""
+        if attribute not in self.attribute_index.postings:
+            raise ValueError(f"has_value only supports indexed attributes: {self.attribute_index.attributes}")
+        
+        with self._lock:
+            labels = self.attribute_index.match({attribute: value})
+            if self.tombstones and len(labels):
+                labels = np.setdiff1d(labels, self._tombstone_array(), assume_unique=True)
+            return bool(len(labels))
     
     def get_stats(self) -> Dict[str, Any]:
         """Get index statistics"""
         
-        return {
-            'total_vectors': self.index.ntotal,
-            'dimension': self.dimension,
-            'index_type': 'IndexFlatIP',
-            'is_trained': self.index.is_trained,
-            'metadata_count': len(self.metadata)
-        }
+        with self._lock:
+            return {
+                'total_vectors': self.index.ntotal,
+                'dimension': self.dimension,
+                'index_type': type(self._inner_index()).__name__,
+                'configured_index_type': self.index_type,
+                'storage': self.storage,
+                'nprobe': self.nprobe,
+                'ef_search': self.ef_search,
+                'is_trained': self.index.is_trained,
+                'metadata_count': len(self.metadata),
+                'live_vectors': self.index.ntotal - len(self.tombstones),
+                'tombstones': len(self.tombstones),
+                'base_generation': self.base_generation,
+                'pending_log_bytes': self.log.pending_bytes
+            }
     
     def clear(self):
         """Clear all vectors from index"""
-        self._create_new_index()
-        self._save_index()
+        with self._lock, self.log.locked():
+            self.log.reset()
+            self.base_generation = 0
+            self._create_new_index()
+            self.version += 1
         logger.info("Cleared FAISS index")
-
-class SimpleVectorDB:
-    """
-    Simple in-memory vector database for development/testing
-    Uses numpy and scipy for similarity calculations
-    """
-    
-    def __init__(self, dimension: int = 1536):
-        self.dimension = dimension
-        self.embeddings = []
-        self.metadatas = []
-        self.ids = []
-        
-    def add_embeddings(self, embeddings: List[np.ndarray], metadatas: List[Dict], ids: List[str]):
-        """Add embeddings to the database"""
-        
-        if len(embeddings) != len(metadatas) or len(embeddings) != len(ids):
-            raise ValueError("Embeddings, metadatas, and ids must have the same length")
-        
-        self.embeddings.extend(embeddings)
-        self.metadatas.extend(metadatas)
-        self.ids.extend(ids)
-    
-    def search(self, query_embedding: np.ndarray, k: int = 10, filters: Optional[Dict] = None) -> List[Dict[str, Any]]:
-        """Search for similar vectors using cosine similarity"""
-        
-        if not self.embeddings:
-            return []
-        
-        # Calculate cosine similarities
-        from scipy.spatial.distance import cdist
-        
-        query_array = np.array([query_embedding])
-        embeddings_array = np.array(self.embeddings)
-        
-        # Normalize for cosine similarity
-        from numpy.linalg import norm
-        query_norm = norm(query_array, axis=1, keepdims=True)
-        embeddings_norm = norm(embeddings_array, axis=1, keepdims=True)
-        
-        query_normalized = query_array / query_norm
-        embeddings_normalized = embeddings_array / embeddings_norm
-        
-        # Calculate cosine similarities
-        similarities = np.dot(embeddings_normalized, query_normalized.T).flatten()
-        
-        # Get top k indices
-        top_k = min(k, len(similarities))
-        top_indices = np.argsort(similarities)[::-1][:top_k]
-        
-        # Prepare results
-        results = []
-        for idx in top_indices:
-            similarity = float(similarities[idx])
-            
-            # Apply filters
-            if filters and not self._passes_filters(self.metadatas[idx], filters):
-                continue
-            
-            results.append({
-                'id': self.ids[idx],
-                'metadata': self.metadatas[idx],
-                'similarity_score': similarity,
-                'index': idx
-            })
-        
-        return results
-    
-    def _passes_filters(self, metadata: Dict, filters: Dict) -> bool:
-        """Check if metadata passes all filters"""
-        for key, value in filters.items():
-            if value is None:
-                continue
-            
-            metadata_value = metadata.get(key)
-            if metadata_value is None:
-                return False
-            
-            if isinstance(value, str) and isinstance(metadata_value, str):
-                if value.lower() != metadata_value.lower():
-                    return False
-            elif value != metadata_value:
-                return False
-        
-        return True
-    
-    def get_stats(self) -> Dict[str, Any]:
-        """Get database statistics"""
-        return {
-            'total_vectors': len(self.embeddings),
-            'dimension': self.dimension,
-            'type': 'SimpleVectorDB (in-memory)'
-        }
\ No newline at end of file
@@ -0,0 +1,212 @@
+"""
+On-disk BM25 keyword index over knowledge chunks (SQLite FTS5)
+"""
+
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+from django.conf import settings
+import logging
+
+from .attribute_index import normalize_value
+
+logger = logging.getLogger(__name__)
+
+# Chunk metadata stored next to the text, so hits can be filtered and returned
+# without touching the main database
+KEYWORD_METADATA = ('title', 'subject', 'topic', 'difficulty_level', 'content_type', 'source_id')
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+class KeywordIndex:
+    """
+    BM25 index over chunk title, subtopics and content.
+
+    Text lives in an FTS5 table whose rowids point into a plain ``documents``
+    table holding the chunk ID and filterable metadata. The file is shared by
+    every process (WAL mode); each thread opens its own connection. Every
+    write bumps a counter stored in the file (``version``), so caches of
+    search results notice writes made by any process.
+    """
+
+    def __init__(self, path: str = None):
+        config = getattr(settings, 'VECTOR_DB_CONFIG', {})
+        self.path = path or os.path.join(settings.BASE_DIR, 'data/bm25_upperclass_knowledge.sqlite3')
+        # Column weights for title, subtopics and content
+        self.weights = config.get('BM25_WEIGHTS', (3.0, 2.0, 1.0))
+        self.max_query_terms = config.get('BM25_MAX_QUERY_TERMS', 32)
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._create_schema(conn)
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self, conn: sqlite3.Connection):
+        metadata_columns = ', '.join(f"{column} TEXT" for column in KEYWORD_METADATA)
+        with conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS documents ("
+                f"id INTEGER PRIMARY KEY, chunk_id TEXT UNIQUE NOT NULL, school_id TEXT, {metadata_columns})"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0)")
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chunks_fts'"
+            ).fetchone()
+            if not exists:
+                conn.execute(
+                    "CREATE VIRTUAL TABLE chunks_fts USING fts5("
+                    "title, subtopics, content, tokenize = 'porter unicode61')"
+                )
+                weights = ', '.join(str(float(weight)) for weight in self.weights)
+                conn.execute("INSERT INTO chunks_fts(chunks_fts, rank) VALUES ('rank', ?)",
+                             (f"bm25({weights})",))
+
+    # =============== Writes ===============
+
+    def add_chunks(self, chunks: Iterable[Any]):
+        """Index (or re-index) AIKnowledgeChunk instances"""
+        conn = self._connection()
+        with conn:
+            for chunk in chunks:
+                self._upsert(conn, chunk)
+            self._bump_version(conn)
+
+    def add_chunk(self, chunk: Any):
+        self.add_chunks([chunk])
+
+    def _upsert(self, conn: sqlite3.Connection, chunk: Any):
+        chunk_id = str(chunk.id)
+        source = chunk.source if chunk.source_id else None
+        school_id = getattr(source, 'school_id', None)
+        metadata = {
+            'title': chunk.title,
+            'subject': normalize_value(chunk.subject),
+            'topic': normalize_value(chunk.topic),
+            'difficulty_level': normalize_value(chunk.difficulty_level),
+            'content_type': normalize_value(chunk.content_type),
+            'source_id': str(chunk.source_id) if chunk.source_id else None,
+        }
+        subtopics = ' '.join(chunk.subtopics or []) if isinstance(chunk.subtopics, list) else str(chunk.subtopics or '')
+
+        self._delete(conn, chunk_id)
+        columns = ', '.join(KEYWORD_METADATA)
+        placeholders = ', '.join('?' for _ in KEYWORD_METADATA)
+        row_id = conn.execute(
+            f"INSERT INTO documents (chunk_id, school_id, {columns}) VALUES (?, ?, {placeholders})",
+            [chunk_id, str(school_id) if school_id else None] + [metadata[column] for column in KEYWORD_METADATA]
+        ).lastrowid
+        conn.execute(
+            "INSERT INTO chunks_fts (rowid, title, subtopics, content) VALUES (?, ?, ?, ?)",
+            (row_id, chunk.title, subtopics, chunk.content)
+        )
+
+    def remove_chunks(self, chunk_ids: Iterable[str]):
+        conn = self._connection()
+        with conn:
+            for chunk_id in chunk_ids:
+                self._delete(conn, str(chunk_id))
+            self._bump_version(conn)
+
+    def _delete(self, conn: sqlite3.Connection, chunk_id: str):
+        row = conn.execute("SELECT id FROM documents WHERE chunk_id = ?", (chunk_id,)).fetchone()
+        if row is not None:
+            conn.execute("DELETE FROM chunks_fts WHERE rowid = ?", row)
+            conn.execute("DELETE FROM documents WHERE id = ?", row)
+
+    def clear(self):
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM chunks_fts")
+            conn.execute("DELETE FROM documents")
+            self._bump_version(conn)
+
+    def _bump_version(self, conn: sqlite3.Connection):
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+
+    @property
+    def version(self) -> int:
+        """Write counter of the index, shared by every process"""
+        try:
+            return self._connection().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+        except sqlite3.Error as e:
+            logger.error(f"Failed to read keyword index version: {e}")
+            return -1
+
+    # =============== Search ===============
+
+    def match_expression(self, query: str) -> Optional[str]:
+        """FTS5 query matching any of the query's terms (quoted, so no operator syntax leaks in)"""
+        terms = list(dict.fromkeys(term.lower() for term in _TOKEN.findall(query or '')))
+        if not terms:
+            return None
+        return ' OR '.join(f'"{term}"' for term in terms[:self.max_query_terms])
+
+    def search(self, query: str, filters: Optional[Dict[str, Any]] = None, limit: int = 10,
+               school_id: Any = None) -> List[Dict[str, Any]]:
+        """
+        Best BM25 matches for a query, most relevant first. Only shared chunks
+        are searched, plus the given school's private ones.
+        """
+        expression = self.match_expression(query)
+        if expression is None or limit <= 0:
+            return []
+
+        conditions = ["chunks_fts MATCH ?"]
+        params: List[Any] = [expression]
+        if school_id is None:
+            conditions.append("d.school_id IS NULL")
+        else:
+            conditions.append("(d.school_id IS NULL OR d.school_id = ?)")
+            params.append(str(school_id))
+
+        # Filters on keys that aren't stored here can't be checked, so they're ignored
+        for key, value in (filters or {}).items():
+            if value is not None and key in KEYWORD_METADATA and key != 'title':
+                conditions.append(f"d.{key} = ?")
+                params.append(str(normalize_value(value)))
+
+        columns = ', '.join(f"d.{column}" for column in KEYWORD_METADATA)
+        sql = (
+            f"SELECT d.chunk_id, {columns}, chunks_fts.rank FROM chunks_fts "
+            f"JOIN documents d ON d.id = chunks_fts.rowid "
+            f"WHERE {' AND '.join(conditions)} ORDER BY chunks_fts.rank LIMIT ?"
+        )
+        params.append(int(limit))
+
+        try:
+            rows = self._connection().execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Keyword search failed: {e}")
+            return []
+
+        return [
+            {
+                'id': row[0],
+                'metadata': dict(zip(KEYWORD_METADATA, row[1:-1])),
+                # FTS5 ranks are negated BM25 scores
+                'keyword_score': -float(row[-1]),
+            }
+            for row in rows
+        ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        count = self._connection().execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        return {
+            'documents': count,
+            'path': self.path,
+            'bytes': os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+        }
+
+
+keyword_index = KeywordIndex()
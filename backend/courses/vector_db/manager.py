@@ -2,32 +2,324 @@
 Vector Database Manager - Now using FAISS instead of ChromaDB
 """
 
+import glob
+import heapq
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from typing import List, Dict, Any, Optional
 from django.conf import settings
 import logging
 
+from .attribute_index import normalize_value
+from .registry import vector_index_registry
+from .content_store import chunk_content_store
+from .keyword_index import keyword_index
+from .embedding_models import embedding_models
+
 logger = logging.getLogger(__name__)
 
+# Threads for searching shards in parallel (FAISS releases the GIL while searching)
+_search_pool = None
+_search_pool_lock = threading.Lock()
+
+
+def _get_search_pool() -> ThreadPoolExecutor:
+    global _search_pool
+    with _search_pool_lock:
+        if _search_pool is None:
+            workers = getattr(settings, 'VECTOR_DB_CONFIG', {}).get('SHARD_SEARCH_WORKERS', 8)
+            _search_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='vector-shard')
+        return _search_pool
+
 # Try to import FAISS, fallback to simple implementation
 try:
     from .faiss_manager import FAISSVectorDB
     VectorDBClass = FAISSVectorDB
     logger.info("Using FAISS vector database")
 except ImportError:
-    from .faiss_manager import SimpleVectorDB
+    from .simple_db import SimpleVectorDB
     VectorDBClass = SimpleVectorDB
     logger.warning("FAISS not installed, using simple in-memory vector database")
 
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[tuple]:
+    """Fuse ranked ID lists: each ID scores sum(1 / (k + rank)), best first"""
+    scores = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class VectorQuotaExceeded(Exception):
+    """Adding chunks would take a school's collection past its vector quota"""
+
+
 class VectorDBManager:
-    """Manage vector database for knowledge chunks"""
+    """
+    Manage vector database for knowledge chunks.
+    
+    With ``VECTOR_DB_CONFIG['SHARD_BY']`` set, the collection is split into one
+    index per value of that metadata key (``data/faiss_<collection>__<value>``).
+    Queries filtering on the key only search their shard; other queries search
+    every shard in parallel and merge the top-k hits.
     
-    def __init__(self, collection_name: str = "upperclass_knowledge"):
+    A manager for a ``School`` writes to the school's private collection
+    (``data/faiss_<collection>_school_<id>``, created on first write) and
+    searches it alongside the shared collection.
+    
+    Each embedding model has its own indexes (see ``embedding_models``). A
+    manager serves one model, by default the collection's live model and
+    generation; chunks and queries embedded with another registered model go
+    to that model's indexes. Unless built for a given generation, a manager
+    moves to the new index when a rebuild or re-embedding switches over.
+    """
+    
+    def __init__(self, collection_name: str = "upperclass_knowledge", shard_by: str = None, school=None,
+                 embedding_model: str = None, generation: int = None):
         self.collection_name = collection_name
-        self.vector_db = VectorDBClass(
-            index_path=f"{settings.BASE_DIR}/data/faiss_{collection_name}",
-            dimension=1536  # OpenAI ada-002 embedding dimension
-        )
+        self.school = school
+        
+        config = getattr(settings, 'VECTOR_DB_CONFIG', {})
+        self.shard_by = (config.get('SHARD_BY') if shard_by is None else shard_by) or None
+        
+        # Handles to shared indexes, by index path: one index per process,
+        # shared by every manager (and tutor session)
+        self._handles = {}
+        self._handles_lock = threading.Lock()
+        self._generation_lock = threading.Lock()
+        self._listing_interval = config.get('REFRESH_INTERVAL', 1.0)
+        self._index = None
+        self._model_managers = {}
+        self._school_quotas = config.get('SCHOOL_VECTOR_QUOTAS', {})
+        
+        # What the manager was asked to serve; None follows the live index
+        self._requested_model = embedding_models.canonical_name(embedding_model)
+        self._requested_generation = generation
+        self._use_generation(*self._resolve_generation())
+        
+        self.hybrid_candidates = config.get('HYBRID_CANDIDATES', 50)
+        self.rrf_k = config.get('RRF_K', 60)
+    
+    # =============== Generations ===============
+    
+    def _resolve_generation(self) -> tuple:
+        """(model, generation) of the indexes this manager should use now"""
+        live_model, live_generation = embedding_models.live(self.collection_name)
+        model = self._requested_model or live_model
+        generation = self._requested_generation
+        if generation is None:
+            generation = live_generation if model == live_model else 0
+        return model, generation
+    
+    def _use_generation(self, model: str, generation: int):
+        """Point the manager at a (model, generation), releasing the previous one's indexes"""
+        self.close()
+        self.embedding_model = model
+        self.generation = generation
+        self.dimension = embedding_models.dimension(model)
+        self.index_path = embedding_models.index_path(self.collection_name, model, generation)
+        self.school_index_path = f"{self.index_path}_school_{self.school.pk}" if self.school is not None else None
+        self._shard_listing = (0.0, [])
+        self._school_listing = (0.0, False)
+        if not self.shard_by or self._has_index(self.index_path):
+            # Sharded collections still search an unsharded index left from before sharding
+            self._index = self._acquire(self.index_path)
+    
+    def _follow_live_generation(self):
+        """Move to the live index if a rebuild or re-embedding has switched over since the last call"""
+        if self._requested_generation is not None:
+            return
+        resolved = self._resolve_generation()
+        if resolved == (self.embedding_model, self.generation):
+            return
+        with self._generation_lock:
+            if resolved != (self.embedding_model, self.generation):
+                logger.info(f"Moving {self.collection_name} from {self.embedding_model} generation "
+                            f"{self.generation} to {resolved[0]} generation {resolved[1]}")
+                self._use_generation(*resolved)
+    
+    @property
+    def vector_db(self):
+        """The collection's unsharded index, loaded on first use"""
+        self._follow_live_generation()
+        if self._index is None:
+            self._index = self._acquire(self.index_path)
+        return self._index.db
+    
+    def close(self):
+        """Release this manager's references to the shared indexes"""
+        with self._handles_lock:
+            handles = list(self._handles.values())
+            self._handles = {}
+            self._index = None
+            model_managers = list(self._model_managers.values())
+            self._model_managers = {}
+        for handle in handles:
+            vector_index_registry.release(handle)
+        for manager in model_managers:
+            manager.close()
+    
+    def for_model(self, embedding_model: str) -> 'VectorDBManager':
+        """Manager of the same collection (and school) over another embedding model's indexes"""
+        name = embedding_models.canonical_name(embedding_model)
+        if name == self.embedding_model:
+            return self
+        with self._handles_lock:
+            manager = self._model_managers.get(name)
+            if manager is None:
+                manager = VectorDBManager(
+                    self.collection_name, shard_by=self.shard_by or '', school=self.school, embedding_model=name
+                )
+                self._model_managers[name] = manager
+            return manager
+    
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+    
+    # =============== Shards ===============
+    
+    def _acquire(self, index_path: str):
+        with self._handles_lock:
+            handle = self._handles.get(index_path)
+            if handle is None:
+                handle = vector_index_registry.acquire(
+                    index_path,
+                    lambda: VectorDBClass(
+                        index_path=index_path,
+                        dimension=self.dimension
+                    )
+                )
+                self._handles[index_path] = handle
+            return handle
+    
+    @staticmethod
+    def _has_index(index_path: str) -> bool:
+        return any(os.path.exists(path) for path in glob.glob(f"{glob.escape(index_path)}.*"))
+    
+    @staticmethod
+    def _shard_name(value: Any) -> str:
+        """File-name-safe shard name for a metadata value"""
+        name = re.sub(r'[^a-z0-9]+', '_', str(normalize_value(value)).lower()).strip('_')
+        return name or 'unassigned'
+    
+    def _shard_path(self, value: Any) -> str:
+        return f"{self.index_path}__{self._shard_name(value)}"
+    
+    def _shard_paths(self) -> List[str]:
+        """Index paths of every shard, on disk or created in this process"""
+        listed_at, paths = self._shard_listing
+        if time.monotonic() - listed_at < self._listing_interval:
+            return paths
+        
+        # Shards created by other processes show up on the next listing
+        prefix = f"{self.index_path}__"
+        found = set(vector_index_registry.keys(prefix))
+        for path in glob.glob(f"{glob.escape(prefix)}*.*"):
+            name = os.path.basename(path)[len(os.path.basename(prefix)):].split('.', 1)[0]
+            if name:
+                found.add(prefix + name)
+        
+        paths = sorted(found)
+        self._shard_listing = (time.monotonic(), paths)
+        return paths
+    
+    def _route(self, filters: Optional[Dict] = None) -> list:
+        """Index handles a query with these filters has to search"""
+        self._follow_live_generation()
+        if not self.shard_by:
+            handles = [self._acquire(self.index_path)]
+        else:
+            paths = self._shard_paths()
+            value = (filters or {}).get(self.shard_by)
+            if value is not None:
+                # Values without a shard have no matches, so no empty index is created
+                path = self._shard_path(value)
+                paths = [path] if path in paths else []
+            
+            handles = [self._acquire(path) for path in paths]
+            if self._index is not None:
+                handles.append(self._index)
+        
+        if self._school_index_exists():
+            handles.append(self._acquire(self.school_index_path))
+        return handles
+    
+    # =============== School collections ===============
+    
+    def _school_index_exists(self) -> bool:
+        """Whether the school has a private collection yet (re-checked every refresh interval)"""
+        if self.school_index_path is None:
+            return False
+        
+        listed_at, exists = self._school_listing
+        if not exists and time.monotonic() - listed_at >= self._listing_interval:
+            # Key prefixes alone would take school 12's collection for school 1's
+            path = self.school_index_path
+            exists = (
+                any(key == path or key.startswith(f"{path}__") for key in vector_index_registry.keys(path))
+                or self._has_index(path)
+            )
+            self._school_listing = (time.monotonic(), exists)
+        return exists
+    
+    def school_vector_quota(self) -> int:
+        """Vectors the school's collection may hold"""
+        school = self.school
+        if school is None or not (school.enable_custom_courses and school.is_active):
+            return 0
+        return self._school_quotas.get(school.subscription_tier, 0)
+    
+    def _school_vector_count(self) -> int:
+        if not self._school_index_exists():
+            return 0
+        stats = self._acquire(self.school_index_path).db.get_stats()
+        return stats.get('live_vectors', stats['total_vectors'])
+    
+    def _all_indexes(self) -> list:
+        return self._route(None)
+    
+    def _search_indexes(self, query_array: np.ndarray, k: int,
+                        filters_per_query: List[Optional[Dict]]) -> List[List[Dict[str, Any]]]:
+        """Raw hits per query, searching each index once for all the queries routed to it"""
+        self._follow_live_generation()
+        if query_array.shape[1] != self.dimension:
+            # Embedded with another model: search that model's indexes
+            model = embedding_models.model_for_dimension(query_array.shape[1])
+            return self.for_model(model)._search_indexes(query_array, k, filters_per_query)
+        
+        routes = {}
+        for row, filters in enumerate(filters_per_query):
+            for handle in self._route(filters):
+                routes.setdefault(handle.key, (handle, []))[1].append(row)
+        
+        def search(handle, rows):
+            return rows, handle.db.search_batch(
+                query_array[rows], k=k, filters_per_query=[filters_per_query[row] for row in rows]
+            )
+        
+        if not routes:
+            return [[] for _ in range(len(query_array))]
+        if len(routes) == 1:
+            searches = [search(*next(iter(routes.values())))]
+            if len(searches[0][0]) == len(query_array):
+                return searches[0][1]
+        else:
+            pool = _get_search_pool()
+            futures = [pool.submit(search, handle, rows) for handle, rows in routes.values()]
+            searches = [future.result() for future in futures]
+        
+        merged = [[] for _ in range(len(query_array))]
+        for rows, results in searches:
+            for row, hits in zip(rows, results):
+                merged[row].extend(hits)
+        return [heapq.nlargest(k, hits, key=lambda hit: hit['similarity_score']) for hits in merged]
     
     def add_knowledge_chunks(self, chunks: List[Dict[str, Any]]):
         """Add knowledge chunks to vector database"""
@@ -36,16 +328,32 @@ class VectorDBManager:
             return
         
         # Prepare data for vector DB
+        self._follow_live_generation()
+        
         embeddings = []
         metadatas = []
         ids = []
+        other_models = {}
         
         for i, chunk in enumerate(chunks):
             if chunk.get('embedding') is None:
                 continue
             
+            # Chunks embedded with another model belong in that model's indexes
+            model = embedding_models.canonical_name(chunk.get('embedding_model')) or self.embedding_model
+            if model != self.embedding_model:
+                if model in embedding_models:
+                    other_models.setdefault(model, []).append(chunk)
+                else:
+                    logger.warning(f"Skipping chunk {chunk.get('id')}: unknown embedding model '{model}'")
+                continue
+            
             # Convert embedding to numpy array
             embedding = np.array(chunk['embedding'])
+            if embedding.shape[-1] != self.dimension:
+                logger.warning(f"Skipping chunk {chunk.get('id')}: {embedding.shape[-1]}-d embedding "
+                               f"for the {self.dimension}-d {self.embedding_model} index")
+                continue
             
             # Prepare metadata
             metadata = {
@@ -57,6 +365,7 @@ class VectorDBManager:
                 'concept': chunk.get('concept', ''),
                 'teaching_strategy': chunk.get('teaching_strategy', 'direct_instruction'),
                 'source': chunk.get('source_metadata', {}).get('source', 'unknown'),
+                'source_id': chunk.get('source_metadata', {}).get('source_id'),
                 'ai_analyzed': str(chunk.get('ai_analyzed', False))
             }
             
@@ -71,20 +380,53 @@ class VectorDBManager:
             metadatas.append(metadata)
             ids.append(chunk_id)
         
+        if self.school is not None:
+            quota = self.school_vector_quota()
+            stored = self._school_vector_count()
+            if stored + len(ids) > quota:
+                raise VectorQuotaExceeded(
+                    f"School {self.school.pk} collection holds {stored} of {quota} vectors; "
+                    f"cannot add {len(ids)} more"
+                )
+            self._school_listing = (0.0, True)
+        
+        # Group chunks by the index they belong to
+        groups = {}
+        for embedding, metadata, chunk_id in zip(embeddings, metadatas, ids):
+            if self.school is not None:
+                index_path = self.school_index_path
+            elif self.shard_by:
+                index_path = self._shard_path(metadata.get(self.shard_by))
+            else:
+                index_path = self.index_path
+            group = groups.setdefault(index_path, ([], [], []))
+            group[0].append(embedding)
+            group[1].append(metadata)
+            group[2].append(chunk_id)
+        
+        if self.shard_by:
+            self._shard_listing = (0.0, [])
+        
         # Add to vector database in batches
         batch_size = 100
-        for i in range(0, len(ids), batch_size):
-            batch_end = min(i + batch_size, len(ids))
-            
-            self.vector_db.add_embeddings(
-                embeddings=embeddings[i:batch_end],
-                metadatas=metadatas[i:batch_end],
-                ids=ids[i:batch_end]
-            )
-            
-            logger.info(f"Added batch {i//batch_size + 1} to vector DB ({batch_end}/{len(ids)})")
+        for index_path, (group_embeddings, group_metadatas, group_ids) in groups.items():
+            vector_db = self._acquire(index_path).db
+            for i in range(0, len(group_ids), batch_size):
+                batch_end = min(i + batch_size, len(group_ids))
+                
+                vector_db.add_embeddings(
+                    embeddings=group_embeddings[i:batch_end],
+                    metadatas=group_metadatas[i:batch_end],
+                    ids=group_ids[i:batch_end]
+                )
+                
+                logger.info(f"Added batch {i//batch_size + 1} to {os.path.basename(index_path)} "
+                            f"({batch_end}/{len(group_ids)})")
         
         logger.info(f"Successfully added {len(ids)} chunks to vector database")
+        
+        for model, model_chunks in other_models.items():
+            self.for_model(model).add_knowledge_chunks(model_chunks)
     
     def search_similar(self, query_embedding: List[float], 
                       filters: Optional[Dict] = None,
@@ -93,41 +435,131 @@ class VectorDBManager:
         
         try:
             # Convert to numpy array
-            query_array = np.array(query_embedding)
-            
-            # Search in vector database
-            results = self.vector_db.search(
-                query_embedding=query_array,
-                k=limit,
-                filters=filters
-            )
+            query_array = np.array([query_embedding], dtype='float32')
             
-            # Format results
-            formatted_results = []
-            for result in results:
-                formatted_results.append({
-                    'id': result['id'],
-                    'metadata': result['metadata'],
-                    'content': self._get_content_for_id(result['id']),  # You'll need to implement this
-                    'similarity_score': result['similarity_score'],
-                    'relevance': self._calculate_relevance(result['metadata'], filters)
-                })
+            # Search the index (or shards) the filters route to
+            results = self._search_indexes(query_array, limit, [filters])[0]
             
-            # Sort by relevance
-            formatted_results.sort(key=lambda x: x['relevance'], reverse=True)
-            
-            return formatted_results
+            contents = chunk_content_store.get_many(result['id'] for result in results)
+            return self._format_results(results, filters, contents)
             
         except Exception as e:
             logger.error(f"Vector DB search failed: {e}")
             return []
     
+    def search_batch(self, query_embeddings: List[List[float]],
+                     filters_per_query: Optional[Any] = None,
+                     limit: int = 10) -> List[List[Dict[str, Any]]]:
+        """Search for similar knowledge chunks for many queries in one vector DB call"""
+        
+        if not len(query_embeddings):
+            return []
+        if filters_per_query is None or isinstance(filters_per_query, dict):
+            filters_per_query = [filters_per_query] * len(query_embeddings)
+        
+        try:
+            batch_results = self._search_indexes(
+                np.array(query_embeddings, dtype='float32'),
+                limit,
+                list(filters_per_query)
+            )
+            
+            # One content lookup for the hits of every query
+            contents = chunk_content_store.get_many(
+                result['id'] for results in batch_results for result in results
+            )
+            
+            return [
+                self._format_results(results, filters, contents)
+                for results, filters in zip(batch_results, filters_per_query)
+            ]
+            
+        except Exception as e:
+            logger.error(f"Vector DB batch search failed: {e}")
+            return [[] for _ in query_embeddings]
+    
+    def index_version(self, filters: Optional[Dict] = None) -> tuple:
+        """Changes whenever an index a search with these filters reads is written to (keyword index included)"""
+        versions = []
+        for handle in self._route(filters):
+            db = handle.db
+            versions.append((handle.key, getattr(db, 'base_generation', 0), db.version))
+        versions.append(('keywords', keyword_index.version))
+        return tuple(versions)
+    
+    def has_value(self, attribute: str, value: Any) -> bool:
+        """Whether any index a search filtering on this metadata value reads holds live vectors with it"""
+        return any(handle.db.has_value(attribute, value) for handle in self._route({attribute: value}))
+    
+    def hybrid_search(self, query: str, query_embedding: Optional[List[float]] = None,
+                      filters: Optional[Dict] = None, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Search knowledge chunks by keywords (BM25) and by embedding, fusing the
+        two rankings with reciprocal rank fusion. Without an embedding this is
+        a plain keyword search.
+        """
+        
+        depth = max(limit, self.hybrid_candidates)
+        vector_hits = []
+        if query_embedding is not None:
+            try:
+                query_array = np.array([query_embedding], dtype='float32')
+                vector_hits = self._search_indexes(query_array, depth, [filters])[0]
+            except Exception as e:
+                logger.error(f"Vector DB search failed: {e}")
+        
+        keyword_hits = keyword_index.search(
+            query, filters=filters, limit=depth,
+            school_id=self.school.pk if self.school is not None else None
+        )
+        
+        hits = {}
+        for hit in keyword_hits:
+            hits[hit['id']] = {'similarity_score': 0.0, **hit}
+        for hit in vector_hits:
+            # Vector hits carry the full metadata
+            hits[hit['id']] = {**hits.get(hit['id'], {}), **hit}
+        
+        fused = reciprocal_rank_fusion(
+            [[hit['id'] for hit in vector_hits], [hit['id'] for hit in keyword_hits]], k=self.rrf_k
+        )[:limit]
+        
+        results = []
+        for chunk_id, score in fused:
+            hit = hits[chunk_id]
+            hit['rrf_score'] = score
+            results.append(hit)
+        
+        contents = chunk_content_store.get_many(chunk_id for chunk_id, _ in fused)
+        return self._format_results(results, filters, contents)
+    
+    def _format_results(self, results: List[Dict[str, Any]], filters: Optional[Dict],
+                        contents: Dict[str, str]) -> List[Dict[str, Any]]:
+        """Format raw vector DB hits for callers, most relevant first"""
+        
+        formatted_results = []
+        for result in results:
+            formatted = {
+                'id': result['id'],
+                'metadata': result['metadata'],
+                'content': contents.get(result['id'], ""),
+                'similarity_score': result['similarity_score'],
+                'relevance': self._calculate_relevance(result['metadata'], filters)
+            }
+            # Scores from hybrid search
+            for key in ('keyword_score', 'rrf_score'):
+                if key in result:
+                    formatted[key] = result[key]
+            formatted_results.append(formatted)
+        
+        # Sort by relevance
+        formatted_results.sort(key=lambda x: x['relevance'], reverse=True)
+        
+        return formatted_results
+    
     def _get_content_for_id(self, chunk_id: str) -> str:
         """Get content for a chunk ID"""
-        # This should retrieve content from your database
-        # For now, return empty string - you'll need to implement this
-        # based on how you store your knowledge chunks
-        return ""
+        return chunk_content_store.get(chunk_id)
     
     def _calculate_relevance(self, metadata: Dict, filters: Dict) -> float:
         """Calculate relevance score for search results"""
@@ -151,25 +583,56 @@ class VectorDBManager:
         """Get statistics about the collection"""
         
         try:
-            stats = self.vector_db.get_stats()
+            if not self.shard_by:
+                stats = self.vector_db.get_stats()
+            else:
+                shards = {
+                    os.path.basename(handle.key): handle.db.get_stats()
+                    for handle in self._all_indexes()
+                }
+                stats = {
+                    'total_vectors': sum(shard['total_vectors'] for shard in shards.values()),
+                    'shard_by': self.shard_by,
+                    'shards': shards,
+                }
             stats['collection_name'] = self.collection_name
+            stats['embedding_model'] = self.embedding_model
+            stats['generation'] = self.generation
+            if self.school is not None:
+                stats['school'] = {
+                    'school_id': self.school.pk,
+                    'vectors': self._school_vector_count(),
+                    'quota': self.school_vector_quota(),
+                }
             return stats
             
         except Exception as e:
             logger.error(f"Failed to get collection stats: {e}")
             return {'error': str(e)}
     
-    def delete_chunks_by_source(self, source: str) -> int:
-        """Delete chunks by source"""
+    def delete_chunks(self, chunk_ids: List[str]) -> int:
+        """Delete knowledge chunks by ID"""
+        chunk_ids = [str(chunk_id) for chunk_id in chunk_ids]
+        return sum(handle.db.delete_by_ids(chunk_ids) for handle in self._all_indexes())
+    
+    def delete_chunks_by_source(self, source) -> int:
+        """Delete chunks by source (a CourseSource or a source name)"""
         
-        # Note: FAISS doesn't support efficient deletion
-        # This would require recreating the index
-        # For now, just mark them as deleted in metadata
+        # Source names aren't unique (imports are named after their type),
+        # so a CourseSource is matched on its id
+        if hasattr(source, 'pk'):
+            filters = {'source_id': str(source.pk)}
+        else:
+            filters = {'source': source}
         
-        logger.warning("Delete by source not fully implemented for FAISS")
-        return 0
+        deleted = sum(handle.db.delete_by_filters(filters) for handle in self._route(filters))
+        logger.info(f"Deleted {deleted} chunks for source {source}")
+        return deleted
     
     def persist(self):
         """Persist the vector database to disk"""
-        # FAISS auto-saves, but we can call save if needed
-        pass
\ No newline at end of file
+        # Writes are already durable in the FAISS segment log;
+        # compacting folds them into a fresh base snapshot
+        for handle in self._all_indexes():
+            if handle.loaded and hasattr(handle.db, 'compact'):
+                handle.db.compact()
\ No newline at end of file
@@ -0,0 +1,387 @@
+"""
+Columnar, memory-mapped metadata store for FAISS vectors
+"""
+
+import os
+import json
+import shutil
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+
+from .attribute_index import FILTERABLE_ATTRIBUTES
+
+# Low-cardinality keys, stored as int32 codes into a per-column dictionary
+CATEGORICAL_COLUMNS = FILTERABLE_ATTRIBUTES + ('teaching_strategy', 'ai_analyzed')
+# Free-text keys, stored as (start, length) slices of a shared UTF-8 arena
+STRING_COLUMNS = ('title', 'concept', 'subtopics')
+# Anything else is kept per row as JSON in the arena
+EXTRA_COLUMN = '_extra'
+
+SCHEMA_FILE = 'schema.json'
+
+
+def _is_scalar(value: Any) -> bool:
+    return value is None or isinstance(value, (str, int, float, bool))
+
+
+class MetadataStore:
+    """
+    Per-label vector id and metadata.
+
+    The base part is a directory of ``.npy`` columns written by ``write`` and
+    opened with ``mmap_mode='r'``, so loading is O(1) and every worker process
+    shares the same page cache. Rows added (or removed) since then live in
+    small in-memory overlays until the next compaction re-encodes everything.
+
+    Base directory layout:
+        labels.npy              int64 FAISS label per row (ascending)
+        ids.npy                 vector id per row (fixed-width UTF-8)
+        id_sorted.npy           ids sorted, for binary-search lookups
+        id_rows.npy             row of each entry in id_sorted
+        <col>.codes.npy         categorical codes, -1 = key absent
+        <col>.starts.npy        string slices into arena.npy
+        <col>.lengths.npy       slice lengths, -1 = key absent
+        arena.npy               uint8 UTF-8 arena shared by string columns
+        schema.json             column names, dictionaries and caller state
+    """
+
+    def __init__(self):
+        self.path = None
+        self.schema: Dict[str, Any] = {}
+
+        # Base (memory-mapped) part
+        self._labels = np.empty(0, dtype='int64')
+        self._ids = np.empty(0, dtype='S1')
+        self._id_sorted = np.empty(0, dtype='S1')
+        self._id_rows = np.empty(0, dtype='int64')
+        self._categorical: Dict[str, Tuple[np.ndarray, List[Any]]] = {}
+        self._strings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._arena = np.empty(0, dtype='uint8')
+
+        # Overlays: rows added since the base was written, base labels
+        # removed since, and id -> label changes (None = id deleted)
+        self._delta: Dict[int, Tuple[str, Dict[str, Any]]] = {}
+        self._removed = set()
+        self._id_overrides: Dict[str, Optional[int]] = {}
+
+        # Updates made since ``encode``, replayed onto the new base by ``rebase``
+        self._journal: Optional[List[Tuple[str, tuple]]] = None
+
+    # =============== Loading ===============
+
+    @classmethod
+    def open(cls, path: str) -> 'MetadataStore':
+        """Memory-map a store written by ``write``"""
+        store = cls()
+        store.path = path
+        with open(os.path.join(path, SCHEMA_FILE), 'r') as f:
+            store.schema = json.load(f)
+
+        def column(name):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r')
+
+        store._labels = column('labels')
+        store._ids = column('ids')
+        store._id_sorted = column('id_sorted')
+        store._id_rows = column('id_rows')
+        store._arena = column('arena')
+        store._categorical = {
+            name: (column(f"{name}.codes"), values)
+            for name, values in store.schema['categorical'].items()
+        }
+        store._strings = {
+            name: (column(f"{name}.starts"), column(f"{name}.lengths"))
+            for name in store.schema['strings']
+        }
+        return store
+
+    @classmethod
+    def from_records(cls, records: Iterable[Tuple[int, str, Dict[str, Any]]]) -> 'MetadataStore':
+        """In-memory store from (label, vector id, metadata) records"""
+        store = cls()
+        for label, vector_id, metadata in records:
+            store.add(label, vector_id, metadata)
+        return store
+
+    # =============== Lookups ===============
+
+    def __len__(self) -> int:
+        return len(self._labels) - len(self._removed) + len(self._delta)
+
+    def __contains__(self, label: int) -> bool:
+        return label in self._delta or self._base_row(label) is not None
+
+    def get(self, label: int) -> Optional[Dict[str, Any]]:
+        """Metadata of a label, or None"""
+        entry = self._delta.get(label)
+        if entry is not None:
+            return entry[1]
+        row = self._base_row(label)
+        return None if row is None else self._decode_row(row)
+
+    def id_of(self, label: int) -> Optional[str]:
+        """Vector id stored under a label, or None"""
+        entry = self._delta.get(label)
+        if entry is not None:
+            return entry[0]
+        row = self._base_row(label)
+        return None if row is None else self._ids[row].decode()
+
+    def label_of(self, vector_id: str) -> Optional[int]:
+        """Current (non-deleted) label of a vector id, or None"""
+        if vector_id in self._id_overrides:
+            return self._id_overrides[vector_id]
+        key = vector_id.encode()
+        pos = int(np.searchsorted(self._id_sorted, key))
+        if pos < len(self._id_sorted) and self._id_sorted[pos] == key:
+            return int(self._labels[self._id_rows[pos]])
+        return None
+
+    def labels(self) -> np.ndarray:
+        """Sorted labels of every stored row"""
+        base = np.asarray(self._labels[self._base_mask()])
+        delta = np.fromiter(sorted(self._delta), dtype='int64', count=len(self._delta))
+        return np.concatenate([base, delta])
+
+    def items(self) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """(label, metadata) for every stored row"""
+        for row, label in enumerate(self._labels.tolist()):
+            if label not in self._removed:
+                yield label, self._decode_row(row)
+        for label in sorted(self._delta):
+            yield label, self._delta[label][1]
+
+    def postings(self, attr: str) -> Dict[Any, np.ndarray]:
+        """Sorted labels per raw value of an attribute"""
+        groups: Dict[Any, List[np.ndarray]] = {}
+
+        if attr in self._categorical:
+            codes, values = self._categorical[attr]
+            rows = np.flatnonzero(self._base_mask() & (codes >= 0))
+            # Stable sort keeps labels ascending within each value
+            rows = rows[np.argsort(codes[rows], kind='stable')]
+            boundaries = np.flatnonzero(np.diff(codes[rows])) + 1
+            for chunk in np.split(rows, boundaries):
+                if len(chunk):
+                    value = values[int(codes[chunk[0]])]
+                    groups.setdefault(value, []).append(np.asarray(self._labels[chunk]))
+        else:
+            for row in np.flatnonzero(self._base_mask()).tolist():
+                value = self._decode_row(row).get(attr)
+                if value is not None:
+                    groups.setdefault(value, []).append(np.asarray(self._labels[row:row + 1]))
+
+        for label in sorted(self._delta):
+            value = self._delta[label][1].get(attr)
+            if _is_scalar(value) and value is not None:
+                groups.setdefault(value, []).append(np.array([label], dtype='int64'))
+
+        return {value: np.concatenate(parts) for value, parts in groups.items() if value is not None}
+
+    # =============== Updates ===============
+
+    def add(self, label: int, vector_id: str, metadata: Dict[str, Any]) -> Optional[int]:
+        """Store a new row; returns the label previously held by this id, if any"""
+        previous = self.label_of(vector_id)
+        self._delta[label] = (vector_id, metadata)
+        self._id_overrides[vector_id] = label
+        self._record('add', label, vector_id, metadata)
+        return previous
+
+    def unlink(self, vector_id: str) -> Optional[int]:
+        """Detach an id from its row (the row itself stays until ``remove``)"""
+        label = self.label_of(vector_id)
+        if label is not None:
+            self._id_overrides[vector_id] = None
+            self._record('unlink', vector_id)
+        return label
+
+    def remove(self, labels: Iterable[int]):
+        """Drop rows"""
+        labels = list(labels)
+        for label in labels:
+            if self._delta.pop(label, None) is None and self._base_row(label) is not None:
+                self._removed.add(label)
+        self._record('remove', labels)
+
+    def _record(self, op: str, *args):
+        if self._journal is not None:
+            self._journal.append((op, args))
+
+    # =============== Encoding ===============
+
+    def encode(self) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+        """
+        Columns and schema for the current contents. Base columns are carried
+        over with vectorized gathers, only overlay rows are encoded in Python.
+        """
+        self._journal = []
+        kept_rows = np.flatnonzero(self._base_mask())
+        delta_labels = sorted(self._delta)
+        delta = [self._delta[label] for label in delta_labels]
+
+        arrays: Dict[str, np.ndarray] = {}
+        arrays['labels'] = np.concatenate([
+            np.asarray(self._labels[kept_rows]), np.array(delta_labels, dtype='int64')
+        ])
+
+        delta_ids = np.array([vector_id.encode() for vector_id, _ in delta], dtype='S')
+        width = max(self._ids.dtype.itemsize, delta_ids.dtype.itemsize if len(delta) else 1)
+        ids = np.concatenate([
+            np.asarray(self._ids[kept_rows]).astype(f'S{width}'), delta_ids.astype(f'S{width}')
+        ])
+        arrays['ids'] = ids
+        arrays['id_rows'] = np.argsort(ids, kind='stable').astype('int64')
+        arrays['id_sorted'] = ids[arrays['id_rows']]
+
+        # Keys that don't fit their column type go to the per-row JSON extra
+        extras: List[Dict[str, Any]] = [{} for _ in delta]
+        for i, (_, metadata) in enumerate(delta):
+            for key, value in metadata.items():
+                if key in CATEGORICAL_COLUMNS and _is_scalar(value):
+                    continue
+                if key in STRING_COLUMNS and isinstance(value, str):
+                    continue
+                extras[i][key] = value
+
+        categorical = {}
+        for name in CATEGORICAL_COLUMNS:
+            base_codes, values = self._categorical.get(name, (None, []))
+            values = list(values)
+            lookup = {self._value_key(value): code for code, value in enumerate(values)}
+
+            codes = np.full(len(delta), -1, dtype='int32')
+            for i, (_, metadata) in enumerate(delta):
+                if name not in metadata or not _is_scalar(metadata[name]):
+                    continue
+                key = self._value_key(metadata[name])
+                if key not in lookup:
+                    lookup[key] = len(values)
+                    values.append(metadata[name])
+                codes[i] = lookup[key]
+
+            if base_codes is None:
+                base_codes = np.full(len(self._labels), -1, dtype='int32')
+            arrays[f"{name}.codes"] = np.concatenate([np.asarray(base_codes[kept_rows]), codes])
+            categorical[name] = values
+
+        # Gather the surviving base strings into a fresh, garbage-free arena
+        arena_parts = []
+        arena_size = 0
+        string_columns = list(STRING_COLUMNS) + [EXTRA_COLUMN]
+        for name in string_columns:
+            if name in self._strings:
+                starts, lengths = self._strings[name]
+                starts = np.asarray(starts[kept_rows])
+                lengths = np.asarray(lengths[kept_rows])
+            else:
+                starts = np.zeros(len(kept_rows), dtype='int64')
+                lengths = np.full(len(kept_rows), -1, dtype='int64')
+
+            sizes = np.maximum(lengths, 0)
+            new_starts = arena_size + np.cumsum(sizes) - sizes
+            gather = np.repeat(starts - (new_starts - arena_size), sizes) + np.arange(int(sizes.sum()))
+            arena_parts.append(np.asarray(self._arena[gather]))
+            arena_size += int(sizes.sum())
+
+            delta_starts = np.zeros(len(delta), dtype='int64')
+            delta_lengths = np.full(len(delta), -1, dtype='int64')
+            for i, (_, metadata) in enumerate(delta):
+                if name == EXTRA_COLUMN:
+                    text = json.dumps(extras[i]) if extras[i] else None
+                else:
+                    text = metadata.get(name)
+                    text = text if isinstance(text, str) else None
+                if text is None:
+                    continue
+                data = text.encode()
+                arena_parts.append(np.frombuffer(data, dtype='uint8'))
+                delta_starts[i] = arena_size
+                delta_lengths[i] = len(data)
+                arena_size += len(data)
+
+            arrays[f"{name}.starts"] = np.concatenate([new_starts, delta_starts]).astype('int64')
+            arrays[f"{name}.lengths"] = np.concatenate([lengths, delta_lengths]).astype('int64')
+
+        arrays['arena'] = np.concatenate(arena_parts) if arena_parts else np.empty(0, dtype='uint8')
+
+        schema = {'categorical': categorical, 'strings': string_columns}
+        return arrays, schema
+
+    def rebase(self, path: str) -> 'MetadataStore':
+        """
+        Open the base written from the last ``encode`` and replay the updates
+        made since, so this process drops its overlays and maps the new files.
+        """
+        store = MetadataStore.open(path)
+        for op, args in self._journal or ():
+            getattr(store, op)(*args)
+        self._journal = None
+        return store
+
+    def discard_journal(self):
+        """Stop recording updates after an ``encode`` whose base was not committed"""
+        self._journal = None
+
+    @staticmethod
+    def write(path: str, arrays: Dict[str, np.ndarray], schema: Dict[str, Any], fsync: bool = True):
+        """Write encoded columns to a directory (built aside, then renamed into place)"""
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        files = [(f"{name}.npy", array) for name, array in arrays.items()]
+        for filename, array in files:
+            with open(os.path.join(tmp_path, filename), 'wb') as f:
+                np.save(f, array)
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+
+        with open(os.path.join(tmp_path, SCHEMA_FILE), 'w') as f:
+            json.dump(schema, f)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+    # =============== Helpers ===============
+
+    def _base_mask(self) -> np.ndarray:
+        """Base rows that haven't been removed"""
+        if not self._removed:
+            return np.ones(len(self._labels), dtype=bool)
+        return ~np.isin(self._labels, np.fromiter(self._removed, dtype='int64'))
+
+    def _base_row(self, label: int) -> Optional[int]:
+        if label in self._removed or not len(self._labels):
+            return None
+        row = int(np.searchsorted(self._labels, label))
+        if row < len(self._labels) and self._labels[row] == label:
+            return row
+        return None
+
+    def _decode_row(self, row: int) -> Dict[str, Any]:
+        metadata = {}
+        for name, (codes, values) in self._categorical.items():
+            code = codes[row]
+            if code >= 0:
+                metadata[name] = values[code]
+        for name, (starts, lengths) in self._strings.items():
+            length = int(lengths[row])
+            if length < 0:
+                continue
+            start = int(starts[row])
+            text = self._arena[start:start + length].tobytes().decode()
+            if name == EXTRA_COLUMN:
+                metadata.update(json.loads(text))
+            else:
+                metadata[name] = text
+        return metadata
+
+    @staticmethod
+    def _value_key(value: Any) -> Tuple[str, Any]:
+        # Keep True / 1 / '1' apart in the dictionary
+        return type(value).__name__, value
@@ -0,0 +1,191 @@
+"""
+MinHash signatures of knowledge chunks with an on-disk LSH index (SQLite),
+for finding near-duplicate text
+"""
+
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+import xxhash
+from django.conf import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+# Hash permutations are ((a * h + b) mod a Mersenne prime) truncated to 32 bits, as in datasketch
+# (a * h wraps around in uint64, which keeps the permutations independent enough)
+_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+class MinHasher:
+    """MinHash signatures over word shingles, vectorized across the permutations"""
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self._a = rng.randint(1, (1 << 61) - 1, size=num_perm, dtype=np.int64).astype(np.uint64)
+        self._b = rng.randint(0, (1 << 61) - 1, size=num_perm, dtype=np.int64).astype(np.uint64)
+
+    def shingles(self, text: str) -> np.ndarray:
+        """32-bit hashes of the text's lowercased word n-grams"""
+        words = _TOKEN.findall((text or '').lower())
+        if not words:
+            return np.zeros(0, dtype=np.uint64)
+        size = min(self.shingle_size, len(words))
+        grams = {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+        return np.fromiter((xxhash.xxh32_intdigest(gram) for gram in grams), dtype=np.uint64, count=len(grams))
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """MinHash signature of the text, or None when it has no words"""
+        hashes = self.shingles(text)
+        if not len(hashes):
+            return None
+        with np.errstate(over='ignore'):
+            permuted = np.bitwise_and((self._a[:, None] * hashes[None, :] + self._b[:, None]) % _PRIME, _MAX_HASH)
+        return permuted.min(axis=1)
+
+
+def estimated_jaccard(signature: np.ndarray, other: np.ndarray) -> float:
+    return float(np.mean(signature == other))
+
+
+class MinHashIndex:
+    """
+    LSH index over chunk MinHash signatures.
+
+    Signatures are cut into ``bands``; chunks sharing any band bucket are
+    candidates, and candidates are confirmed by their estimated Jaccard
+    similarity. Like the keyword index, private chunks carry their school so
+    lookups only see shared chunks and the caller's school.
+    """
+
+    def __init__(self, path: str = None):
+        config = getattr(settings, 'VECTOR_DB_CONFIG', {})
+        self.path = path or os.path.join(settings.BASE_DIR, 'data/minhash_upperclass_knowledge.sqlite3')
+        self.hasher = MinHasher(
+            num_perm=config.get('DEDUP_NUM_PERM', 128),
+            shingle_size=config.get('DEDUP_SHINGLE_SIZE', 5),
+        )
+        self.bands = config.get('DEDUP_BANDS', 16)
+        if self.hasher.num_perm % self.bands:
+            raise ValueError("DEDUP_NUM_PERM must be a multiple of DEDUP_BANDS")
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS signatures ("
+                    "chunk_id TEXT PRIMARY KEY, school_id TEXT, source_id TEXT, signature BLOB NOT NULL)"
+                )
+                conn.execute("CREATE TABLE IF NOT EXISTS buckets (band INTEGER, bucket INTEGER, chunk_id TEXT)")
+                conn.execute("CREATE INDEX IF NOT EXISTS buckets_lookup ON buckets (band, bucket)")
+                conn.execute("CREATE INDEX IF NOT EXISTS buckets_chunk ON buckets (chunk_id)")
+            self._local.conn = conn
+        return conn
+
+    def band_keys(self, signature: np.ndarray) -> List[Tuple[int, int]]:
+        """(band, bucket) pairs of a signature; buckets are signed 64-bit for SQLite"""
+        keys = []
+        for band, rows in enumerate(np.split(signature, self.bands)):
+            bucket = xxhash.xxh64_intdigest(rows.tobytes())
+            keys.append((band, bucket - (1 << 64) if bucket >= 1 << 63 else bucket))
+        return keys
+
+    # =============== Writes ===============
+
+    def add_chunks(self, chunks: Iterable[Any]):
+        """Index (or re-index) AIKnowledgeChunk instances"""
+        conn = self._connection()
+        with conn:
+            for chunk in chunks:
+                chunk_id = str(chunk.id)
+                self._delete(conn, chunk_id)
+                signature = self.hasher.signature(chunk.content)
+                if signature is None:
+                    continue
+                source = chunk.source if chunk.source_id else None
+                school_id = getattr(source, 'school_id', None)
+                conn.execute(
+                    "INSERT INTO signatures (chunk_id, school_id, source_id, signature) VALUES (?, ?, ?, ?)",
+                    (chunk_id, str(school_id) if school_id else None,
+                     str(chunk.source_id) if chunk.source_id else None, signature.tobytes())
+                )
+                conn.executemany(
+                    "INSERT INTO buckets (band, bucket, chunk_id) VALUES (?, ?, ?)",
+                    [(band, bucket, chunk_id) for band, bucket in self.band_keys(signature)]
+                )
+
+    def add_chunk(self, chunk: Any):
+        self.add_chunks([chunk])
+
+    def remove_chunks(self, chunk_ids: Iterable[str]):
+        conn = self._connection()
+        with conn:
+            for chunk_id in chunk_ids:
+                self._delete(conn, str(chunk_id))
+
+    def _delete(self, conn: sqlite3.Connection, chunk_id: str):
+        conn.execute("DELETE FROM buckets WHERE chunk_id = ?", (chunk_id,))
+        conn.execute("DELETE FROM signatures WHERE chunk_id = ?", (chunk_id,))
+
+    def clear(self):
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM buckets")
+            conn.execute("DELETE FROM signatures")
+
+    # =============== Lookup ===============
+
+    def find_similar(self, signature: np.ndarray, threshold: float, school_id: Any = None,
+                     exclude_source_id: Any = None) -> List[Tuple[str, float]]:
+        """Indexed chunks whose estimated Jaccard similarity reaches ``threshold``, most similar first"""
+        keys = self.band_keys(signature)
+        conditions = ' OR '.join('(b.band = ? AND b.bucket = ?)' for _ in keys)
+        params: List[Any] = [value for key in keys for value in key]
+
+        sql = (
+            f"SELECT DISTINCT s.chunk_id, s.signature FROM buckets b "
+            f"JOIN signatures s ON s.chunk_id = b.chunk_id WHERE ({conditions})"
+        )
+        if school_id is None:
+            sql += " AND s.school_id IS NULL"
+        else:
+            sql += " AND (s.school_id IS NULL OR s.school_id = ?)"
+            params.append(str(school_id))
+        if exclude_source_id is not None:
+            sql += " AND (s.source_id IS NULL OR s.source_id != ?)"
+            params.append(str(exclude_source_id))
+
+        matches = []
+        for chunk_id, blob in self._connection().execute(sql, params):
+            similarity = estimated_jaccard(signature, np.frombuffer(blob, dtype=np.uint64))
+            if similarity >= threshold:
+                matches.append((chunk_id, similarity))
+        matches.sort(key=lambda match: -match[1])
+        return matches
+
+    def get_stats(self) -> Dict[str, Any]:
+        count = self._connection().execute("SELECT COUNT(*) FROM signatures").fetchone()[0]
+        return {
+            'signatures': count,
+            'bands': self.bands,
+            'num_perm': self.hasher.num_perm,
+            'path': self.path,
+            'bytes': os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+        }
+
+
+minhash_index = MinHashIndex()
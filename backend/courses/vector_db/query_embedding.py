@@ -0,0 +1,40 @@
+"""
+Embeddings for search queries
+"""
+
+from typing import List, Optional
+import openai
+from django.conf import settings
+import logging
+
+from .embedding_cache import embedding_cache
+from .embedding_models import embedding_models, DEFAULT_COLLECTION
+from ..processors.local_embedding import get_local_embedding_service
+
+logger = logging.getLogger(__name__)
+
+
+def embed_query(query: str, model: str = None) -> Optional[List[float]]:
+    """
+    Embedding of a search query with the given model (default: the live model
+    of the knowledge collection), or None when it can't be generated
+    """
+    model = embedding_models.canonical_name(model) or embedding_models.live(DEFAULT_COLLECTION)[0]
+    if not query:
+        return None
+    cached = embedding_cache.get(model, query)
+    if cached is not None:
+        return cached.tolist()
+    try:
+        if embedding_models.provider(model) == 'local':
+            embedding = get_local_embedding_service(model).encode(query).tolist()
+        elif not settings.OPENAI_API_KEY:
+            return None
+        else:
+            response = openai.Embedding.create(model=model, input=query)
+            embedding = response['data'][0]['embedding']
+        embedding_cache.set(model, query, embedding)
+        return embedding
+    except Exception as e:
+        logger.error(f"Failed to embed search query: {e}")
+        return None
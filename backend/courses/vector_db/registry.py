@@ -0,0 +1,200 @@
+"""
+Process-wide registry of shared vector indexes
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, List
+from django.conf import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SharedVectorIndex:
+    """
+    Reference-counted handle to one vector index, shared by every
+    VectorDBManager in the process.
+
+    The index is loaded on first use. Afterwards, at most every
+    ``refresh_interval`` seconds, the handle tails the index's segment log for
+    writes made by other processes, and swaps in a freshly loaded index when
+    another process has committed a new base snapshot.
+
+    A loaded index may be unloaded while still referenced (see
+    ``VectorIndexRegistry.max_loaded_indexes``); it is reloaded on next use.
+    """
+
+    def __init__(self, key: str, factory: Callable[[], Any], refresh_interval: float,
+                 on_load: Callable[['SharedVectorIndex'], None] = None):
+        self.key = key
+        self.refcount = 0
+        self.idle_since = None
+        self.last_used = time.monotonic()
+        self._factory = factory
+        self._refresh_interval = refresh_interval
+        self._on_load = on_load
+        self._db = None
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def db(self):
+        """The current index, loaded or refreshed as needed"""
+        self.last_used = time.monotonic()
+        db = self._db
+        if db is not None and self.last_used - self._last_refresh < self._refresh_interval:
+            return db
+
+        loaded = False
+        with self._lock:
+            if self._db is None:
+                start_time = time.time()
+                self._db = self._factory()
+                loaded = True
+                logger.info(f"Loaded shared vector index {self.key} in {time.time() - start_time:.2f}s")
+            elif time.monotonic() - self._last_refresh >= self._refresh_interval:
+                self._refresh()
+            self._last_refresh = time.monotonic()
+            db = self._db
+
+        # Outside the lock: the callback may unload other handles
+        if loaded and self._on_load:
+            self._on_load(self)
+        return db
+
+    @property
+    def loaded(self) -> bool:
+        return self._db is not None
+
+    @property
+    def vector_count(self) -> int:
+        db = self._db
+        if db is None:
+            return 0
+        try:
+            return db.get_stats()['total_vectors']
+        except Exception:
+            return 0
+
+    def _refresh(self):
+        log = getattr(self._db, 'log', None)
+        if log is None:
+            # In-memory fallback index, nothing on disk to follow
+            return
+
+        try:
+            on_disk = log.read_manifest()['base']
+            if on_disk != self._db.base_generation:
+                # Build the new index aside; searches in flight keep the old one
+                self._db = self._factory()
+                logger.info(f"Reloaded shared vector index {self.key} at generation {on_disk}")
+            else:
+                self._db.refresh()
+        except Exception as e:
+            logger.error(f"Failed to refresh shared vector index {self.key}: {e}")
+
+    def unload(self):
+        with self._lock:
+            self._db = None
+
+
+class VectorIndexRegistry:
+    """
+    Index handles keyed by index path. Idle ones are unloaded after a while,
+    and the least recently used ones once too many indexes (or vectors) are
+    loaded at the same time.
+    """
+
+    def __init__(self):
+        config = getattr(settings, 'VECTOR_DB_CONFIG', {})
+        self.refresh_interval = config.get('REFRESH_INTERVAL', 1.0)
+        self.idle_unload_seconds = config.get('IDLE_UNLOAD_SECONDS', 900)
+        self.max_loaded_indexes = config.get('MAX_LOADED_INDEXES')  # None = unlimited
+        self.max_loaded_vectors = config.get('MAX_LOADED_VECTORS')
+        self._indexes: Dict[str, SharedVectorIndex] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, factory: Callable[[], Any]) -> SharedVectorIndex:
+        """Take a reference to the index at ``key``; it's loaded lazily by ``handle.db``"""
+        with self._lock:
+            self._evict_idle(exclude=key)
+
+            handle = self._indexes.get(key)
+            if handle is None:
+                handle = SharedVectorIndex(key, factory, self.refresh_interval, on_load=self._enforce_limits)
+                self._indexes[key] = handle
+
+            handle.refcount += 1
+            handle.idle_since = None
+            return handle
+
+    def release(self, handle: SharedVectorIndex):
+        """Drop a reference taken with ``acquire``"""
+        with self._lock:
+            handle.refcount = max(0, handle.refcount - 1)
+            if handle.refcount == 0:
+                handle.idle_since = time.monotonic()
+
+    def _evict_idle(self, exclude: str = None):
+        now = time.monotonic()
+        for key, handle in list(self._indexes.items()):
+            if key == exclude or handle.refcount or handle.idle_since is None:
+                continue
+            if now - handle.idle_since >= self.idle_unload_seconds:
+                del self._indexes[key]
+                handle.unload()
+                logger.info(f"Unloaded idle vector index {key}")
+
+    def _enforce_limits(self, loaded_handle: SharedVectorIndex):
+        """Unload least recently used indexes until the loaded ones fit the limits"""
+        if not self.max_loaded_indexes and not self.max_loaded_vectors:
+            return
+
+        with self._lock:
+            loaded = [handle for handle in self._indexes.values() if handle.loaded]
+        loaded.sort(key=lambda handle: handle.last_used)
+        total_vectors = sum(handle.vector_count for handle in loaded) if self.max_loaded_vectors else 0
+
+        victims = []
+        for handle in loaded:
+            over_count = self.max_loaded_indexes and len(loaded) - len(victims) > self.max_loaded_indexes
+            over_vectors = self.max_loaded_vectors and total_vectors > self.max_loaded_vectors
+            if not over_count and not over_vectors:
+                break
+            if handle is loaded_handle:
+                continue
+            victims.append(handle)
+            total_vectors -= handle.vector_count
+
+        for handle in victims:
+            handle.unload()
+            logger.info(f"Unloaded least recently used vector index {handle.key}")
+
+    def unload_unreferenced(self, match: Callable[[str], bool]) -> List[str]:
+        """Drop the unreferenced handles whose keys match; returns the matching keys still referenced"""
+        held = []
+        with self._lock:
+            for key, handle in list(self._indexes.items()):
+                if not match(key):
+                    continue
+                if handle.refcount:
+                    held.append(key)
+                    continue
+                del self._indexes[key]
+                handle.unload()
+        return held
+
+    def keys(self, prefix: str = ''):
+        with self._lock:
+            return [key for key in self._indexes if key.startswith(prefix)]
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                key: {'refcount': handle.refcount, 'loaded': handle.loaded}
+                for key, handle in self._indexes.items()
+            }
+
+
+vector_index_registry = VectorIndexRegistry()
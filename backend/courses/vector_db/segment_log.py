@@ -0,0 +1,276 @@
+"""
+Append-only segment log used to persist FAISS index updates incrementally
+"""
+
+import os
+import json
+import shutil
+import pickle
+import struct
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class StaleLogPosition(Exception):
+    """Raised when the segment a reader was positioned in has been compacted away"""
+
+
+class SegmentLog:
+    """
+    Write-ahead log split into numbered segments, plus a manifest that says
+    which base snapshot is current and which segments are already folded into it.
+
+    Layout on disk (for base path ``data/faiss_x``):
+        data/faiss_x.manifest          JSON manifest, replaced atomically
+        data/faiss_x.wal.000001        append-only segments
+        data/faiss_x.000001.index      base snapshot for generation 1
+        data/faiss_x.000001.columns/   its metadata columns (see MetadataStore)
+        data/faiss_x.lock              advisory lock shared by writers
+
+    Every record is ``<length:uint32><crc32:uint32><pickle payload>``, so a
+    torn write at the tail of a segment is detected and ignored on replay.
+    """
+
+    HEADER = struct.Struct('<II')
+    BASE_SUFFIXES = ('.index', '.metadata', '.columns')
+
+    def __init__(self, base_path: str, fsync: bool = True):
+        self.base_path = base_path
+        self.fsync = fsync
+        self.manifest_file = f"{base_path}.manifest"
+        self.lock_file = f"{base_path}.lock"
+
+        self._thread_lock = threading.RLock()
+        self._lock_depth = 0
+        self._lock_handle = None
+
+        self.manifest = self.read_manifest()
+        # Reader position: (segment number, byte offset)
+        self.position = (self.manifest['covered'] + 1, 0)
+        # Bytes of live (not yet compacted) segments seen by this process
+        self.pending_bytes = 0
+
+    # =============== Paths ===============
+
+    def segment_file(self, segment: int) -> str:
+        return f"{self.base_path}.wal.{segment:06d}"
+
+    def base_prefix(self, generation: Optional[int] = None) -> Optional[str]:
+        """Path prefix of the base snapshot files for a generation"""
+        generation = self.manifest['base'] if generation is None else generation
+        if not generation:
+            return None
+        return f"{self.base_path}.{generation:06d}"
+
+    # =============== Manifest ===============
+
+    def read_manifest(self) -> Dict[str, int]:
+        """Read the manifest from disk, or return the initial manifest"""
+        try:
+            with open(self.manifest_file, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'base': 0, 'covered': 0, 'active': 1, 'next_base': 1}
+
+    def _write_manifest(self, manifest: Dict[str, int]):
+        tmp_file = f"{self.manifest_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(manifest, f)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_file, self.manifest_file)
+        self.manifest = manifest
+
+    # =============== Locking ===============
+
+    @contextmanager
+    def locked(self):
+        """Exclusive writer lock (threads in this process and other processes)"""
+        with self._thread_lock:
+            if self._lock_depth == 0:
+                self._lock_handle = open(self.lock_file, 'a+')
+                if fcntl is not None:
+                    fcntl.flock(self._lock_handle.fileno(), fcntl.LOCK_EX)
+                # Another writer may have rotated or compacted meanwhile
+                self.manifest = self.read_manifest()
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    if fcntl is not None:
+                        fcntl.flock(self._lock_handle.fileno(), fcntl.LOCK_UN)
+                    self._lock_handle.close()
+                    self._lock_handle = None
+
+    # =============== Writing ===============
+
+    def append(self, record: Dict[str, Any]) -> int:
+        """Append a record to the active segment (caller must hold ``locked()``)"""
+        payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        data = self.HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+        segment = self.manifest['active']
+        with open(self.segment_file(segment), 'ab') as f:
+            f.write(data)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+        # Our own record is already applied by the caller, skip it on replay
+        if self.position[0] == segment:
+            self.position = (segment, self.position[1] + len(data))
+        self.pending_bytes += len(data)
+        return len(data)
+
+    def rotate(self) -> int:
+        """Seal the active segment and start a new one; returns the sealed segment"""
+        manifest = dict(self.manifest)
+        sealed = manifest['active']
+        manifest['active'] = sealed + 1
+        self._write_manifest(manifest)
+        if self.position[0] == sealed:
+            self.position = (sealed + 1, 0)
+        return sealed
+
+    def reserve_base(self) -> int:
+        """Reserve a generation number for a new base snapshot"""
+        manifest = dict(self.manifest)
+        generation = manifest['next_base']
+        manifest['next_base'] = generation + 1
+        self._write_manifest(manifest)
+        return generation
+
+    def commit_base(self, generation: int, covered: int) -> bool:
+        """
+        Point the manifest at a freshly written base snapshot that contains
+        every record up to and including segment ``covered``.
+        Returns False if a newer snapshot was committed in the meantime.
+        """
+        manifest = dict(self.manifest)
+        if covered <= manifest['covered']:
+            return False
+
+        old_generation = manifest['base']
+        old_covered = manifest['covered']
+        manifest['base'] = generation
+        manifest['covered'] = covered
+        self._write_manifest(manifest)
+
+        # Old base and merged segments are now unreachable
+        for segment in range(old_covered + 1, covered + 1):
+            self._remove(self.segment_file(segment))
+        self.remove_base(old_generation)
+
+        self.pending_bytes = self.live_bytes()
+        return True
+
+    def reset(self):
+        """Drop every segment and the base snapshot (caller must hold ``locked()``)"""
+        manifest = dict(self.manifest)
+        for segment in range(manifest['covered'] + 1, manifest['active'] + 1):
+            self._remove(self.segment_file(segment))
+        self.remove_base(manifest['base'])
+
+        manifest['base'] = 0
+        manifest['covered'] = manifest['active']
+        manifest['active'] += 1
+        self._write_manifest(manifest)
+        self.position = (manifest['active'], 0)
+        self.pending_bytes = 0
+
+    def remove_base(self, generation: int):
+        """Delete the files of a base snapshot generation"""
+        if not generation:
+            return
+        prefix = self.base_prefix(generation)
+        for suffix in self.BASE_SUFFIXES:
+            self._remove(f"{prefix}{suffix}")
+
+    def live_bytes(self) -> int:
+        """Size of the segments that are not folded into the base yet"""
+        total = 0
+        for segment in range(self.manifest['covered'] + 1, self.manifest['active'] + 1):
+            path = self.segment_file(segment)
+            if os.path.exists(path):
+                total += os.path.getsize(path)
+        return total
+
+    def has_manifest(self) -> bool:
+        return os.path.exists(self.manifest_file)
+
+    # =============== Reading ===============
+
+    def read_new(self, repair: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        Yield records appended since the last call, across segment boundaries.
+
+        With ``repair=True`` (only while holding ``locked()``) a torn record at
+        the end of the active segment is truncated so the next append starts
+        on a clean boundary.
+        """
+        if not repair:
+            self.manifest = self.read_manifest()
+
+        segment, offset = self.position
+        if segment <= self.manifest['covered']:
+            # The segment we were reading has been folded into a newer base
+            raise StaleLogPosition(segment)
+
+        while segment <= self.manifest['active']:
+            path = self.segment_file(segment)
+            if os.path.exists(path):
+                for record, offset in self._read_segment(path, offset, repair):
+                    self.position = (segment, offset)
+                    yield record
+
+            if segment == self.manifest['active']:
+                break
+            segment, offset = segment + 1, 0
+            self.position = (segment, offset)
+
+    def _read_segment(self, path: str, offset: int, repair: bool) -> Iterator[Tuple[Dict[str, Any], int]]:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            while True:
+                header = f.read(self.HEADER.size)
+                if len(header) < self.HEADER.size:
+                    break
+
+                length, checksum = self.HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != checksum:
+                    break
+
+                offset += self.HEADER.size + length
+                self.pending_bytes += self.HEADER.size + length
+                yield pickle.loads(payload), offset
+
+        if repair and os.path.getsize(path) > offset:
+            logger.warning(f"Truncating torn record at {path}:{offset}")
+            with open(path, 'r+b') as f:
+                f.truncate(offset)
+
+    # =============== Helpers ===============
+
+    @staticmethod
+    def _remove(path: str):
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,283 @@
+"""
+In-memory numpy vector database, used when FAISS isn't installed
+"""
+
+import threading
+import numpy as np
+from typing import List, Dict, Any, Optional
+import logging
+
+from .attribute_index import FILTERABLE_ATTRIBUTES, normalize_value
+
+logger = logging.getLogger(__name__)
+
+
+class SimpleVectorDB:
+    """
+    Simple in-memory vector database for development/testing.
+
+    Vectors live in a preallocated float32 matrix that grows geometrically
+    and is L2-normalized on insert, so a search is one matrix product plus
+    ``argpartition``. Filterable attributes are kept as int32 code columns,
+    which turns filters into vectorized masks.
+    """
+
+    def __init__(self, dimension: int = 1536, index_path: str = None, initial_capacity: int = 1024):
+        # index_path is accepted for interface parity with FAISSVectorDB; nothing is persisted
+        self.dimension = dimension
+        self.attributes = FILTERABLE_ATTRIBUTES
+        # Bumped by every write, like FAISSVectorDB.version
+        self.version = 0
+        self._lock = threading.RLock()
+        self._reset(initial_capacity)
+
+    def _reset(self, capacity: int):
+        self._capacity = max(1, capacity)
+        self._size = 0
+        self._matrix = np.zeros((self._capacity, self.dimension), dtype='float32')
+        self._alive = np.zeros(self._capacity, dtype=bool)
+        self._codes = {attr: np.full(self._capacity, -1, dtype='int32') for attr in self.attributes}
+        self._code_values = {attr: {} for attr in self.attributes}
+        self.ids = []
+        self.metadatas = []
+        self.id_to_row = {}
+
+    def _grow(self, needed: int):
+        """Double the capacity until ``needed`` rows fit"""
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+        if capacity == self._capacity:
+            return
+
+        matrix = np.zeros((capacity, self.dimension), dtype='float32')
+        matrix[:self._size] = self._matrix[:self._size]
+        self._matrix = matrix
+
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self._size] = self._alive[:self._size]
+        self._alive = alive
+
+        for attr, codes in self._codes.items():
+            grown = np.full(capacity, -1, dtype='int32')
+            grown[:self._size] = codes[:self._size]
+            self._codes[attr] = grown
+        self._capacity = capacity
+
+    def add_embeddings(self, embeddings: List[np.ndarray], metadatas: List[Dict], ids: List[str]):
+        """Add embeddings to the database"""
+
+        if len(embeddings) != len(metadatas) or len(embeddings) != len(ids):
+            raise ValueError("Embeddings, metadatas, and ids must have the same length")
+        if not len(ids):
+            return
+
+        embeddings_array = np.array(embeddings, dtype='float32', ndmin=2)
+        norms = np.linalg.norm(embeddings_array, axis=1, keepdims=True)
+        embeddings_array /= np.where(norms == 0, 1, norms)
+
+        with self._lock:
+            self.version += 1
+            start = self._size
+            self._grow(start + len(ids))
+            self._matrix[start:start + len(ids)] = embeddings_array
+            self._alive[start:start + len(ids)] = True
+
+            for offset, (metadata, vector_id) in enumerate(zip(metadatas, ids)):
+                row = start + offset
+                previous = self.id_to_row.get(vector_id)
+                if previous is not None:
+                    # Re-adding an id replaces the stored vector
+                    self._alive[previous] = False
+                self.id_to_row[vector_id] = row
+                self._encode_attributes(row, metadata)
+
+            self.ids.extend(ids)
+            self.metadatas.extend(metadatas)
+            self._size += len(ids)
+
+    def _encode_attributes(self, row: int, metadata: Dict[str, Any]):
+        """Store a row's filterable attributes as dictionary codes"""
+        for attr in self.attributes:
+            value = metadata.get(attr)
+            if value is not None:
+                values = self._code_values[attr]
+                self._codes[attr][row] = values.setdefault(normalize_value(value), len(values))
+
+    def search(self, query_embedding: np.ndarray, k: int = 10, filters: Optional[Dict] = None) -> List[Dict[str, Any]]:
+        """Search for similar vectors using cosine similarity"""
+        return self.search_batch(np.array([query_embedding]), k=k, filters_per_query=[filters])[0]
+
+    def search_batch(self, query_matrix: np.ndarray, k: int = 10,
+                     filters_per_query: Optional[Any] = None) -> List[List[Dict[str, Any]]]:
+        """Search many queries with one matrix product"""
+
+        query_array = np.array(query_matrix, dtype='float32', ndmin=2)
+        if filters_per_query is None or isinstance(filters_per_query, dict):
+            filters_per_query = [filters_per_query] * len(query_array)
+        if len(filters_per_query) != len(query_array):
+            raise ValueError("filters_per_query must have one entry per query")
+
+        norms = np.linalg.norm(query_array, axis=1, keepdims=True)
+        query_array /= np.where(norms == 0, 1, norms)
+
+        with self._lock:
+            size = self._size
+            if not self._alive[:size].any():
+                return [[] for _ in range(len(query_array))]
+
+            # Queries with the same filters share a mask and one BLAS call
+            groups = {}
+            for row, filters in enumerate(filters_per_query):
+                key = repr(sorted((filters or {}).items()))
+                groups.setdefault(key, []).append(row)
+
+            results = [None] * len(query_array)
+            for rows in groups.values():
+                mask, residual_filters = self._filter_mask(filters_per_query[rows[0]], size)
+                candidates = np.flatnonzero(mask)
+
+                if len(candidates) * 4 < size:
+                    # Selective filters: only score the matching rows
+                    scores = query_array[rows] @ self._matrix[candidates].T
+                else:
+                    scores = (query_array[rows] @ self._matrix[:size].T)[:, candidates]
+
+                for i, row in enumerate(rows):
+                    results[row] = self._top_k(scores[i], candidates, residual_filters, k)
+            return results
+
+    def _filter_mask(self, filters: Optional[Dict], size: int):
+        """Boolean mask of live rows matching the categorical filters, plus the remaining filters"""
+        mask = self._alive[:size].copy()
+        residual = {}
+        for key, value in (filters or {}).items():
+            if value is None:
+                continue
+            if key in self._codes:
+                code = self._code_values[key].get(normalize_value(value))
+                if code is None:
+                    mask[:] = False
+                else:
+                    mask &= self._codes[key][:size] == code
+            else:
+                residual[key] = value
+        return mask, residual
+
+    def _top_k(self, scores: np.ndarray, candidates: np.ndarray, residual_filters: Dict, k: int):
+        """Best k candidate rows, checking non-categorical filters in score order"""
+        if not len(candidates) or k <= 0:
+            return []
+
+        # Over-fetch when some filters can only be checked per row
+        fetch = min(len(candidates), k * 10 if residual_filters else k)
+        while True:
+            if fetch < len(candidates):
+                top = np.argpartition(-scores, fetch - 1)[:fetch]
+            else:
+                top = np.arange(len(candidates))
+            top = top[np.argsort(-scores[top])]
+
+            results = []
+            for position in top:
+                idx = int(candidates[position])
+                if residual_filters and not self._passes_filters(self.metadatas[idx], residual_filters):
+                    continue
+                results.append({
+                    'id': self.ids[idx],
+                    'metadata': self.metadatas[idx],
+                    'similarity_score': float(scores[position]),
+                    'index': idx
+                })
+                if len(results) == k:
+                    return results
+
+            if fetch >= len(candidates):
+                return results
+            fetch = min(len(candidates), fetch * 4)
+
+    def _passes_filters(self, metadata: Dict, filters: Dict) -> bool:
+        """Check if metadata passes all filters"""
+        for key, value in filters.items():
+            if value is None:
+                continue
+
+            metadata_value = metadata.get(key)
+            if metadata_value is None:
+                return False
+
+            if isinstance(value, str) and isinstance(metadata_value, str):
+                if value.lower() != metadata_value.lower():
+                    return False
+            elif value != metadata_value:
+                return False
+
+        return True
+
+    def delete_by_ids(self, ids: List[str]) -> int:
+        """Delete vectors by IDs"""
+        with self._lock:
+            self.version += 1
+            deleted = 0
+            for vector_id in ids:
+                row = self.id_to_row.pop(vector_id, None)
+                if row is not None:
+                    self._alive[row] = False
+                    deleted += 1
+
+            # Reclaim space once most rows are dead
+            if self._size and self._alive[:self._size].sum() < self._size // 2:
+                self._compact()
+            return deleted
+
+    def delete_by_filters(self, filters: Dict[str, Any]) -> int:
+        """Delete every vector matching the filters"""
+        with self._lock:
+            mask, residual_filters = self._filter_mask(filters, self._size)
+            ids = [
+                self.ids[row] for row in np.flatnonzero(mask)
+                if not residual_filters or self._passes_filters(self.metadatas[row], residual_filters)
+            ]
+            return self.delete_by_ids(ids)
+
+    def has_value(self, attribute: str, value: Any) -> bool:
+        """Whether any live vector carries this metadata value"""
+        with self._lock:
+            mask, residual_filters = self._filter_mask({attribute: value}, self._size)
+            return any(
+                not residual_filters or self._passes_filters(self.metadatas[row], residual_filters)
+                for row in np.flatnonzero(mask)
+            )
+
+    def _compact(self):
+        """Rebuild the arrays without deleted rows"""
+        rows = np.flatnonzero(self._alive[:self._size])
+        matrix = self._matrix[rows]
+        ids = [self.ids[row] for row in rows]
+        metadatas = [self.metadatas[row] for row in rows]
+
+        self._reset(max(1024, len(rows)))
+        if len(rows):
+            self._size = len(rows)
+            self._matrix[:len(rows)] = matrix
+            self._alive[:len(rows)] = True
+            self.ids = ids
+            self.metadatas = metadatas
+            self.id_to_row = {vector_id: row for row, vector_id in enumerate(ids)}
+            for row, metadata in enumerate(metadatas):
+                self._encode_attributes(row, metadata)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get database statistics"""
+        return {
+            'total_vectors': int(self._alive[:self._size].sum()),
+            'dimension': self.dimension,
+            'capacity': self._capacity,
+            'type': 'SimpleVectorDB (in-memory)'
+        }
+
+    def clear(self):
+        """Clear all vectors"""
+        with self._lock:
+            self.version += 1
+            self._reset(1024)
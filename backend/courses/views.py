@@ -6,6 +6,7 @@ from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import Q, Count, Avg
 from django.utils import timezone
 import json
+import uuid
 
 from .models import (
     CourseCategory, CourseSource, CourseImportJob, Course, 
@@ -19,6 +20,9 @@ from .serializers import (
     AIKnowledgeGraphSerializer, UserCourseProgressSerializer, CourseProgressUpdateSerializer,
     CourseSearchSerializer, CourseImportSerializer
 )
+from .vector_db.manager import VectorDBManager
+from .vector_db.query_embedding import embed_query
+from users.models import School
 
 # =============== CourseCategory Views ===============
 class CourseCategoryViewSet(viewsets.ModelViewSet):
@@ -273,20 +277,34 @@ class AIKnowledgeChunkViewSet(viewsets.ReadOnlyModelViewSet):
         if not query:
             return Response({'error': 'Query parameter is required'}, status=400)
         
-        # TODO: Implement semantic search using vector database
-        # For now, do keyword search
-        chunks = AIKnowledgeChunk.objects.filter(
-            Q(title__icontains=query) | Q(content__icontains=query)
-        )
-        
+        search_filters = {}
         if subject:
-            chunks = chunks.filter(subject=subject)
-        
+            search_filters['subject'] = subject
         if difficulty:
-            chunks = chunks.filter(difficulty_level=difficulty)
+            search_filters['difficulty_level'] = difficulty
+        
+        # Members of a school with custom content also search its private chunks
+        school = School.with_custom_content_for(request.user.pk)
+        
+        # Hybrid BM25 + vector search, fused with reciprocal rank fusion
+        vector_db = VectorDBManager(school=school)
+        try:
+            results = vector_db.hybrid_search(
+                query, embed_query(query, model=vector_db.embedding_model),
+                filters=search_filters or None, limit=20
+            )
+        finally:
+            vector_db.close()
+        
+        chunk_ids = []
+        for result in results:
+            try:
+                chunk_ids.append(uuid.UUID(result['id']))
+            except ValueError:
+                continue
         
-        # Limit results
-        chunks = chunks[:20]
+        chunks = AIKnowledgeChunk.objects.in_bulk(chunk_ids)
+        chunks = [chunks[chunk_id] for chunk_id in chunk_ids if chunk_id in chunks]
         
         return Response(AIKnowledgeChunkListSerializer(chunks, many=True).data)
 
@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.contrib.postgres.fields import ArrayField
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models import Q
 import uuid
 
 class UpperclassUser(AbstractUser):
@@ -152,6 +153,22 @@ class School(models.Model):
             return True
         from django.utils import timezone
         return timezone.now().date() <= self.subscription_end
+    
+    @classmethod
+    def with_custom_content_for(cls, user_id):
+        """
+        Active school with custom content that the user belongs to as student,
+        teacher or admin. Membership decides which private knowledge a user may
+        search; ``UpperclassUser.school_name`` is free text the user types in.
+        """
+        if not user_id:
+            return None
+        
+        return cls.objects.filter(
+            Q(students__id=user_id) | Q(teachers__id=user_id) | Q(admin_id=user_id),
+            enable_custom_courses=True,
+            is_active=True
+        ).distinct().first()
 
 class UserLearningProfile(models.Model):
     """Detailed learning profile for each user"""